@@ -21,7 +21,8 @@ export const usePendingMappings = (type: "location" | "supplier" | "category") =
               address
             )
           `)
-          .eq('status', 'pending'); // Only show pending mappings, not resolved ones
+          .eq('status', 'pending') // Only show pending mappings, not resolved ones
+          .order('occurrences', { ascending: false }); // Most frequent variants first
         if (error) throw error;
         return data;
       } else if (type === "category") {
@@ -35,7 +36,8 @@ export const usePendingMappings = (type: "location" | "supplier" | "category") =
               category_description
             )
           `)
-          .eq('status', 'pending'); // Only show pending mappings, not resolved ones
+          .eq('status', 'pending') // Only show pending mappings, not resolved ones
+          .order('occurrences', { ascending: false }); // Most frequent variants first
         if (error) throw error;
         return data;
       } else {
@@ -43,7 +45,8 @@ export const usePendingMappings = (type: "location" | "supplier" | "category") =
         const { data, error } = await supabase
           .from(table)
           .select('*')
-          .eq('status', 'pending'); // Only show pending mappings, not resolved ones
+          .eq('status', 'pending') // Only show pending mappings, not resolved ones
+          .order('occurrences', { ascending: false }); // Most frequent variants first
         if (error) throw error;
         return data;
       }
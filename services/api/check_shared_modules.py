@@ -0,0 +1,41 @@
+#!/usr/bin/env python3
+"""
+Check that the modules shared by the two ingestion services are still identical.
+
+Each service deploys its own folder, so http_transport.py, rate_limiter.py, pdf_spool.py
+and telemetry.py are copied into both nanonets-ingestion/ and nanonets-ingestion-production/.
+Prints a diff for every pair that drifted and exits with status 1.
+
+  python check_shared_modules.py
+"""
+
+import difflib
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent
+SERVICES = ("nanonets-ingestion", "nanonets-ingestion-production")
+SHARED_MODULES = ("http_transport.py", "rate_limiter.py", "pdf_spool.py", "telemetry.py")
+
+
+def main():
+    left, right = (ROOT / service for service in SERVICES)
+    drifted = 0
+    for name in SHARED_MODULES:
+        a = (left / name).read_text().splitlines(keepends=True)
+        b = (right / name).read_text().splitlines(keepends=True)
+        if a == b:
+            continue
+        drifted += 1
+        print(f"❌ {name} differs between {SERVICES[0]}/ and {SERVICES[1]}/:")
+        sys.stdout.writelines(difflib.unified_diff(a, b, f"{SERVICES[0]}/{name}", f"{SERVICES[1]}/{name}"))
+        print()
+
+    if drifted:
+        print(f"❌ {drifted} of {len(SHARED_MODULES)} shared modules drifted: copy the change to both folders")
+        sys.exit(1)
+    print(f"✅ {len(SHARED_MODULES)} shared modules identical in {SERVICES[0]}/ and {SERVICES[1]}/")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,271 @@
+#!/usr/bin/env python3
+"""
+Backfill invoice_lines categories from approved product_category_mappings.
+
+Walks the organization's uncategorized invoice_lines in keyset-paginated chunks
+(ordered by id), matches each chunk against the selected mappings with the same
+priority rules as mappings/category_resolver.py and commits per chunk, so ETL
+inserts are never blocked for long. Progress is checkpointed to a state file
+and an interrupted run resumes from the last committed id.
+
+  python backfill_categories.py --organization-id <ORG_ID> --since 2025-06-01
+  python backfill_categories.py --organization-id <ORG_ID> --mapping-id <ID> --mapping-id <ID>
+  python backfill_categories.py --organization-id <ORG_ID> --all --max-rows-per-sec 5000
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import time
+from pathlib import Path
+
+import psycopg2
+from psycopg2.extras import execute_values
+from dotenv import load_dotenv
+
+DEFAULT_CHUNK_SIZE = 2000
+STATE_DIR = Path(__file__).resolve().parent / ".cache"
+
+# Same order as resolve_product_category:
+#   1 exact name + code + supplier, 2 code + supplier, 3 code only (mapping without supplier),
+#   4 name + code (mapping without supplier), 5 case-insensitive trimmed name
+# (the resolver's trigram nearest-name step 6 is not backfilled: only exact rules are applied retroactively)
+PRIORITY_SQL = """
+    CASE
+        WHEN c.description = m.variant_product_name
+         AND c.product_code IS NOT DISTINCT FROM m.variant_product_code
+         AND c.variant_supplier_name IS NOT DISTINCT FROM m.variant_supplier_name THEN 1
+        WHEN m.variant_product_code IS NOT NULL AND m.variant_supplier_name IS NOT NULL
+         AND c.product_code = m.variant_product_code
+         AND c.variant_supplier_name = m.variant_supplier_name THEN 2
+        WHEN m.variant_product_code IS NOT NULL AND m.variant_supplier_name IS NULL
+         AND c.product_code = m.variant_product_code THEN 3
+        WHEN m.variant_product_code IS NOT NULL AND m.variant_supplier_name IS NULL
+         AND c.description = m.variant_product_name
+         AND c.product_code = m.variant_product_code THEN 4
+        WHEN lower(trim(c.description)) = m.name_key THEN 5
+    END
+"""
+
+
+def load_mappings(cur, org_id, mapping_ids=None, since=None):
+    """Active mappings of the org, optionally restricted to ids or to those created since a timestamp."""
+    query = """
+        SELECT mapping_id, category_id, variant_product_name, variant_product_code, variant_supplier_name
+        FROM product_category_mappings
+        WHERE organization_id = %s AND is_active = TRUE
+    """
+    params = [org_id]
+    if mapping_ids:
+        query += " AND mapping_id = ANY(%s::uuid[])"
+        params.append(list(mapping_ids))
+    if since:
+        query += " AND created_at >= %s"
+        params.append(since)
+    cur.execute(query + " ORDER BY mapping_id", params)
+    return cur.fetchall()
+
+
+def _state_path(org_id, mappings):
+    """One state file per (org, mapping selection) so a different selection starts over."""
+    selection = hashlib.sha1(",".join(str(m[0]) for m in mappings).encode()).hexdigest()[:12]
+    return STATE_DIR / f"category_backfill_{org_id}_{selection}.json"
+
+
+def _load_state(path):
+    if path.exists():
+        try:
+            return json.loads(path.read_text())
+        except Exception as e:
+            print(f"⚠️ Failed to load backfill state, starting over: {e}")
+    return {}
+
+
+def _save_state(path, state):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_suffix(".tmp")
+    tmp.write_text(json.dumps(state, indent=2))
+    os.replace(tmp, path)
+
+
+def backfill_categories(conn, org_id, mappings, chunk_size=DEFAULT_CHUNK_SIZE, max_rows_per_sec=None,
+                        pause=0.0, resume=True, dry_run=False):
+    """
+    Apply mappings to the org's uncategorized invoice_lines chunk by chunk.
+    Returns a summary dict with scanned/updated counts and rows/sec.
+    """
+    if not mappings:
+        print("ℹ️ No mappings selected — nothing to backfill.")
+        return {"chunks": 0, "scanned": 0, "updated": 0, "rows_per_sec": 0.0}
+
+    state_path = _state_path(org_id, mappings)
+    state = _load_state(state_path) if resume else {}
+    last_id = state.get("last_id")
+    if last_id:
+        print(f"↩️ Resuming after invoice_lines.id={last_id} ({state.get('updated', 0)} rows updated so far)")
+
+    cur = conn.cursor()
+    cur.execute("""
+        CREATE TEMP TABLE IF NOT EXISTS backfill_mappings (
+            mapping_id uuid,
+            category_id uuid,
+            variant_product_name text,
+            variant_product_code text,
+            variant_supplier_name text,
+            name_key text
+        ) ON COMMIT PRESERVE ROWS
+    """)
+    cur.execute("TRUNCATE backfill_mappings")
+    execute_values(cur, """
+        INSERT INTO backfill_mappings
+            (mapping_id, category_id, variant_product_name, variant_product_code, variant_supplier_name, name_key)
+        VALUES %s
+    """, [(*m, (m[2] or "").strip().lower()) for m in mappings])
+    cur.execute("CREATE INDEX IF NOT EXISTS backfill_mappings_code ON backfill_mappings (variant_product_code)")
+    cur.execute("CREATE INDEX IF NOT EXISTS backfill_mappings_name_key ON backfill_mappings (name_key)")
+    cur.execute("ANALYZE backfill_mappings")
+    conn.commit()
+
+    print(f"🚀 Backfilling {len(mappings)} mapping(s) for org {org_id} in chunks of {chunk_size}{' (dry run)' if dry_run else ''}")
+
+    totals = {"chunks": 0, "scanned": state.get("scanned", 0), "updated": state.get("updated", 0)}
+    started = time.perf_counter()
+    run_scanned = run_updated = 0
+
+    while True:
+        chunk_started = time.perf_counter()
+        cur.execute(f"""
+            WITH chunk AS (
+                SELECT id, description, product_code, variant_supplier_name
+                FROM invoice_lines
+                WHERE organization_id = %s
+                  AND category_id IS NULL
+                  AND (%s::uuid IS NULL OR id > %s::uuid)
+                ORDER BY id
+                LIMIT %s
+            ),
+            candidates AS (
+                SELECT c.id, m.mapping_id, m.category_id, {PRIORITY_SQL} AS priority
+                FROM chunk c
+                JOIN backfill_mappings m
+                  ON m.variant_product_code = c.product_code
+                  OR m.name_key = lower(trim(c.description))
+            ),
+            matched AS (
+                SELECT DISTINCT ON (id) id, mapping_id, category_id
+                FROM candidates
+                WHERE priority IS NOT NULL
+                ORDER BY id, priority, mapping_id
+            ),
+            updated AS (
+                UPDATE invoice_lines il
+                SET category_id = matched.category_id,
+                    category_mapping_id = matched.mapping_id,
+                    category_pending = false,
+                    updated_at = now()
+                FROM matched
+                WHERE il.id = matched.id
+                  AND il.category_id IS NULL
+                  AND NOT %s
+                RETURNING il.id
+            )
+            SELECT (SELECT max(id::text) FROM chunk),
+                   (SELECT count(*) FROM chunk),
+                   (SELECT count(*) FROM matched),
+                   (SELECT count(*) FROM updated)
+        """, (org_id, last_id, last_id, chunk_size, dry_run))
+        chunk_last_id, scanned, matched, updated = cur.fetchone()
+
+        if dry_run:
+            conn.rollback()
+            updated = matched
+        else:
+            conn.commit()
+
+        if not scanned:
+            break
+
+        last_id = chunk_last_id
+        totals["chunks"] += 1
+        totals["scanned"] += scanned
+        totals["updated"] += updated
+        run_scanned += scanned
+        run_updated += updated
+
+        if not dry_run:
+            _save_state(state_path, {"last_id": last_id, "scanned": totals["scanned"], "updated": totals["updated"]})
+
+        elapsed = time.perf_counter() - started
+        print(f"   📦 Chunk {totals['chunks']}: scanned {scanned}, updated {updated} "
+              f"({run_scanned / elapsed if elapsed else 0:.0f} rows/sec scanned, {run_updated / elapsed if elapsed else 0:.0f} rows/sec updated)")
+
+        if scanned < chunk_size:
+            break
+
+        # Throttle: keep scanned rows/sec under the cap and leave room for ETL inserts
+        wait = pause
+        if max_rows_per_sec:
+            wait = max(wait, scanned / max_rows_per_sec - (time.perf_counter() - chunk_started))
+        if wait > 0:
+            time.sleep(wait)
+
+    elapsed = time.perf_counter() - started
+    totals["rows_per_sec"] = run_scanned / elapsed if elapsed else 0.0
+    totals["seconds"] = elapsed
+
+    if not dry_run and state_path.exists():
+        state_path.unlink()  # completed — next run with the same selection starts fresh
+
+    cur.execute("DROP TABLE IF EXISTS backfill_mappings")
+    conn.commit()
+    cur.close()
+
+    print(f"✅ Backfill done: {totals['updated']} invoice_lines categorized out of {totals['scanned']} scanned "
+          f"in {elapsed:.1f}s ({totals['rows_per_sec']:.0f} rows/sec)")
+    return totals
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--organization-id", type=str, required=True)
+    selection = parser.add_mutually_exclusive_group(required=True)
+    selection.add_argument("--mapping-id", action="append", help="mapping_id to apply (repeatable)")
+    selection.add_argument("--since", type=str, help="apply mappings created at or after this timestamp")
+    selection.add_argument("--all", action="store_true", help="apply every active mapping of the org")
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE)
+    parser.add_argument("--max-rows-per-sec", type=float, default=None, help="cap on scanned rows per second")
+    parser.add_argument("--pause", type=float, default=0.05, help="seconds to sleep between chunks")
+    parser.add_argument("--no-resume", action="store_true", help="ignore saved progress and start from the first line")
+    parser.add_argument("--dry-run", action="store_true", help="count matches without updating")
+    args = parser.parse_args()
+
+    load_dotenv()
+    conn = psycopg2.connect(
+        dbname=os.getenv("DB_NAME"),
+        user=os.getenv("DB_USER"),
+        password=os.getenv("DB_PASSWORD"),
+        host=os.getenv("DB_HOST"),
+        port=os.getenv("DB_PORT"),
+    )
+    try:
+        cur = conn.cursor()
+        mappings = load_mappings(cur, args.organization_id, args.mapping_id, args.since)
+        cur.close()
+        conn.commit()
+        backfill_categories(
+            conn,
+            args.organization_id,
+            mappings,
+            chunk_size=args.chunk_size,
+            max_rows_per_sec=args.max_rows_per_sec,
+            pause=args.pause,
+            resume=not args.no_resume,
+            dry_run=args.dry_run,
+        )
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,150 @@
+#!/usr/bin/env python3
+"""
+Compare supplier matching with the blocking index against the exhaustive scan.
+Reports recall (index finds the same supplier, or one with the same score, as the full scan)
+and speedup. Synthetic runs also report accuracy of both against the true supplier.
+
+  python benchmark_supplier_matching.py --organization-id <ORG_ID>   # suppliers + supplier_mappings variants from the DB
+  python benchmark_supplier_matching.py --synthetic 5000             # generated suppliers, no DB needed
+"""
+
+import argparse
+import os
+import random
+import string
+import time
+
+from mappings.supplier_matcher import SupplierIndex, clean_text, score_supplier, fetch_all_suppliers, fetch_supplier_tax_ids
+from normalizers.address_normalizer import normalize_address
+
+WORDS = [
+    "nordic", "frugt", "grønt", "kød", "fisk", "vin", "velsmag", "bageri", "mejeri", "engros", "catering",
+    "storkøkken", "handel", "import", "kaffe", "brød", "ost", "slagter", "food", "service", "gourmet",
+    "hav", "skov", "mark", "kyst", "dansk", "norsk", "fjord", "urter", "krydderi", "øl", "bryggeri",
+]
+LEGAL_FORMS = ["ApS", "A/S", "AS", "I/S", "AB", ""]
+STREETS = ["Vesterbrogade", "Nørregade", "Skolegade", "Industrivej", "Havnegade", "Flæsketorvet", "Kalbakkvei"]
+CITIES = ["1620 København V", "8000 Aarhus C", "5000 Odense C", "1081 Oslo", "4930 Maribo"]
+
+
+def exhaustive_match(suppliers, variant_name, variant_address, threshold):
+    variant_name = clean_text(variant_name or "")
+    variant_address = clean_text(normalize_address(variant_address or "") or "")
+    best_match, best_score = None, 0
+    for supplier_id, std_name, std_address in suppliers:
+        total = score_supplier(variant_name, variant_address, std_name, std_address)
+        if total > best_score:
+            best_score, best_match = total, supplier_id
+    return (best_match, best_score) if best_score >= threshold else (None, best_score)
+
+
+def add_ocr_noise(text, rng):
+    chars = list(text)
+    for _ in range(rng.randint(0, 2)):
+        if len(chars) < 4:
+            break
+        pos = rng.randrange(len(chars))
+        op = rng.choice(["drop", "swap", "replace"])
+        if op == "drop":
+            del chars[pos]
+        elif op == "swap" and pos < len(chars) - 1:
+            chars[pos], chars[pos + 1] = chars[pos + 1], chars[pos]
+        else:
+            chars[pos] = rng.choice(string.ascii_lowercase)
+    noisy = "".join(chars)
+    return noisy.upper() if rng.random() < 0.2 else noisy
+
+
+def synthetic_dataset(size, queries, seed=42):
+    rng = random.Random(seed)
+    suppliers, seen = [], set()
+    while len(suppliers) < size:
+        name = " ".join(w.capitalize() for w in rng.sample(WORDS, rng.randint(2, 3)))
+        name = f"{name} {rng.choice(LEGAL_FORMS)}".strip()
+        if name in seen:
+            continue
+        seen.add(name)
+        address = f"{rng.choice(STREETS)} {rng.randint(1, 200)}, {rng.choice(CITIES)}"
+        suppliers.append((f"sup-{len(suppliers)}", name, address))
+
+    variants = []
+    for _ in range(queries):
+        supplier_id, name, address = rng.choice(suppliers)
+        variants.append((add_ocr_noise(name, rng), address if rng.random() < 0.7 else "", supplier_id))
+    return suppliers, [], variants
+
+
+def db_dataset(organization_id):
+    import psycopg2
+    from dotenv import load_dotenv
+
+    load_dotenv()
+    conn = psycopg2.connect(
+        dbname=os.getenv("DB_NAME"),
+        user=os.getenv("DB_USER"),
+        password=os.getenv("DB_PASSWORD"),
+        host=os.getenv("DB_HOST"),
+        port=os.getenv("DB_PORT"),
+    )
+    cur = conn.cursor()
+    suppliers = fetch_all_suppliers(cur, organization_id)
+    tax_ids = fetch_supplier_tax_ids(cur, organization_id)
+    cur.execute("""
+        SELECT variant_name, variant_address FROM supplier_mappings WHERE organization_id = %s
+        UNION
+        SELECT variant_supplier_name, variant_address FROM pending_supplier_mappings WHERE organization_id = %s
+    """, (organization_id, organization_id))
+    variants = [(name, address, None) for name, address in cur.fetchall()]
+    cur.close()
+    conn.close()
+    return suppliers, tax_ids, variants
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--organization-id", type=str)
+    source.add_argument("--synthetic", type=int, metavar="N_SUPPLIERS")
+    parser.add_argument("--queries", type=int, default=1000, help="number of synthetic variants to match")
+    parser.add_argument("--threshold", type=float, default=85)
+    args = parser.parse_args()
+
+    if args.synthetic:
+        suppliers, tax_ids, variants = synthetic_dataset(args.synthetic, args.queries)
+    else:
+        suppliers, tax_ids, variants = db_dataset(args.organization_id)
+
+    print(f"📊 {len(suppliers)} suppliers, {len(variants)} variants, threshold {args.threshold}")
+
+    index = SupplierIndex(suppliers, tax_ids)
+    cleaned = index.suppliers
+
+    start = time.perf_counter()
+    baseline = [exhaustive_match(cleaned, name, address, args.threshold) for name, address, _ in variants]
+    exhaustive_s = time.perf_counter() - start
+
+    start = time.perf_counter()
+    indexed = [index.match(name, address, threshold=args.threshold) for name, address, _ in variants]
+    indexed_s = time.perf_counter() - start
+
+    expected = [b[0] for b in baseline if b[0]]
+    # Ties: several suppliers can share the best score, either one is as good as the full scan's pick
+    found = sum(1 for b, i in zip(baseline, indexed) if b[0] and (i[0] == b[0] or abs(i[1] - b[1]) < 1e-9))
+    extra = sum(1 for b, i in zip(baseline, indexed) if not b[0] and i[0])
+    recall = 100.0 * found / len(expected) if expected else 100.0
+    scans = len(variants) * len(suppliers)
+
+    print(f"   Exhaustive: {exhaustive_s:.3f}s ({1000 * exhaustive_s / max(len(variants), 1):.2f} ms/variant, {scans} comparisons)")
+    print(f"   Indexed:    {indexed_s:.3f}s ({1000 * indexed_s / max(len(variants), 1):.2f} ms/variant, {index.stats['scored']} comparisons)")
+    print(f"   Speedup:    {exhaustive_s / indexed_s if indexed_s else float('inf'):.1f}x")
+    print(f"   Recall:     {recall:.2f}% ({found}/{len(expected)} exhaustive matches reproduced, {extra} new matches)")
+    truth = [v[2] for v in variants]
+    if any(truth):
+        exhaustive_ok = sum(1 for b, t in zip(baseline, truth) if b[0] == t)
+        indexed_ok = sum(1 for i, t in zip(indexed, truth) if i[0] == t)
+        print(f"   Accuracy:   exhaustive {100.0 * exhaustive_ok / len(truth):.2f}%, indexed {100.0 * indexed_ok / len(truth):.2f}% (vs true supplier)")
+    print(f"   Index:      {index.stats}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,331 @@
+#!/usr/bin/env python3
+"""
+Export invoice_lines (with supplier, location and category names) to Parquet.
+
+Files are partitioned by organization and invoice month, zstd-compressed:
+
+  <out>/organization_id=<org>/month=2025-06/part-0.parquet
+  <out>/organization_id=<org>/month=unknown/part-0.parquet      (no invoice_date)
+
+The export is incremental: _manifest.json keeps an (updated_at, id) watermark per
+organization, and a run only rewrites the months that have lines changed after it.
+updated_at is stamped when the writing transaction starts, so a line committed just
+after the previous run can carry an older updated_at than its watermark; every run
+therefore re-scans --watermark-lag-minutes (default 60) before the watermark.
+Each partition is written to a temp file and renamed into place, so readers never
+see a half-written file. Deleted lines, or lines whose invoice_date moved to another
+month, are only dropped from the old partition by a --full rebuild.
+
+  python export_invoice_lines_parquet.py --out exports/invoice_lines
+  python export_invoice_lines_parquet.py --out exports/invoice_lines --organization-id <ORG_ID> --full
+
+numeric columns are exported as decimal128 with their declared precision/scale;
+unconstrained numeric uses decimal128(38, 9), rounding beyond 9 decimals.
+
+Requires pyarrow (pip install pyarrow).
+"""
+
+import argparse
+import json
+import os
+import shutil
+import sys
+import time
+from datetime import date, datetime, timedelta, timezone
+from decimal import ROUND_HALF_EVEN, Context, Decimal
+from pathlib import Path
+
+import psycopg2
+from dotenv import load_dotenv
+
+DEFAULT_BATCH_SIZE = 50000
+DEFAULT_WATERMARK_LAG_MINUTES = 60
+MANIFEST_NAME = "_manifest.json"
+
+# psycopg2 type OIDs -> Arrow types; anything else (uuid, text, varchar, jsonb, ...) is exported as string
+BOOL_OID = 16
+INT_OIDS = {20, 21, 23}
+FLOAT_OIDS = {700, 701}
+NUMERIC_OID = 1700
+# Arrow's decimal128 holds at most 38 digits; used for unconstrained (or wider) numeric
+MAX_DECIMAL_PRECISION = 38
+DEFAULT_NUMERIC_SCALE = 9
+DATE_OID = 1082
+TIMESTAMP_OID = 1114
+TIMESTAMPTZ_OID = 1184
+JSON_OIDS = {114, 3802}
+
+EXPORT_QUERY = """
+    SELECT il.*,
+           s.name AS supplier_name,
+           l.name AS location_name,
+           pc.category_name AS category_name
+    FROM invoice_lines il
+    LEFT JOIN suppliers s ON s.supplier_id = il.supplier_id
+    LEFT JOIN locations l ON l.location_id = il.location_id
+    LEFT JOIN product_categories pc ON pc.category_id = il.category_id
+    WHERE il.organization_id = %s
+"""
+
+
+def _require_pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.parquet
+    except ImportError:
+        print("❌ pyarrow is not installed: pip install pyarrow")
+        sys.exit(1)
+    return pyarrow, pyarrow.parquet
+
+
+def load_manifest(out_dir):
+    path = out_dir / MANIFEST_NAME
+    if path.exists():
+        return json.loads(path.read_text())
+    return {"organizations": {}, "partitions": {}}
+
+
+def save_manifest(out_dir, manifest):
+    path = out_dir / MANIFEST_NAME
+    tmp = path.with_suffix(".tmp")
+    tmp.write_text(json.dumps(manifest, indent=2, default=str))
+    os.replace(tmp, path)
+
+
+def numeric_precision_scale(column):
+    """decimal128 (precision, scale) for a numeric column: the declared one when it fits, else (38, 9)."""
+    if column.precision and column.precision <= MAX_DECIMAL_PRECISION and column.scale is not None:
+        return column.precision, column.scale
+    return MAX_DECIMAL_PRECISION, DEFAULT_NUMERIC_SCALE
+
+
+def _decimal_converter(scale):
+    quantum = Decimal(1).scaleb(-scale)
+    context = Context(prec=MAX_DECIMAL_PRECISION, rounding=ROUND_HALF_EVEN)
+
+    def convert(v):
+        # NaN / Infinity have no decimal128 representation
+        if v is None or not v.is_finite():
+            return None
+        return v.quantize(quantum, context=context)
+    return convert
+
+
+def arrow_schema(pa, description):
+    fields = []
+    for column in description:
+        if column.type_code == BOOL_OID:
+            arrow_type = pa.bool_()
+        elif column.type_code in INT_OIDS:
+            arrow_type = pa.int64()
+        elif column.type_code in FLOAT_OIDS:
+            arrow_type = pa.float64()
+        elif column.type_code == NUMERIC_OID:
+            arrow_type = pa.decimal128(*numeric_precision_scale(column))
+        elif column.type_code == DATE_OID:
+            arrow_type = pa.date32()
+        elif column.type_code == TIMESTAMP_OID:
+            arrow_type = pa.timestamp("us")
+        elif column.type_code == TIMESTAMPTZ_OID:
+            arrow_type = pa.timestamp("us", tz="UTC")
+        else:
+            arrow_type = pa.string()
+        fields.append(pa.field(column.name, arrow_type))
+    return pa.schema(fields)
+
+
+def _converters(description):
+    """Per-column conversion of psycopg2 values to what the Arrow type accepts."""
+    converters = []
+    for column in description:
+        if column.type_code in FLOAT_OIDS:
+            converters.append(lambda v: None if v is None else float(v))
+        elif column.type_code == NUMERIC_OID:
+            converters.append(_decimal_converter(numeric_precision_scale(column)[1]))
+        elif column.type_code in JSON_OIDS:
+            converters.append(lambda v: None if v is None else json.dumps(v, default=str))
+        elif column.type_code in INT_OIDS | {BOOL_OID, DATE_OID, TIMESTAMP_OID, TIMESTAMPTZ_OID}:
+            converters.append(None)
+        else:
+            converters.append(lambda v: None if v is None else str(v))
+    return converters
+
+
+def changed_months(cur, org_id, watermark, lag=timedelta(minutes=DEFAULT_WATERMARK_LAG_MINUTES)):
+    """
+    First day of every invoice month (None = no invoice_date) with lines changed after
+    the watermark minus lag. Months re-scanned because of the lag are just rewritten again.
+    """
+    if watermark:
+        cur.execute("""
+            SELECT DISTINCT date_trunc('month', invoice_date)::date
+            FROM invoice_lines
+            WHERE organization_id = %s
+              AND updated_at > %s::timestamptz - %s
+        """, (org_id, watermark["updated_at"], lag))
+    else:
+        cur.execute("""
+            SELECT DISTINCT date_trunc('month', invoice_date)::date
+            FROM invoice_lines
+            WHERE organization_id = %s
+        """, (org_id,))
+    return [row[0] for row in cur.fetchall()]
+
+
+def current_watermark(cur, org_id):
+    cur.execute("""
+        SELECT updated_at, id
+        FROM invoice_lines
+        WHERE organization_id = %s AND updated_at IS NOT NULL
+        ORDER BY updated_at DESC, id DESC
+        LIMIT 1
+    """, (org_id,))
+    row = cur.fetchone()
+    return {"updated_at": row[0].isoformat(), "id": str(row[1])} if row else None
+
+
+def partition_key(org_id, month):
+    return f"organization_id={org_id}/month={month.strftime('%Y-%m') if month else 'unknown'}"
+
+
+def write_partition(conn, pa, pq, out_dir, org_id, month, batch_size):
+    """Stream one org/month of invoice_lines into a Parquet file. Returns the row count."""
+    query = EXPORT_QUERY
+    params = [org_id]
+    if month:
+        next_month = date(month.year + month.month // 12, month.month % 12 + 1, 1)
+        query += " AND il.invoice_date >= %s AND il.invoice_date < %s"
+        params += [month, next_month]
+    else:
+        query += " AND il.invoice_date IS NULL"
+    query += " ORDER BY il.invoice_date, il.id"
+
+    target_dir = out_dir / partition_key(org_id, month)
+    target = target_dir / "part-0.parquet"
+    target_dir.mkdir(parents=True, exist_ok=True)
+    tmp = target_dir / f".part-0.parquet.{os.getpid()}.tmp"
+
+    rows = 0
+    writer = None
+    with conn.cursor(name="invoice_lines_export") as cur:
+        cur.itersize = batch_size
+        cur.execute(query, params)
+        try:
+            while True:
+                records = cur.fetchmany(batch_size)
+                if writer is None:
+                    schema = arrow_schema(pa, cur.description)
+                    converters = _converters(cur.description)
+                    writer = pq.ParquetWriter(tmp, schema, compression="zstd")
+                if not records:
+                    break
+                columns = list(zip(*records))
+                arrays = [
+                    pa.array([convert(v) for v in values] if convert else list(values), type=field.type)
+                    for values, convert, field in zip(columns, converters, schema)
+                ]
+                writer.write_batch(pa.RecordBatch.from_arrays(arrays, schema=schema))
+                rows += len(records)
+        finally:
+            if writer is not None:
+                writer.close()
+
+    if rows:
+        os.replace(tmp, target)
+    else:
+        # Month has no lines anymore
+        tmp.unlink(missing_ok=True)
+        shutil.rmtree(target_dir, ignore_errors=True)
+    return rows
+
+
+def export_organization(conn, pa, pq, out_dir, manifest, org_id, full=False, batch_size=DEFAULT_BATCH_SIZE,
+                        lag=timedelta(minutes=DEFAULT_WATERMARK_LAG_MINUTES)):
+    cur = conn.cursor()
+    watermark = None if full else manifest["organizations"].get(org_id)
+    new_watermark = current_watermark(cur, org_id)
+    months = changed_months(cur, org_id, watermark, lag)
+    cur.close()
+
+    if full:
+        org_dir = out_dir / f"organization_id={org_id}"
+        for key in [k for k in manifest["partitions"] if k.startswith(f"organization_id={org_id}/")]:
+            del manifest["partitions"][key]
+        if org_dir.exists():
+            shutil.rmtree(org_dir)
+
+    if not months:
+        print(f"   ✅ {org_id}: up to date")
+        return 0, 0
+
+    total_rows = 0
+    for month in sorted(months, key=lambda m: m or date.min):
+        started = time.perf_counter()
+        rows = write_partition(conn, pa, pq, out_dir, org_id, month, batch_size)
+        key = partition_key(org_id, month)
+        if rows:
+            manifest["partitions"][key] = {"rows": rows, "written_at": datetime.now(timezone.utc).isoformat()}
+        else:
+            manifest["partitions"].pop(key, None)
+        total_rows += rows
+        print(f"   📦 {key}: {rows} rows in {time.perf_counter() - started:.1f}s")
+
+    if new_watermark:
+        manifest["organizations"][org_id] = new_watermark
+    return len(months), total_rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--out", default="exports/invoice_lines", help="output directory")
+    parser.add_argument("--organization-id", action="append", help="organization to export (repeatable, default all)")
+    parser.add_argument("--full", action="store_true", help="ignore the watermark and rewrite every partition")
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE)
+    parser.add_argument("--watermark-lag-minutes", type=int, default=DEFAULT_WATERMARK_LAG_MINUTES,
+                        help="re-scan lines updated this long before the watermark (late commits)")
+    args = parser.parse_args()
+
+    pa, pq = _require_pyarrow()
+    out_dir = Path(args.out)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    manifest = load_manifest(out_dir)
+
+    load_dotenv()
+    conn = psycopg2.connect(
+        dbname=os.getenv("DB_NAME"),
+        user=os.getenv("DB_USER"),
+        password=os.getenv("DB_PASSWORD"),
+        host=os.getenv("DB_HOST"),
+        port=os.getenv("DB_PORT"),
+    )
+    # One snapshot per run: watermark and partition contents see the same data
+    conn.set_session(isolation_level="REPEATABLE READ", readonly=True)
+
+    started = time.perf_counter()
+    try:
+        org_ids = args.organization_id
+        if not org_ids:
+            cur = conn.cursor()
+            cur.execute("SELECT id FROM organizations ORDER BY id")
+            org_ids = [str(row[0]) for row in cur.fetchall()]
+            cur.close()
+
+        partitions = rows = 0
+        for org_id in org_ids:
+            org_partitions, org_rows = export_organization(
+                conn, pa, pq, out_dir, manifest, org_id, full=args.full, batch_size=args.batch_size,
+                lag=timedelta(minutes=args.watermark_lag_minutes),
+            )
+            partitions += org_partitions
+            rows += org_rows
+        conn.commit()
+    finally:
+        conn.close()
+
+    manifest["exported_at"] = datetime.now(timezone.utc).isoformat()
+    save_manifest(out_dir, manifest)
+    print(f"✅ Export done: {partitions} partitions rewritten, {rows} rows in {time.perf_counter() - started:.1f}s → {out_dir}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,90 +1,298 @@
 # transform_pipeline/load_csv_to_extracted.py
+"""
+Stream a supplier CSV export into extracted_data.
 
+The file is read record by record and loaded with COPY in chunks, one transaction
+per chunk. Delimiter, encoding and the external id column come from the data
+source's config (data_sources.config: "delimiter", "encoding", "external_id_column");
+command line flags override them. Every row gets the run's import batch id in its
+metadata, together with its row number and byte offset in the file.
+
+An interrupted import resumes from the byte offset after the last committed chunk:
+
+  python load_csv_to_extracted.py --organization-id <ORG_ID> --data-source-id <DS_ID> --file "files/export.csv"
+  python load_csv_to_extracted.py --organization-id <ORG_ID> --data-source-id <DS_ID> --file "files/export.csv" --resume
+
+Byte offsets need an ASCII-compatible encoding (utf-8, latin-1, cp1252, ...), not utf-16.
+"""
+
+import argparse
 import csv
+import hashlib
+import io
 import json
-import uuid
-import psycopg2
 import os
+import sys
+import time
+import uuid
+from datetime import datetime, timezone
+from pathlib import Path
+
 import chardet
-from datetime import datetime
+import psycopg2
 from dotenv import load_dotenv
 
-# Limit for how many rows to import
-IMPORT_LIMIT = 50  # or 1000
+DEFAULT_CHUNK_SIZE = 5000
+DEFAULT_EXTERNAL_ID_COLUMN = "Invoice Number"
+ENCODING_SAMPLE_BYTES = 1024 * 1024
+STATE_DIR = Path(__file__).resolve().parent / ".cache"
+
+csv.field_size_limit(sys.maxsize)
+
 
-load_dotenv()
+class OffsetLineReader:
+    """
+    Iterates decoded lines of a binary file and tracks the byte offset after the
+    last line handed out. csv.reader pulls lines only until a record is complete,
+    so after each record `offset` points at the start of the next one.
+    """
 
-# Connect to database
-conn = psycopg2.connect(
-    dbname=os.getenv("DB_NAME"),
-    user=os.getenv("DB_USER"),
-    password=os.getenv("DB_PASSWORD"),
-    host=os.getenv("DB_HOST"),
-    port=os.getenv("DB_PORT"),
-)
-cur = conn.cursor()
+    def __init__(self, raw_file, encoding, offset=0):
+        self.raw_file = raw_file
+        self.encoding = encoding
+        self.offset = offset
+        raw_file.seek(offset)
 
-# Constants
-DATA_SOURCE_ID = 'd310cc94-8ce2-4ca3-88a2-191f832b94b0'
-ORG_ID = '5c38a370-7d13-4656-97f8-0b71f4000703'
+    def __iter__(self):
+        return self
 
-# Use file from files/ subdirectory
-FILENAME = os.path.join(os.path.dirname(__file__), "files", "csv test.csv")
+    def __next__(self):
+        line = self.raw_file.readline()
+        if not line:
+            raise StopIteration
+        self.offset += len(line)
+        return line.decode(self.encoding, errors="replace")
 
-# Get business_unit_id and config from the data source
-cur.execute("SELECT business_unit_id, config FROM data_sources WHERE id = %s", (DATA_SOURCE_ID,))
-row = cur.fetchone()
-BUSINESS_UNIT_ID = row[0] if row and row[0] else None
-CONFIG = row[1] or {}
 
-DELIMITER = CONFIG.get("delimiter", ";")
-print(f"ℹ️ Using business_unit_id: {BUSINESS_UNIT_ID or 'NULL (multi-BU import)'}")
-print(f"ℹ️ Using delimiter: '{DELIMITER}'")
+def detect_encoding(path):
+    """Fallback when the data source has no encoding configured."""
+    with open(path, "rb") as raw_file:
+        detected = chardet.detect(raw_file.read(ENCODING_SAMPLE_BYTES))
+    encoding = detected["encoding"] or "utf-8"
+    print(f"📄 Detected encoding: {encoding} (confidence {detected.get('confidence') or 0:.2f}) "
+          f"— set \"encoding\" in the data source config to skip detection")
+    return encoding
 
-def insert_row(row):
+
+def read_header(path, encoding, delimiter):
+    """Header row and the byte offset of the first data record."""
+    with open(path, "rb") as raw_file:
+        lines = OffsetLineReader(raw_file, encoding)
+        header = next(csv.reader(lines, delimiter=delimiter))
+        header[0] = header[0].lstrip("\ufeff")
+        return header, lines.offset
+
+
+def _state_path(data_source_id, path):
+    key = hashlib.sha1(f"{data_source_id}:{Path(path).resolve()}".encode()).hexdigest()[:12]
+    return STATE_DIR / f"csv_import_{key}.json"
+
+
+def _load_state(state_path, path):
+    if not state_path.exists():
+        return None
+    try:
+        state = json.loads(state_path.read_text())
+    except Exception as e:
+        print(f"⚠️ Failed to load import state, starting over: {e}")
+        return None
+    if state.get("file_size") != os.path.getsize(path):
+        print("⚠️ File changed since the interrupted import, starting over")
+        return None
+    return state
+
+
+def _save_state(state_path, state):
+    state_path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = state_path.with_suffix(".tmp")
+    tmp.write_text(json.dumps(state, indent=2))
+    os.replace(tmp, state_path)
+
+
+def committed_offset(cur, data_source_id, batch_id):
+    """Byte offset after the last row of this batch that made it into extracted_data."""
     cur.execute("""
-        INSERT INTO extracted_data (
+        SELECT max((metadata->>'next_offset')::bigint), count(*)
+        FROM extracted_data
+        WHERE data_source_id = %s AND metadata->>'import_batch_id' = %s
+    """, (data_source_id, batch_id))
+    offset, rows = cur.fetchone()
+    return offset, rows
+
+
+def copy_chunk(cur, rows):
+    """Bulk-load prepared rows with COPY (CSV format, empty unquoted field = NULL)."""
+    buffer = io.StringIO()
+    csv.writer(buffer).writerows(rows)
+    buffer.seek(0)
+    cur.copy_expert("""
+        COPY extracted_data (
             id, organization_id, business_unit_id, data_source_id,
             external_id, data, metadata, status, created_at
-        ) VALUES (
-            %s, %s, %s, %s,
-            %s, %s, %s, 'pending', now()
+        ) FROM STDIN WITH (FORMAT csv)
+    """, buffer)
+
+
+def import_csv(conn, path, organization_id, data_source_id, business_unit_id=None, delimiter=";",
+               encoding="utf-8", external_id_column=DEFAULT_EXTERNAL_ID_COLUMN, chunk_size=DEFAULT_CHUNK_SIZE,
+               limit=None, resume=False):
+    cur = conn.cursor()
+    file_size = os.path.getsize(path)
+    header, data_offset = read_header(path, encoding, delimiter)
+    print(f"📄 {path}: {file_size / 1e6:.1f} MB, {len(header)} columns, encoding {encoding}, delimiter '{delimiter}'")
+
+    state_path = _state_path(data_source_id, path)
+    state = _load_state(state_path, path) if resume else None
+    batch_id = str(uuid.uuid4())
+    offset, rows_done = data_offset, 0
+    if state:
+        batch_id = state["batch_id"]
+        db_offset, db_rows = committed_offset(cur, data_source_id, batch_id)
+        conn.commit()
+        # The database is authoritative: a chunk may have committed after the state file was last written
+        offset = max(state["offset"], db_offset or 0)
+        rows_done = max(state["rows"], db_rows)
+        print(f"↩️ Resuming batch {batch_id} at byte {offset} ({rows_done} rows already imported)")
+    else:
+        print(f"🆔 Import batch {batch_id}")
+
+    source_file = os.path.basename(path)
+    started = time.perf_counter()
+    start_offset, rows_this_run = offset, 0
+    chunk = []
+    chunk_end = offset  # byte offset after the last record in chunk
+
+    def flush():
+        nonlocal rows_this_run
+        copy_chunk(cur, chunk)
+        conn.commit()
+        rows_this_run += len(chunk)
+        _save_state(state_path, {
+            "batch_id": batch_id,
+            "file": str(Path(path).resolve()),
+            "file_size": file_size,
+            "offset": chunk_end,
+            "rows": rows_done + rows_this_run,
+        })
+        elapsed = time.perf_counter() - started
+        mb = (chunk_end - start_offset) / 1e6
+        print(f"   📦 {rows_done + rows_this_run} rows, {100.0 * chunk_end / file_size:.1f}% "
+              f"({rows_this_run / elapsed:.0f} rows/sec, {mb / elapsed:.1f} MB/sec)")
+        chunk.clear()
+
+    with open(path, "rb") as raw_file:
+        lines = OffsetLineReader(raw_file, encoding, offset)
+        reader = csv.reader(lines, delimiter=delimiter)
+        row_number = rows_done
+        now = datetime.now(timezone.utc).isoformat()
+        finished = True
+
+        for record in reader:
+            if not record or not any(field.strip() for field in record):
+                continue
+            if limit is not None and rows_this_run + len(chunk) >= limit:
+                finished = False
+                break
+            row_number += 1
+
+            row = dict(zip(header, record))
+            if len(record) < len(header):
+                row.update({column: None for column in header[len(record):]})
+            elif len(record) > len(header):
+                row["_extra"] = record[len(header):]
+
+            chunk.append((
+                str(uuid.uuid4()), organization_id, business_unit_id, data_source_id,
+                row.get(external_id_column) or str(uuid.uuid4()),
+                json.dumps(row),
+                json.dumps({
+                    "import_batch_id": batch_id,
+                    "source_file": source_file,
+                    "row_number": row_number,
+                    "next_offset": lines.offset,
+                }),
+                "pending",
+                now,
+            ))
+            chunk_end = lines.offset
+            if len(chunk) >= chunk_size:
+                flush()
+
+        if chunk:
+            flush()
+
+    elapsed = time.perf_counter() - started
+    if finished and state_path.exists():
+        state_path.unlink()
+    print(f"✅ Inserted {rows_this_run} rows into extracted_data in {elapsed:.1f}s "
+          f"({rows_this_run / elapsed if elapsed else 0:.0f} rows/sec), batch {batch_id}"
+          + ("" if finished else " — stopped before end of file, rerun with --resume to continue"))
+    cur.close()
+    return batch_id, rows_this_run
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--organization-id", required=True)
+    parser.add_argument("--data-source-id", required=True)
+    parser.add_argument("--file", required=True, help="CSV file (relative paths are also looked up in files/)")
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE, help="rows per COPY/transaction")
+    parser.add_argument("--limit", type=int, default=None, help="stop after this many rows")
+    parser.add_argument("--delimiter", help="override data source config")
+    parser.add_argument("--encoding", help="override data source config")
+    parser.add_argument("--external-id-column", help="override data source config")
+    parser.add_argument("--resume", action="store_true", help="continue an interrupted import of the same file")
+    args = parser.parse_args()
+
+    path = args.file
+    if not os.path.exists(path):
+        path = os.path.join(os.path.dirname(__file__), "files", args.file)
+    if not os.path.exists(path):
+        print(f"❌ File not found: {args.file}")
+        sys.exit(1)
+
+    load_dotenv()
+    conn = psycopg2.connect(
+        dbname=os.getenv("DB_NAME"),
+        user=os.getenv("DB_USER"),
+        password=os.getenv("DB_PASSWORD"),
+        host=os.getenv("DB_HOST"),
+        port=os.getenv("DB_PORT"),
+    )
+    cur = conn.cursor()
+
+    # Get business_unit_id and config from the data source
+    cur.execute("SELECT business_unit_id, config FROM data_sources WHERE id = %s", (args.data_source_id,))
+    row = cur.fetchone()
+    cur.close()
+    conn.commit()
+    if not row:
+        print(f"❌ Data source not found: {args.data_source_id}")
+        conn.close()
+        sys.exit(1)
+
+    business_unit_id = row[0] or None
+    config = row[1] or {}
+    delimiter = args.delimiter or config.get("delimiter", ";")
+    encoding = args.encoding or config.get("encoding") or detect_encoding(path)
+    external_id_column = args.external_id_column or config.get("external_id_column", DEFAULT_EXTERNAL_ID_COLUMN)
+    print(f"ℹ️ Using business_unit_id: {business_unit_id or 'NULL (multi-BU import)'}")
+
+    try:
+        import_csv(
+            conn, path, args.organization_id, args.data_source_id,
+            business_unit_id=business_unit_id,
+            delimiter=delimiter,
+            encoding=encoding,
+            external_id_column=external_id_column,
+            chunk_size=args.chunk_size,
+            limit=args.limit,
+            resume=args.resume,
         )
-    """, (
-        str(uuid.uuid4()), ORG_ID, BUSINESS_UNIT_ID, DATA_SOURCE_ID,
-        row.get("Invoice Number") or str(uuid.uuid4()),
-        json.dumps(row),
-        json.dumps({})
-    ))
-
-# Detect encoding of the file
-with open(FILENAME, 'rb') as raw_file:
-    detected = chardet.detect(raw_file.read(10000))
-    encoding = detected['encoding']
-    print(f"📄 Detected encoding: {encoding}")
-
-# Load and insert rows
-
-row_count = 0
-with open(FILENAME, newline='', encoding=encoding) as f:
-    reader = csv.DictReader(f, delimiter=DELIMITER)
-    for i, row in enumerate(reader):
-        if i >= IMPORT_LIMIT:
-            break
-        insert_row(row)
-        row_count += 1
-
-conn.commit()
-print(f"✅ Inserted {row_count} rows into extracted_data")
-
-cur.close()
-conn.close()
-print("✅ Database connection closed")
-
-
-# It assumes that the database connection details are stored in a .env file.
-# Make sure to handle exceptions and edge cases in a production environment.
-# This script is a basic example and may need to be adjusted based on your specific requirements.
-# The script reads a CSV file, processes each row, and inserts it into the `extracted_data` table in a PostgreSQL database.
-# It uses the `psycopg2` library to connect to the database and execute SQL commands.
-# The script also uses the `dotenv` library to load environment variables for database connection details.
+    finally:
+        conn.close()
+        print("✅ Database connection closed")
+
+
+if __name__ == "__main__":
+    main()
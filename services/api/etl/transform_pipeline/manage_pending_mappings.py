@@ -2,12 +2,33 @@
 """
 Script to manage pending category mappings.
 Shows pending mappings and allows you to approve them by creating proper mappings.
+
+Run without arguments for the interactive menu. Batch mode:
+
+  # write the pending list (most frequent first) to a CSV, fill in decision + category per row
+  python manage_pending_mappings.py export --organization-id <ORG_ID> --out pending.csv
+
+  # apply approve/reject decisions from CSV or JSON, chunk by chunk
+  python manage_pending_mappings.py apply --organization-id <ORG_ID> --decisions pending.csv --dry-run
+  python manage_pending_mappings.py apply --organization-id <ORG_ID> --decisions pending.csv --backfill
+
+Decision rows need `id` (pending mapping id), `decision` (approve/reject, blank = skip)
+and for approvals `category_id` or `category_name`.
 """
 
+import argparse
+import csv
+import json
+import sys
+import uuid
+
 import psycopg2
 import os
+from psycopg2.extras import execute_values
 from dotenv import load_dotenv
 
+from backfill_categories import backfill_categories, load_mappings
+
 load_dotenv()
 
 # Connect to database
@@ -20,36 +41,80 @@ conn = psycopg2.connect(
 )
 cur = conn.cursor()
 
-def show_pending_mappings(org_id: str):
-    """Show all pending category mappings."""
-    cur.execute("""
-        SELECT id, variant_product_name, variant_product_code, variant_supplier_name, created_at
+PAGE_SIZE = 50
+CHUNK_SIZE = 500
+EXPORT_FIELDS = [
+    "id", "variant_product_name", "variant_product_code", "variant_supplier_name",
+    "occurrences", "last_seen_at", "decision", "category_id", "category_name",
+]
+DECISION_ALIASES = {
+    "approve": "approve", "approved": "approve", "a": "approve", "y": "approve", "yes": "approve",
+    "reject": "reject", "rejected": "reject", "r": "reject", "n": "reject", "no": "reject",
+}
+
+def fetch_pending_page(org_id: str, after=None, limit: int = PAGE_SIZE):
+    """
+    One page of pending mappings, most frequent first.
+    Keyset pagination on (occurrences, id): pass the last row of the previous page as `after`.
+    """
+    query = """
+        SELECT id, variant_product_name, variant_product_code, variant_supplier_name, created_at, occurrences, last_seen_at
         FROM pending_category_mappings
         WHERE organization_id = %s AND status = 'pending'
-        ORDER BY created_at DESC
-    """, (org_id,))
-    
-    pending = cur.fetchall()
+    """
+    params = [org_id]
+    if after is not None:
+        query += " AND (occurrences, id) < (%s, %s)"
+        params += [after[5], after[0]]
+    cur.execute(query + " ORDER BY occurrences DESC, id DESC LIMIT %s", params + [limit])
+    return cur.fetchall()
+
+def iter_pending_mappings(org_id: str, page_size: int = 1000):
+    """All pending mappings, page by page."""
+    after = None
+    while True:
+        page = fetch_pending_page(org_id, after, page_size)
+        yield from page
+        if len(page) < page_size:
+            break
+        after = page[-1]
+
+def show_pending_mappings(org_id: str, after=None):
+    """Show one page of pending category mappings."""
+    pending = fetch_pending_page(org_id, after)
     
     if not pending:
-        print("✅ No pending category mappings found!")
+        if after is None:
+            print("✅ No pending category mappings found!")
+        else:
+            print("✅ No more pending category mappings.")
         return []
     
-    print(f"\n📋 Found {len(pending)} pending category mappings:")
+    print(f"\n📋 Showing {len(pending)} pending category mappings (most frequent first):")
     print("-" * 80)
     
-    for i, (mapping_id, name, code, supplier, created_at) in enumerate(pending, 1):
+    for i, (mapping_id, name, code, supplier, created_at, occurrences, _) in enumerate(pending, 1):
         print(f"{i:2d}. {name}")
         if code:
             print(f"    Code: {code}")
         if supplier:
             print(f"    Supplier: {supplier}")
-        print(f"    Created: {created_at}")
+        print(f"    Seen: {occurrences} time(s), created: {created_at}")
         print(f"    ID: {mapping_id}")
         print()
     
     return pending
 
+def browse_pending_mappings(org_id: str):
+    """Page through pending mappings until the user stops; returns the page last shown."""
+    page = show_pending_mappings(org_id)
+    while len(page) == PAGE_SIZE and input("Show next page? (y/n): ").strip().lower() == "y":
+        next_page = show_pending_mappings(org_id, after=page[-1])
+        if not next_page:
+            break
+        page = next_page
+    return page
+
 def show_categories(org_id: str):
     """Show all available categories."""
     cur.execute("""
@@ -78,7 +143,7 @@ def show_categories(org_id: str):
     return categories
 
 def approve_mapping(pending_id: str, category_id: str, org_id: str):
-    """Approve a pending mapping by creating a proper mapping."""
+    """Approve a pending mapping by creating a proper mapping. Returns its mapping_id, or None if it could not be created."""
     # Get the pending mapping details
     cur.execute("""
         SELECT variant_product_name, variant_product_code, variant_supplier_name
@@ -89,7 +154,7 @@ def approve_mapping(pending_id: str, category_id: str, org_id: str):
     result = cur.fetchone()
     if not result:
         print(f"❌ Pending mapping not found: {pending_id}")
-        return False
+        return None
     
     variant_name, variant_code, variant_supplier = result
     
@@ -101,6 +166,20 @@ def approve_mapping(pending_id: str, category_id: str, org_id: str):
         ON CONFLICT (organization_id, variant_product_name, variant_product_code, variant_supplier_name) DO NOTHING
     """, (org_id, category_id, variant_name, variant_code, variant_supplier))
     
+    # Look up the mapping (new or already existing) so it can be backfilled
+    cur.execute("""
+        SELECT mapping_id FROM product_category_mappings
+        WHERE organization_id = %s
+          AND variant_product_name = %s
+          AND variant_product_code IS NOT DISTINCT FROM %s
+          AND variant_supplier_name IS NOT DISTINCT FROM %s
+    """, (org_id, variant_name, variant_code, variant_supplier))
+    mapping = cur.fetchone()
+    if not mapping:
+        # The insert was skipped on a conflict the lookup cannot see: leave the pending row for another try
+        print(f"❌ Could not create a mapping for '{variant_name}', pending mapping left as is")
+        return None
+    
     # Mark as approved
     cur.execute("""
         UPDATE pending_category_mappings
@@ -109,7 +188,7 @@ def approve_mapping(pending_id: str, category_id: str, org_id: str):
     """, (pending_id,))
     
     print(f"✅ Approved mapping: '{variant_name}' → category_id: {category_id}")
-    return True
+    return mapping[0]
 
 def reject_mapping(pending_id: str):
     """Reject a pending mapping."""
@@ -121,13 +200,232 @@ def reject_mapping(pending_id: str):
     
     print(f"❌ Rejected mapping: {pending_id}")
 
-def main():
+# ---------- Batch mode ----------
+
+def export_pending_mappings(org_id: str, out_path: str):
+    """Write all pending mappings to a CSV with empty decision/category columns to fill in."""
+    count = 0
+    with open(out_path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(EXPORT_FIELDS)
+        for pending_id, name, code, supplier, _, occurrences, last_seen_at in iter_pending_mappings(org_id):
+            writer.writerow([pending_id, name, code or "", supplier or "", occurrences, last_seen_at or "", "", "", ""])
+            count += 1
+    print(f"📤 Exported {count} pending category mappings to {out_path}")
+    return count
+
+def read_decisions(path: str):
+    """Decision rows from a CSV file or a JSON list (or {"decisions": [...]})."""
+    if path.lower().endswith(".json"):
+        with open(path, encoding="utf-8") as f:
+            data = json.load(f)
+        return data.get("decisions", []) if isinstance(data, dict) else data
+    with open(path, newline="", encoding="utf-8-sig") as f:
+        return list(csv.DictReader(f))
+
+def normalize_decisions(rows, org_id: str):
+    """
+    Validate decision rows and resolve category names.
+    Returns ([(pending_id, decision, category_id)], [error messages]); the last decision per id wins.
+    """
+    cur.execute("SELECT lower(category_name), category_id FROM product_categories WHERE organization_id = %s", (org_id,))
+    categories_by_name = dict(cur.fetchall())
+    
+    decisions, errors = {}, []
+    for line, row in enumerate(rows, 1):
+        raw_decision = str(row.get("decision") or "").strip().lower()
+        if not raw_decision:
+            continue
+        pending_id = str(row.get("id") or row.get("pending_id") or "").strip()
+        decision = DECISION_ALIASES.get(raw_decision)
+        if not decision:
+            errors.append(f"row {line}: unknown decision '{raw_decision}'")
+            continue
+        try:
+            pending_id = str(uuid.UUID(pending_id))
+        except ValueError:
+            errors.append(f"row {line}: invalid pending mapping id '{pending_id}'")
+            continue
+        
+        category_id = None
+        if decision == "approve":
+            category_id = str(row.get("category_id") or "").strip()
+            if not category_id:
+                category_name = str(row.get("category_name") or "").strip().lower()
+                category_id = categories_by_name.get(category_name)
+                if not category_id:
+                    errors.append(f"row {line}: unknown category '{row.get('category_name') or ''}'")
+                    continue
+            try:
+                category_id = str(uuid.UUID(str(category_id)))
+            except ValueError:
+                errors.append(f"row {line}: invalid category_id '{category_id}'")
+                continue
+        
+        decisions[pending_id] = (pending_id, decision, category_id)
+    
+    return list(decisions.values()), errors
+
+def _load_decision_chunk(chunk):
+    cur.execute("""
+        CREATE TEMP TABLE IF NOT EXISTS mapping_decisions (
+            pending_id uuid PRIMARY KEY,
+            decision text NOT NULL,
+            category_id uuid
+        ) ON COMMIT DELETE ROWS
+    """)
+    execute_values(cur, "INSERT INTO mapping_decisions (pending_id, decision, category_id) VALUES %s", chunk)
+
+def diff_decision_chunk(org_id: str):
+    """What applying the loaded chunk would change, one (action, description) per decision."""
+    cur.execute("""
+        SELECT d.pending_id, d.decision, p.status,
+               p.variant_product_name, p.variant_product_code, p.variant_supplier_name,
+               c.category_name, m.mapping_id, ec.category_name
+        FROM mapping_decisions d
+        LEFT JOIN pending_category_mappings p
+               ON p.id = d.pending_id AND p.organization_id = %s
+        LEFT JOIN product_categories c
+               ON c.category_id = d.category_id AND c.organization_id = %s
+        LEFT JOIN product_category_mappings m
+               ON m.organization_id = p.organization_id
+              AND m.variant_product_name = p.variant_product_name
+              AND m.variant_product_code IS NOT DISTINCT FROM p.variant_product_code
+              AND m.variant_supplier_name IS NOT DISTINCT FROM p.variant_supplier_name
+        LEFT JOIN product_categories ec
+               ON ec.category_id = m.category_id
+        ORDER BY p.variant_product_name
+    """, (org_id, org_id))
+    
+    diff = []
+    for pending_id, decision, status, name, code, supplier, category, existing_mapping, existing_category in cur.fetchall():
+        label = f"'{name}'" + (f" [{code}]" if code else "") + (f" ({supplier})" if supplier else "")
+        if status is None:
+            diff.append(("not_found", f"= skip {pending_id}: not a pending mapping of this organization"))
+        elif status != "pending":
+            diff.append(("not_pending", f"= skip {label}: already {status}"))
+        elif decision == "reject":
+            diff.append(("reject", f"- reject {label}"))
+        elif category is None:
+            diff.append(("invalid_category", f"= skip {label}: category does not belong to this organization"))
+        elif existing_mapping:
+            diff.append(("approve_existing", f"~ approve {label}: mapping exists, keeps category '{existing_category}'"))
+        else:
+            diff.append(("approve_new", f"+ approve {label} → '{category}'"))
+    return diff
+
+def apply_decision_chunk(org_id: str):
+    """Apply the loaded chunk with set-based statements. Returns (inserted, approved pending ids, rejected count)."""
+    cur.execute("""
+        INSERT INTO product_category_mappings
+            (organization_id, category_id, variant_product_name, variant_product_code, variant_supplier_name)
+        SELECT p.organization_id, d.category_id, p.variant_product_name, p.variant_product_code, p.variant_supplier_name
+        FROM mapping_decisions d
+        JOIN pending_category_mappings p
+          ON p.id = d.pending_id AND p.organization_id = %s AND p.status = 'pending'
+        JOIN product_categories c
+          ON c.category_id = d.category_id AND c.organization_id = p.organization_id
+        WHERE d.decision = 'approve'
+        ON CONFLICT (organization_id, variant_product_name, variant_product_code, variant_supplier_name) DO NOTHING
+    """, (org_id,))
+    inserted = cur.rowcount
+    
+    cur.execute("""
+        UPDATE pending_category_mappings p
+        SET status = CASE d.decision WHEN 'approve' THEN 'approved' ELSE 'rejected' END,
+            updated_at = now()
+        FROM mapping_decisions d
+        WHERE p.id = d.pending_id
+          AND p.organization_id = %s
+          AND p.status = 'pending'
+          AND (d.decision = 'reject' OR EXISTS (
+                SELECT 1 FROM product_categories c
+                WHERE c.category_id = d.category_id AND c.organization_id = p.organization_id))
+        RETURNING p.id, p.status
+    """, (org_id,))
+    updated = cur.fetchall()
+    approved = [pending_id for pending_id, status in updated if status == "approved"]
+    return inserted, approved, len(updated) - len(approved)
+
+def approved_mapping_ids(org_id: str, pending_ids):
+    """mapping_ids of the product_category_mappings behind the given approved pending mappings."""
+    if not pending_ids:
+        return []
+    cur.execute("""
+        SELECT DISTINCT m.mapping_id
+        FROM pending_category_mappings p
+        JOIN product_category_mappings m
+          ON m.organization_id = p.organization_id
+         AND m.variant_product_name = p.variant_product_name
+         AND m.variant_product_code IS NOT DISTINCT FROM p.variant_product_code
+         AND m.variant_supplier_name IS NOT DISTINCT FROM p.variant_supplier_name
+        WHERE p.organization_id = %s AND p.id = ANY(%s::uuid[])
+    """, (org_id, [str(pending_id) for pending_id in pending_ids]))
+    return [row[0] for row in cur.fetchall()]
+
+def apply_decisions(org_id: str, decisions_path: str, chunk_size: int = CHUNK_SIZE, dry_run: bool = False,
+                    backfill: bool = False):
+    """Apply approve/reject decisions from a file, one transaction per chunk."""
+    decisions, errors = normalize_decisions(read_decisions(decisions_path), org_id)
+    conn.commit()
+    for error in errors:
+        print(f"⚠️ {error}")
+    print(f"📥 {len(decisions)} decisions loaded from {decisions_path} ({len(errors)} invalid rows ignored)")
+    
+    totals = {"inserted": 0, "approved": 0, "rejected": 0, "failed_chunks": 0}
+    actions = {}
+    approved_pending_ids = []
+    
+    for start in range(0, len(decisions), chunk_size):
+        chunk = decisions[start:start + chunk_size]
+        try:
+            _load_decision_chunk(chunk)
+            if dry_run:
+                for action, line in diff_decision_chunk(org_id):
+                    actions[action] = actions.get(action, 0) + 1
+                    print(f"   {line}")
+                conn.rollback()
+                continue
+            inserted, approved, rejected = apply_decision_chunk(org_id)
+            conn.commit()
+        except psycopg2.Error as e:
+            conn.rollback()
+            totals["failed_chunks"] += 1
+            print(f"❌ Chunk starting at decision {start + 1} failed and was rolled back: {e}")
+            continue
+        
+        totals["inserted"] += inserted
+        totals["approved"] += len(approved)
+        totals["rejected"] += rejected
+        approved_pending_ids.extend(approved)
+        print(f"   ✅ Decisions {start + 1}-{start + len(chunk)}: {len(approved)} approved "
+              f"({inserted} new mappings), {rejected} rejected")
+    
+    if dry_run:
+        summary = ", ".join(f"{count} {action}" for action, count in sorted(actions.items()))
+        print(f"\n🔍 Dry run, nothing written: {summary or 'no changes'}")
+        return actions
+    
+    print(f"\n✅ Applied decisions: {totals['approved']} approved ({totals['inserted']} new mappings), "
+          f"{totals['rejected']} rejected, {totals['failed_chunks']} failed chunks")
+    
+    if backfill and approved_pending_ids:
+        mapping_ids = approved_mapping_ids(org_id, approved_pending_ids)
+        mappings = load_mappings(cur, org_id, mapping_ids)
+        conn.commit()
+        backfill_categories(conn, org_id, mappings)
+    
+    return totals
+
+def interactive_main():
     ORG_ID = input("Enter your organization ID: ").strip()
     
     if not ORG_ID:
         print("❌ Organization ID is required")
         return
     
+    newly_approved_ids = []
+    
     while True:
         print(f"\n🔧 Pending Category Mappings Manager")
         print("1. Show pending mappings")
@@ -139,18 +437,18 @@ def main():
         choice = input("\nChoose an option (1-5): ").strip()
         
         if choice == "1":
-            show_pending_mappings(ORG_ID)
+            browse_pending_mappings(ORG_ID)
         
         elif choice == "2":
             show_categories(ORG_ID)
         
         elif choice == "3":
-            pending = show_pending_mappings(ORG_ID)
+            pending = browse_pending_mappings(ORG_ID)
             if not pending:
                 continue
             
             try:
-                mapping_num = int(input("Enter mapping number to approve: ")) - 1
+                mapping_num = int(input("Enter mapping number to approve (from the page shown): ")) - 1
                 if 0 <= mapping_num < len(pending):
                     pending_id = pending[mapping_num][0]
                     
@@ -161,8 +459,10 @@ def main():
                     cat_num = int(input("Enter category number: ")) - 1
                     if 0 <= cat_num < len(categories):
                         category_id = categories[cat_num][0]
-                        approve_mapping(pending_id, category_id, ORG_ID)
+                        mapping_id = approve_mapping(pending_id, category_id, ORG_ID)
                         conn.commit()
+                        if mapping_id:
+                            newly_approved_ids.append(mapping_id)
                     else:
                         print("❌ Invalid category number")
                 else:
@@ -171,12 +471,12 @@ def main():
                 print("❌ Please enter a valid number")
         
         elif choice == "4":
-            pending = show_pending_mappings(ORG_ID)
+            pending = browse_pending_mappings(ORG_ID)
             if not pending:
                 continue
             
             try:
-                mapping_num = int(input("Enter mapping number to reject: ")) - 1
+                mapping_num = int(input("Enter mapping number to reject (from the page shown): ")) - 1
                 if 0 <= mapping_num < len(pending):
                     pending_id = pending[mapping_num][0]
                     reject_mapping(pending_id)
@@ -191,6 +491,36 @@ def main():
         
         else:
             print("❌ Invalid choice")
+    
+    if newly_approved_ids:
+        answer = input(f"\nBackfill {len(newly_approved_ids)} approved mapping(s) into existing invoice lines now? (y/n): ")
+        if answer.strip().lower() == "y":
+            backfill_categories(conn, ORG_ID, load_mappings(cur, ORG_ID, newly_approved_ids))
+
+def main():
+    if len(sys.argv) == 1:
+        interactive_main()
+        return
+    
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    
+    export_parser = subparsers.add_parser("export", help="write pending mappings to a CSV for review")
+    export_parser.add_argument("--organization-id", required=True)
+    export_parser.add_argument("--out", required=True)
+    
+    apply_parser = subparsers.add_parser("apply", help="apply approve/reject decisions from CSV/JSON")
+    apply_parser.add_argument("--organization-id", required=True)
+    apply_parser.add_argument("--decisions", required=True)
+    apply_parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE)
+    apply_parser.add_argument("--dry-run", action="store_true", help="print what would change without writing")
+    apply_parser.add_argument("--backfill", action="store_true", help="backfill invoice_lines for approved mappings afterwards")
+    
+    args = parser.parse_args()
+    if args.command == "export":
+        export_pending_mappings(args.organization_id, args.out)
+    else:
+        apply_decisions(args.organization_id, args.decisions, args.chunk_size, args.dry_run, args.backfill)
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,241 @@
+"""
+Set-based import of mapping CSVs (supplier, location and product mappings).
+
+The CSV is loaded into a temp table with COPY, standard names are resolved with
+one join against the organization's suppliers / locations / products, and all
+mappings are written with a single INSERT ... ON CONFLICT on the mapping's
+variant key. Used by insert_supplier_mappings.py, insert_location_mappings.py
+and insert_product_mappings.py.
+"""
+
+import csv
+import io
+import time
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Optional, Tuple
+
+import chardet
+
+from mappings.supplier_matcher import normalize_tax_id
+
+ENCODING_SAMPLE_BYTES = 1024 * 1024
+
+
+@dataclass
+class MappingImportSpec:
+    label: str
+    # (temp table column, CSV header)
+    columns: List[Tuple[str, str]]
+    required: List[str]
+    # UPDATE of mapping_import setting target_id from the standard name; %(org)s is the organization
+    resolve_sql: str
+    # INSERT ... SELECT FROM mapping_import ... ON CONFLICT, formatted with {conflict_action};
+    # must RETURN (xmax = 0) so inserted and updated rows can be told apart
+    insert_sql: str
+    # DO UPDATE clause used with update_existing=True
+    update_action: str
+    transforms: Dict[str, Callable[[str], Optional[str]]] = field(default_factory=dict)
+
+
+SUPPLIER_MAPPINGS = MappingImportSpec(
+    label="supplier mappings",
+    columns=[
+        ("variant_name", "Shipper Name"),
+        ("variant_address", "Shipper Address"),
+        ("tax_id", "Supplier Tax ID"),
+        ("standard_name", "Supplier"),
+    ],
+    required=["variant_name", "standard_name"],
+    resolve_sql="""
+        UPDATE mapping_import t
+        SET target_id = s.supplier_id
+        FROM suppliers s
+        WHERE s.organization_id = %(org)s
+          AND lower(s.name) = lower(t.standard_name)
+    """,
+    insert_sql="""
+        INSERT INTO supplier_mappings (mapping_id, supplier_id, variant_name, variant_address, tax_id, organization_id, created_at)
+        SELECT DISTINCT ON (variant_name, coalesce(variant_address, ''))
+               gen_random_uuid(), target_id, variant_name, coalesce(variant_address, ''), tax_id, %(org)s, now()
+        FROM mapping_import
+        WHERE target_id IS NOT NULL
+        ORDER BY variant_name, coalesce(variant_address, ''), line_no
+        ON CONFLICT (organization_id, variant_name, variant_address) {conflict_action}
+        RETURNING (xmax = 0)
+    """,
+    update_action="""
+        DO UPDATE SET supplier_id = excluded.supplier_id,
+                      tax_id = coalesce(excluded.tax_id, supplier_mappings.tax_id)
+        WHERE supplier_mappings.supplier_id IS DISTINCT FROM excluded.supplier_id
+           OR (excluded.tax_id IS NOT NULL AND supplier_mappings.tax_id IS DISTINCT FROM excluded.tax_id)
+    """,
+    transforms={"tax_id": normalize_tax_id},
+)
+
+LOCATION_MAPPINGS = MappingImportSpec(
+    label="location mappings",
+    columns=[
+        ("variant_name", "Receiver Name"),
+        ("variant_address", "Receiver Address"),
+        ("standard_name", "Location"),
+    ],
+    required=["variant_name", "variant_address", "standard_name"],
+    resolve_sql="""
+        UPDATE mapping_import t
+        SET target_id = l.location_id
+        FROM locations l
+        WHERE l.organization_id = %(org)s
+          AND lower(l.name) = lower(t.standard_name)
+    """,
+    # Same value for both name fields, as before
+    insert_sql="""
+        INSERT INTO location_mappings (mapping_id, location_id, variant_name, variant_receiver_name, variant_address, organization_id, created_at)
+        SELECT DISTINCT ON (variant_name, variant_address)
+               gen_random_uuid(), target_id, variant_name, variant_name, variant_address, %(org)s, now()
+        FROM mapping_import
+        WHERE target_id IS NOT NULL
+        ORDER BY variant_name, variant_address, line_no
+        ON CONFLICT (organization_id, variant_receiver_name, variant_address) {conflict_action}
+        RETURNING (xmax = 0)
+    """,
+    update_action="""
+        DO UPDATE SET location_id = excluded.location_id
+        WHERE location_mappings.location_id IS DISTINCT FROM excluded.location_id
+    """,
+)
+
+PRODUCT_MAPPINGS = MappingImportSpec(
+    label="product mappings",
+    columns=[
+        ("variant_name", "Variant Name"),
+        ("variant_code", "Variant Code"),
+        ("variant_supplier", "Variant Supplier"),
+        ("standard_name", "Standard Product Name"),
+    ],
+    required=["variant_name", "standard_name"],
+    resolve_sql="""
+        UPDATE mapping_import t
+        SET target_id = p.product_id
+        FROM products p
+        WHERE p.organization_id = %(org)s
+          AND p.active = true
+          AND p.description = t.standard_name
+    """,
+    insert_sql="""
+        INSERT INTO product_mappings (organization_id, variant_product_name, variant_product_code, variant_supplier_name,
+                                      standard_product_id, created_at, updated_at)
+        SELECT DISTINCT ON (variant_name, variant_code, variant_supplier)
+               %(org)s, variant_name, variant_code, variant_supplier, target_id, now(), now()
+        FROM mapping_import
+        WHERE target_id IS NOT NULL
+        ORDER BY variant_name, variant_code, variant_supplier, line_no
+        ON CONFLICT (organization_id, variant_product_name, variant_product_code, variant_supplier_name) {conflict_action}
+        RETURNING (xmax = 0)
+    """,
+    update_action="""
+        DO UPDATE SET standard_product_id = excluded.standard_product_id, updated_at = now()
+        WHERE product_mappings.standard_product_id IS DISTINCT FROM excluded.standard_product_id
+    """,
+)
+
+
+def detect_encoding(path):
+    with open(path, "rb") as raw_file:
+        detected = chardet.detect(raw_file.read(ENCODING_SAMPLE_BYTES))
+    encoding = detected["encoding"] or "utf-8"
+    print(f"📄 Detected encoding: {encoding}")
+    return encoding
+
+
+def _copy_buffer(path, spec, encoding, delimiter):
+    """CSV rows trimmed and reduced to the spec's columns, as a COPY (FORMAT csv) buffer. Empty values become NULL."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    count = 0
+    with open(path, newline="", encoding=encoding) as f:
+        reader = csv.DictReader(f, delimiter=delimiter)
+        reader.fieldnames = [name.strip().lstrip("\ufeff") for name in reader.fieldnames]
+        print(f"📌 Headers: {reader.fieldnames}")
+        missing = [header for column, header in spec.columns if column in spec.required and header not in reader.fieldnames]
+        if missing:
+            raise ValueError(f"CSV is missing column(s) {missing} for {spec.label}")
+
+        for line_no, row in enumerate(reader, 1):
+            values = []
+            for column, header in spec.columns:
+                value = (row.get(header) or "").strip()
+                if column in spec.transforms:
+                    value = spec.transforms[column](value) or ""
+                values.append(value)
+            writer.writerow([line_no, *values])
+            count += 1
+    buffer.seek(0)
+    return buffer, count
+
+
+def import_mappings(conn, path, spec, organization_id, encoding=None, delimiter=";", update_existing=False):
+    """
+    Import a mapping CSV in one transaction.
+    Returns counts: rows, invalid (missing required fields), unresolved (standard name not found),
+    inserted, updated and skipped (already mapped, or duplicate variant in the file).
+    """
+    started = time.perf_counter()
+    encoding = encoding or detect_encoding(path)
+    buffer, rows = _copy_buffer(path, spec, encoding, delimiter)
+    columns = [column for column, _ in spec.columns]
+
+    cur = conn.cursor()
+    try:
+        cur.execute(f"""
+            CREATE TEMP TABLE mapping_import (
+                line_no integer,
+                {", ".join(f"{column} text" for column in columns)},
+                target_id uuid
+            ) ON COMMIT DROP
+        """)
+        cur.copy_expert(f"COPY mapping_import (line_no, {', '.join(columns)}) FROM STDIN WITH (FORMAT csv)", buffer)
+
+        cur.execute(f"""
+            DELETE FROM mapping_import
+            WHERE {" OR ".join(f"{column} IS NULL" for column in spec.required)}
+        """)
+        invalid = cur.rowcount
+
+        cur.execute(spec.resolve_sql, {"org": organization_id})
+        cur.execute("SELECT standard_name, count(*) FROM mapping_import WHERE target_id IS NULL GROUP BY standard_name ORDER BY count(*) DESC")
+        unresolved_names = cur.fetchall()
+        unresolved = sum(count for _, count in unresolved_names)
+
+        conflict_action = spec.update_action if update_existing else "DO NOTHING"
+        cur.execute(spec.insert_sql.format(conflict_action=conflict_action), {"org": organization_id})
+        results = [row[0] for row in cur.fetchall()]
+        inserted = sum(1 for was_inserted in results if was_inserted)
+        updated = len(results) - inserted
+
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cur.close()
+
+    resolved = rows - invalid - unresolved
+    counts = {
+        "rows": rows,
+        "invalid": invalid,
+        "unresolved": unresolved,
+        "inserted": inserted,
+        "updated": updated,
+        "skipped": resolved - inserted - updated,
+    }
+
+    for name, count in unresolved_names[:20]:
+        print(f"❌ Standard name not found: '{name}' ({count} row(s))")
+    if len(unresolved_names) > 20:
+        print(f"❌ ... and {len(unresolved_names) - 20} more unresolved standard names")
+
+    elapsed = time.perf_counter() - started
+    print(f"\n🎉 Done. {rows} {spec.label} rows in {elapsed:.1f}s: {inserted} inserted, {updated} updated, "
+          f"{counts['skipped']} skipped (already mapped / duplicate), {unresolved} unresolved, "
+          f"{invalid} missing required fields")
+    return counts
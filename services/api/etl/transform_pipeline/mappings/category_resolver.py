@@ -1,9 +1,18 @@
+import os
 import psycopg2
 from typing import Optional, Tuple
 
-def resolve_product_category(cur, product_name: str, product_code: str, supplier_name: str, org_id: str) -> Tuple[Optional[str], Optional[str], bool]:
+# Step 6 accepts the nearest mapping name only at this pg_trgm similarity or above
+FUZZY_NAME_MIN_SIMILARITY = float(os.getenv("CATEGORY_FUZZY_MIN_SIMILARITY", "0.8"))
+
+# Set to False for the rest of the run if pg_trgm is not installed
+_trigram_available = True
+
+def resolve_product_category(cur, product_name: str, product_code: str, supplier_name: str, org_id: str, pending_buffer=None, cache=None) -> Tuple[Optional[str], Optional[str], bool]:
     """
     Enhanced category resolution prioritizing product code + supplier over exact name matching.
+    Unmatched products go to pending_buffer when given, otherwise straight to pending_category_mappings.
+    cache: optional CategoryResolutionCache consulted first and filled with every match.
     Returns: (category_id, mapping_id, is_pending)
     """
     if not product_name:
@@ -15,7 +24,25 @@ def resolve_product_category(cur, product_name: str, product_code: str, supplier
     supplier_name = supplier_name.strip() if supplier_name else None
     
     print(f"   🔍 Resolving category for: '{product_name}' | '{product_code}' | '{supplier_name}'")
-    
+
+    if cache is None:
+        return _resolve_uncached(cur, product_name, product_code, supplier_name, org_id, pending_buffer)
+
+    cache.sync_watermark(cur, org_id)
+    key = (org_id, supplier_name or "", product_code or "", product_name)
+    cached = cache.get(key)
+    if cached:
+        category_id, mapping_id = cached.split(":", 1)
+        print(f"   ✅ Found cached category mapping (mapping_id: {mapping_id})")
+        return category_id, mapping_id, False
+
+    category_id, mapping_id, is_pending = _resolve_uncached(cur, product_name, product_code, supplier_name, org_id, pending_buffer)
+    if not is_pending:
+        cache.put(key, f"{category_id}:{mapping_id}")
+    return category_id, mapping_id, is_pending
+
+def _resolve_uncached(cur, product_name: str, product_code: Optional[str], supplier_name: Optional[str], org_id: str, pending_buffer=None) -> Tuple[Optional[str], Optional[str], bool]:
+    """Steps 1-7 of resolve_product_category() against the database."""
     # 1. Try exact match in product_category_mappings (most specific)
     cur.execute("""
         SELECT pcm.category_id, pcm.mapping_id, pc.category_name
@@ -110,15 +137,60 @@ def resolve_product_category(cur, product_name: str, product_code: str, supplier
         print(f"   ✅ Found fuzzy category mapping: {category_name} (mapping_id: {mapping_id})")
         return category_id, mapping_id, False
     
-    # 6. If no match found, add to pending for manual review
+    # 6. Nearest mapping name by trigram similarity (OCR typos, abbreviations)
+    row = find_nearest_mapping_by_name(cur, product_name, org_id)
+    if row:
+        category_id, mapping_id, category_name, similarity = row
+        print(f"   ✅ Found similar category mapping: {category_name} (similarity {similarity:.2f}, mapping_id: {mapping_id})")
+        return category_id, mapping_id, False
+
+    # 7. If no match found, add to pending for manual review
     print(f"   ⚠️ No category mapping found - adding to pending")
-    add_to_pending_category_mappings(cur, product_name, product_code, supplier_name, org_id)
+    add_to_pending_category_mappings(cur, product_name, product_code, supplier_name, org_id, pending_buffer)
     return None, None, True
 
-def add_to_pending_category_mappings(cur, product_name: str, product_code: str, supplier_name: str, org_id: str):
+def find_nearest_mapping_by_name(cur, product_name: str, org_id: str):
+    """
+    Closest active mapping by lower(variant_product_name), as (category_id, mapping_id, category_name, similarity),
+    or None below FUZZY_NAME_MIN_SIMILARITY. The `%` filter and `<->` ordering are answered by a KNN scan
+    of idx_product_category_mappings_name_trgm (sql/add_category_mappings_name_trgm_index.sql).
+    """
+    global _trigram_available
+    if not _trigram_available:
+        return None
+    # Savepoint so a missing pg_trgm does not abort the caller's transaction
+    cur.execute("SAVEPOINT category_trigram")
+    try:
+        cur.execute("""
+            SELECT pcm.category_id, pcm.mapping_id, pc.category_name,
+                   1 - (lower(pcm.variant_product_name) <-> lower(%s)) AS similarity
+            FROM product_category_mappings pcm
+            JOIN product_categories pc ON pcm.category_id = pc.category_id
+            WHERE pcm.organization_id = %s
+              AND pcm.is_active = TRUE
+              AND lower(pcm.variant_product_name) %% lower(%s)
+            ORDER BY lower(pcm.variant_product_name) <-> lower(%s)
+            LIMIT 1
+        """, (product_name, org_id, product_name, product_name))
+        row = cur.fetchone()
+        cur.execute("RELEASE SAVEPOINT category_trigram")
+    except psycopg2.Error as e:
+        cur.execute("ROLLBACK TO SAVEPOINT category_trigram")
+        _trigram_available = False
+        print(f"Warning: Trigram category matching disabled for this run (is pg_trgm installed?): {e}")
+        return None
+    if row and row[3] >= FUZZY_NAME_MIN_SIMILARITY:
+        return row
+    return None
+
+def add_to_pending_category_mappings(cur, product_name: str, product_code: str, supplier_name: str, org_id: str, pending_buffer=None):
     """
     Add unmatched product to pending category mappings for manual review.
     """
+    if pending_buffer is not None:
+        pending_buffer.add_category(product_name, product_code, supplier_name, org_id)
+        return
+
     try:
         cur.execute("""
             INSERT INTO pending_category_mappings
@@ -13,50 +13,131 @@ def clean_text(text):
     text = re.sub(r'[^\w\s,]', '', text)  # Remove special chars except commas
     return text
 
-def fetch_all_locations(cur):
-    cur.execute("SELECT location_id, name, address FROM locations")
+def fetch_all_locations(cur, organization_id=None):
+    if organization_id is None:
+        cur.execute("SELECT location_id, name, address FROM locations")
+    else:
+        cur.execute("""
+            SELECT location_id, name, address
+            FROM locations
+            WHERE organization_id = %s
+        """, (organization_id,))
     return cur.fetchall()
 
-def fuzzy_match_location(cur, variant_name, variant_address, threshold=80):
-    print(f"   🔍 Fuzzy matching against {len(fetch_all_locations(cur))} locations...")
-    
-    variant_name = clean_text(variant_name or "")
-    variant_address = clean_text(normalize_address(variant_address or "") or "")
-    
-    print(f"   📝 Cleaned variant - Name: '{variant_name}' | Address: '{variant_address}'")
+def score_location(variant_name, variant_address, std_name, std_address):
+    """Returns (score, strategy); all inputs already clean_text()-ed."""
+    score_name = fuzz.partial_ratio(variant_name, std_name)
+    score_addr = fuzz.partial_ratio(variant_address, std_address)
 
-    all_locations = fetch_all_locations(cur)
-    best_match = None
-    best_score = 0
-    best_location_name = None
-
-    for location_id, name, address in all_locations:
-        std_name = clean_text(name or "")
-        std_address = clean_text(address or "")
-
-        score_name = fuzz.partial_ratio(variant_name, std_name)
-        score_addr = fuzz.partial_ratio(variant_address, std_address)
-
-        # If name is a very strong match, ignore address if address score is very low
-        if score_name >= 95 and score_addr < 40:
-            total = score_name
-            strategy = "name-only (very strong name match, weak address)"
-        else:
-            total = 0.7 * score_name + 0.3 * score_addr
-            strategy = "weighted"
-
-        if total > best_score:
-            best_score = total
-            best_match = location_id
-            best_location_name = name
-
-    if best_score >= threshold:
-        print(f"    Best match: '{best_location_name}' (Score: {best_score:.1f}% - {strategy})")
-        return best_match, best_score
-    else:
-        print(f"    Best match: '{best_location_name}' (Score: {best_score:.1f}% - {strategy}) - Below threshold ({threshold}%)")
+    # If name is a very strong match, ignore address if address score is very low
+    if score_name >= 95 and score_addr < 40:
+        return score_name, "name-only (very strong name match, weak address)"
+    return 0.7 * score_name + 0.3 * score_addr, "weighted"
+
+class LocationIndex:
+    """
+    Org-scoped locations built once per run:
+      - exact dictionaries of location_mappings receiver names / (name, address) pairs
+      - pre-normalized fuzzy candidates from locations
+      - location_id -> business_unit_id map
+    """
+
+    def __init__(self, locations, mappings=()):
+        self.candidates = []
+        self.business_units = {}
+        for location_id, name, address, business_unit_id in locations:
+            self.candidates.append((location_id, name, clean_text(name or ""), clean_text(address or "")))
+            self.business_units[location_id] = business_unit_id
+
+        # Same precedence as the former per-document location_mappings query: first row wins
+        self.by_receiver_name = {}
+        self.by_name_address = {}
+        self.by_name_any_address = {}
+        for location_id, variant_name, variant_address, variant_receiver_name in mappings:
+            if variant_receiver_name is not None:
+                self.by_receiver_name.setdefault(variant_receiver_name, location_id)
+            if variant_name is not None:
+                if variant_address is None:
+                    self.by_name_any_address.setdefault(variant_name, location_id)
+                else:
+                    self.by_name_address.setdefault((variant_name, variant_address), location_id)
+
+    @classmethod
+    def load(cls, cur, organization_id):
+        cur.execute("""
+            SELECT location_id, name, address, business_unit_id
+            FROM locations
+            WHERE organization_id = %s
+        """, (organization_id,))
+        locations = cur.fetchall()
+        cur.execute("""
+            SELECT location_id, variant_name, variant_address, variant_receiver_name
+            FROM location_mappings
+            WHERE organization_id = %s
+        """, (organization_id,))
+        mappings = cur.fetchall()
+        print(f"   📍 Location index for org {organization_id}: {len(locations)} locations, {len(mappings)} mappings")
+        return cls(locations, mappings)
+
+    def lookup_mapping(self, name, address, receiver_name):
+        return (
+            self.by_name_address.get((name, address))
+            or self.by_name_any_address.get(name)
+            or self.by_receiver_name.get(receiver_name)
+        )
+
+    def has_location(self, location_id):
+        return location_id in self.business_units
+
+    def business_unit_for(self, location_id):
+        return self.business_units.get(location_id)
+
+    def fuzzy_match(self, variant_name, variant_address, threshold=80):
+        print(f"   🔍 Fuzzy matching against {len(self.candidates)} locations...")
+
+        variant_name = clean_text(variant_name or "")
+        variant_address = clean_text(normalize_address(variant_address or "") or "")
+
+        print(f"   📝 Cleaned variant - Name: '{variant_name}' | Address: '{variant_address}'")
+
+        best_match = None
+        best_score = 0
+        best_location_name = None
+        best_strategy = "weighted"
+
+        for location_id, name, std_name, std_address in self.candidates:
+            total, strategy = score_location(variant_name, variant_address, std_name, std_address)
+            if total > best_score:
+                best_score = total
+                best_match = location_id
+                best_location_name = name
+                best_strategy = strategy
+
+        if best_score >= threshold:
+            print(f"    Best match: '{best_location_name}' (Score: {best_score:.1f}% - {best_strategy})")
+            return best_match, best_score
+        print(f"    Best match: '{best_location_name}' (Score: {best_score:.1f}% - {best_strategy}) - Below threshold ({threshold}%)")
         return None, best_score
 
+_location_indexes = {}
+
+def get_location_index(cur, organization_id):
+    """LocationIndex for the organization, loaded on first use and kept for the rest of the run."""
+    index = _location_indexes.get(organization_id)
+    if index is None:
+        index = LocationIndex.load(cur, organization_id)
+        _location_indexes[organization_id] = index
+    return index
+
+def fuzzy_match_location(cur, variant_name, variant_address, threshold=80, organization_id=None):
+    if organization_id is not None:
+        return get_location_index(cur, organization_id).fuzzy_match(variant_name, variant_address, threshold)
+
+    # Unscoped scan over every tenant's locations (legacy callers without an org)
+    all_locations = fetch_all_locations(cur)
+    index = LocationIndex([(location_id, name, address, None) for location_id, name, address in all_locations])
+    return index.fuzzy_match(variant_name, variant_address, threshold)
+
 def resolve_location(name, address, receiver_name, org_id):
     # 1. Try to resolve via location_mappings (exact match)
     cur.execute("""
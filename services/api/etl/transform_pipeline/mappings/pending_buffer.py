@@ -0,0 +1,126 @@
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Tuple
+
+from psycopg2.extras import execute_values
+
+
+class PendingMappingBuffer:
+    """
+    Collects unresolved supplier / location / category variants during an ETL run
+    and writes them with one multi-row upsert per pending table at the end.
+
+    Variants are deduplicated in memory with an occurrence count and first/last
+    seen timestamps. Additions are staged per extracted_data row: commit() keeps
+    them (call after conn.commit()), discard() drops them (after conn.rollback()).
+    """
+
+    def __init__(self):
+        self._staged: List[Tuple[str, tuple, dict]] = []
+        self._entries: Dict[str, Dict[tuple, dict]] = {"supplier": {}, "location": {}, "category": {}}
+
+    def _stage(self, kind: str, key: tuple, suggested_id=None, similarity_score=None, seen_at: Optional[datetime] = None):
+        self._staged.append((kind, key, {
+            "suggested_id": suggested_id,
+            "similarity_score": similarity_score,
+            "seen_at": seen_at or datetime.now(timezone.utc),
+        }))
+
+    def add_supplier(self, name, address, suggested_supplier_id, similarity_score, org_id, seen_at=None):
+        self._stage("supplier", (org_id, name, address), suggested_supplier_id, similarity_score, seen_at)
+
+    def add_location(self, receiver_name, address, suggested_location_id, similarity_score, org_id, seen_at=None):
+        self._stage("location", (org_id, receiver_name, address), suggested_location_id, similarity_score, seen_at)
+
+    def add_category(self, product_name, product_code, supplier_name, org_id, seen_at=None):
+        self._stage("category", (org_id, product_name, product_code, supplier_name), seen_at=seen_at)
+
+    def commit(self):
+        for kind, key, occurrence in self._staged:
+            entry = self._entries[kind].get(key)
+            if entry is None:
+                self._entries[kind][key] = {
+                    "occurrences": 1,
+                    "first_seen_at": occurrence["seen_at"],
+                    "last_seen_at": occurrence["seen_at"],
+                    "suggested_id": occurrence["suggested_id"],
+                    "similarity_score": occurrence["similarity_score"],
+                }
+                continue
+            entry["occurrences"] += 1
+            entry["first_seen_at"] = min(entry["first_seen_at"], occurrence["seen_at"])
+            entry["last_seen_at"] = max(entry["last_seen_at"], occurrence["seen_at"])
+            # Keep the best suggestion seen for this variant
+            if (occurrence["similarity_score"] or 0) > (entry["similarity_score"] or 0):
+                entry["suggested_id"] = occurrence["suggested_id"]
+                entry["similarity_score"] = occurrence["similarity_score"]
+        self._staged = []
+
+    def discard(self):
+        self._staged = []
+
+    def counts(self) -> Dict[str, Tuple[int, int]]:
+        """kind -> (distinct variants, total occurrences)"""
+        return {
+            kind: (len(entries), sum(e["occurrences"] for e in entries.values()))
+            for kind, entries in self._entries.items()
+        }
+
+    def flush(self, cur) -> Dict[str, Tuple[int, int]]:
+        """Upsert everything committed so far and clear the buffer. Caller commits the transaction."""
+        self.commit()
+        counts = self.counts()
+
+        suppliers = [
+            (org_id, name, address, e["suggested_id"], e["similarity_score"], e["occurrences"], e["first_seen_at"], e["last_seen_at"])
+            for (org_id, name, address), e in self._entries["supplier"].items()
+        ]
+        if suppliers:
+            execute_values(cur, """
+                INSERT INTO pending_supplier_mappings
+                    (organization_id, variant_supplier_name, variant_address, suggested_supplier_id, similarity_score,
+                     occurrences, first_seen_at, last_seen_at)
+                VALUES %s
+                ON CONFLICT (organization_id, variant_supplier_name, variant_address) DO UPDATE SET
+                    occurrences           = pending_supplier_mappings.occurrences + excluded.occurrences,
+                    first_seen_at         = least(pending_supplier_mappings.first_seen_at, excluded.first_seen_at),
+                    last_seen_at          = greatest(pending_supplier_mappings.last_seen_at, excluded.last_seen_at),
+                    suggested_supplier_id = coalesce(pending_supplier_mappings.suggested_supplier_id, excluded.suggested_supplier_id),
+                    similarity_score      = coalesce(pending_supplier_mappings.similarity_score, excluded.similarity_score)
+            """, suppliers, page_size=len(suppliers))
+
+        locations = [
+            (org_id, receiver_name, address, e["suggested_id"], e["similarity_score"], e["occurrences"], e["first_seen_at"], e["last_seen_at"])
+            for (org_id, receiver_name, address), e in self._entries["location"].items()
+        ]
+        if locations:
+            execute_values(cur, """
+                INSERT INTO pending_location_mappings
+                    (organization_id, variant_receiver_name, variant_address, suggested_location_id, similarity_score,
+                     occurrences, first_seen_at, last_seen_at)
+                VALUES %s
+                ON CONFLICT (organization_id, variant_receiver_name, variant_address) DO UPDATE SET
+                    occurrences           = pending_location_mappings.occurrences + excluded.occurrences,
+                    first_seen_at         = least(pending_location_mappings.first_seen_at, excluded.first_seen_at),
+                    last_seen_at          = greatest(pending_location_mappings.last_seen_at, excluded.last_seen_at),
+                    suggested_location_id = coalesce(pending_location_mappings.suggested_location_id, excluded.suggested_location_id),
+                    similarity_score      = coalesce(pending_location_mappings.similarity_score, excluded.similarity_score)
+            """, locations, page_size=len(locations))
+
+        categories = [
+            (org_id, product_name, product_code, supplier_name, "pending", e["occurrences"], e["first_seen_at"], e["last_seen_at"])
+            for (org_id, product_name, product_code, supplier_name), e in self._entries["category"].items()
+        ]
+        if categories:
+            execute_values(cur, """
+                INSERT INTO pending_category_mappings
+                    (organization_id, variant_product_name, variant_product_code, variant_supplier_name, status,
+                     occurrences, first_seen_at, last_seen_at)
+                VALUES %s
+                ON CONFLICT (organization_id, variant_product_name, variant_product_code, variant_supplier_name) DO UPDATE SET
+                    occurrences   = pending_category_mappings.occurrences + excluded.occurrences,
+                    first_seen_at = least(pending_category_mappings.first_seen_at, excluded.first_seen_at),
+                    last_seen_at  = greatest(pending_category_mappings.last_seen_at, excluded.last_seen_at)
+            """, categories, page_size=len(categories))
+
+        self._entries = {"supplier": {}, "location": {}, "category": {}}
+        return counts
@@ -0,0 +1,229 @@
+import os
+import sqlite3
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+
+import psycopg2
+
+# (organization_id, supplier, product code, product name); normalized for products, as-is for categories
+CacheKey = Tuple[str, str, str, str]
+
+DEFAULT_CACHE_PATH = os.getenv(
+    "PRODUCT_CACHE_PATH",
+    str(Path(__file__).resolve().parent.parent / ".cache" / "product_resolution.db"),
+)
+CATEGORY_CACHE_PATH = os.getenv(
+    "CATEGORY_CACHE_PATH",
+    str(Path(__file__).resolve().parent.parent / ".cache" / "category_resolution.db"),
+)
+DEFAULT_MAX_ENTRIES = int(os.getenv("PRODUCT_CACHE_MAX_ENTRIES", "20000"))
+
+
+class ProductResolutionCache:
+    """
+    Two-tier cache for product resolutions:
+      1) bounded in-process LRU (OrderedDict)
+      2) local SQLite store in WAL mode that survives between ETL runs
+
+    Entries of an organization are dropped when its products watermark
+    (count + max(updated_at) of products) differs from the one stored with them.
+    Pass path=None for a memory-only cache.
+    """
+
+    LABEL = "Product cache"
+    RESOLUTION_TABLE = "product_resolution"
+    VALUE_COLUMN = "product_id"
+    WATERMARK_TABLE = "products_watermark"
+
+    def __init__(self, path: Optional[str] = DEFAULT_CACHE_PATH, max_entries: int = DEFAULT_MAX_ENTRIES):
+        self.path = path
+        self.max_entries = max_entries
+        self._lru: "OrderedDict[CacheKey, str]" = OrderedDict()
+        self._synced_orgs = set()
+        self.stats: Dict[str, int] = {
+            "memory_hits": 0,
+            "disk_hits": 0,
+            "misses": 0,
+            "evictions": 0,
+            "invalidated_orgs": 0,
+            "writes": 0,
+        }
+        self._db = None
+        if path:
+            Path(path).parent.mkdir(parents=True, exist_ok=True)
+            self._db = sqlite3.connect(path)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("PRAGMA synchronous=NORMAL")
+            self._db.execute(f"""
+                CREATE TABLE IF NOT EXISTS {self.RESOLUTION_TABLE} (
+                    organization_id TEXT NOT NULL,
+                    supplier_id     TEXT NOT NULL,
+                    code_norm       TEXT NOT NULL,
+                    name_norm       TEXT NOT NULL,
+                    {self.VALUE_COLUMN} TEXT NOT NULL,
+                    PRIMARY KEY (organization_id, supplier_id, code_norm, name_norm)
+                )
+            """)
+            self._db.execute(f"""
+                CREATE TABLE IF NOT EXISTS {self.WATERMARK_TABLE} (
+                    organization_id TEXT PRIMARY KEY,
+                    watermark       TEXT NOT NULL
+                )
+            """)
+            self._db.commit()
+
+    def _fetch_watermark(self, cur, org_id: str) -> str:
+        cur.execute("""
+            SELECT count(*), max(updated_at)
+            FROM products
+            WHERE organization_id = %s
+        """, (org_id,))
+        count, last_updated = cur.fetchone()
+        return f"{count}:{last_updated.isoformat() if last_updated else ''}"
+
+    def sync_watermark(self, cur, org_id: str):
+        """Invalidate the organization's entries if products changed since they were cached. Once per org."""
+        if org_id in self._synced_orgs:
+            return
+        self._synced_orgs.add(org_id)
+        # Savepoint so a failing watermark query does not abort the caller's transaction
+        cur.execute("SAVEPOINT product_cache_watermark")
+        try:
+            current = self._fetch_watermark(cur, org_id)
+            cur.execute("RELEASE SAVEPOINT product_cache_watermark")
+        except psycopg2.Error as e:
+            cur.execute("ROLLBACK TO SAVEPOINT product_cache_watermark")
+            print(f"Warning: Could not read {self.WATERMARK_TABLE}, dropping cached entries for org: {e}")
+            current = None
+
+        stored = None
+        if self._db is not None:
+            row = self._db.execute(
+                f"SELECT watermark FROM {self.WATERMARK_TABLE} WHERE organization_id = ?", (org_id,)
+            ).fetchone()
+            stored = row[0] if row else None
+
+        if current is not None and current == stored:
+            return
+
+        self.invalidate_org(org_id, count=stored is not None)
+        if self._db is not None and current is not None:
+            self._db.execute(
+                f"INSERT OR REPLACE INTO {self.WATERMARK_TABLE} (organization_id, watermark) VALUES (?, ?)",
+                (org_id, current),
+            )
+            self._db.commit()
+
+    def invalidate_org(self, org_id: str, count: bool = True):
+        for key in [k for k in self._lru if k[0] == org_id]:
+            del self._lru[key]
+        if self._db is not None:
+            self._db.execute(f"DELETE FROM {self.RESOLUTION_TABLE} WHERE organization_id = ?", (org_id,))
+            self._db.execute(f"DELETE FROM {self.WATERMARK_TABLE} WHERE organization_id = ?", (org_id,))
+            self._db.commit()
+        if count:
+            self.stats["invalidated_orgs"] += 1
+
+    def _remember(self, key: CacheKey, product_id: str):
+        self._lru[key] = product_id
+        self._lru.move_to_end(key)
+        while len(self._lru) > self.max_entries:
+            self._lru.popitem(last=False)
+            self.stats["evictions"] += 1
+
+    def get(self, key: CacheKey) -> Optional[str]:
+        product_id = self._lru.get(key)
+        if product_id is not None:
+            self._lru.move_to_end(key)
+            self.stats["memory_hits"] += 1
+            return product_id
+
+        if self._db is not None:
+            row = self._db.execute(f"""
+                SELECT {self.VALUE_COLUMN} FROM {self.RESOLUTION_TABLE}
+                WHERE organization_id = ? AND supplier_id = ? AND code_norm = ? AND name_norm = ?
+            """, key).fetchone()
+            if row:
+                self._remember(key, row[0])
+                self.stats["disk_hits"] += 1
+                return row[0]
+
+        self.stats["misses"] += 1
+        return None
+
+    def put(self, key: CacheKey, product_id: str):
+        self._remember(key, product_id)
+        if self._db is not None:
+            self._db.execute(f"""
+                INSERT OR REPLACE INTO {self.RESOLUTION_TABLE}
+                    (organization_id, supplier_id, code_norm, name_norm, {self.VALUE_COLUMN})
+                VALUES (?, ?, ?, ?, ?)
+            """, (*key, product_id))
+            self.stats["writes"] += 1
+
+    def flush(self):
+        if self._db is not None:
+            self._db.commit()
+
+    def close(self):
+        if self._db is not None:
+            self._db.commit()
+            self._db.close()
+            self._db = None
+
+    @property
+    def lookups(self) -> int:
+        return self.stats["memory_hits"] + self.stats["disk_hits"] + self.stats["misses"]
+
+    def summary(self) -> str:
+        lookups = self.lookups
+        hits = self.stats["memory_hits"] + self.stats["disk_hits"]
+        hit_rate = (100.0 * hits / lookups) if lookups else 0.0
+        return (
+            f"{self.LABEL}: {lookups} lookups, {hit_rate:.1f}% hit rate "
+            f"(memory {self.stats['memory_hits']}, disk {self.stats['disk_hits']}, miss {self.stats['misses']}), "
+            f"{self.stats['evictions']} evictions, {self.stats['writes']} writes, "
+            f"{self.stats['invalidated_orgs']} org invalidations, {len(self._lru)}/{self.max_entries} in memory"
+        )
+
+
+_shared_cache: Optional[ProductResolutionCache] = None
+
+
+def get_shared_cache() -> ProductResolutionCache:
+    """Process-wide cache used when a matcher is created without an explicit cache."""
+    global _shared_cache
+    if _shared_cache is None:
+        _shared_cache = ProductResolutionCache()
+    return _shared_cache
+
+
+class CategoryResolutionCache(ProductResolutionCache):
+    """
+    The same two tiers in front of category_resolver.resolve_product_category():
+    (org, supplier name, product code, product name) -> "category_id:mapping_id".
+    Only resolved lines are cached; an organization's entries are dropped when its
+    product_category_mappings change (count + hash of the mapping rows).
+    """
+
+    LABEL = "Category cache"
+    RESOLUTION_TABLE = "category_resolution"
+    VALUE_COLUMN = "resolution"
+    WATERMARK_TABLE = "category_mappings_watermark"
+
+    def __init__(self, path: Optional[str] = CATEGORY_CACHE_PATH, max_entries: int = DEFAULT_MAX_ENTRIES):
+        super().__init__(path, max_entries)
+
+    def _fetch_watermark(self, cur, org_id: str) -> str:
+        # Hashing the rows also catches edits that leave updated_at alone (category moves, deactivation)
+        cur.execute("""
+            SELECT count(*), md5(coalesce(string_agg(
+                       concat_ws(':', mapping_id, category_id, is_active, variant_product_name,
+                                 variant_product_code, variant_supplier_name),
+                       ',' ORDER BY mapping_id), ''))
+            FROM product_category_mappings
+            WHERE organization_id = %s
+        """, (org_id,))
+        count, digest = cur.fetchone()
+        return f"{count}:{digest}"
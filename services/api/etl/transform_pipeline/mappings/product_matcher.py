@@ -1,8 +1,9 @@
 import psycopg2
 from typing import Dict, List, Tuple, Optional
-import hashlib
 import re
 
+from mappings.product_cache import CacheKey, ProductResolutionCache, get_shared_cache
+
 class ProductMatcherOptimized:
     """
     Product matcher that prioritizes product_code + supplier_id.
@@ -11,11 +12,27 @@ class ProductMatcherOptimized:
       2) Exact (org_id, product_code)  # supplier mismatch tolerance
       3) Fuzzy by description within same supplier
       4) Fuzzy by description within org
+
+    Not used by transform_and_insert, which maps products to categories via
+    category_resolver.resolve_product_category; callers create it explicitly.
     """
 
-    def __init__(self, cur):
+    FUZZY_MODES = ("knn", "scan")
+
+    def __init__(self, cur, fuzzy_mode: str = "knn", cache: Optional[ProductResolutionCache] = None):
+        """
+        fuzzy_mode:
+          - "knn":  nearest-neighbour lookup per input using the pg_trgm `%` and `<->`
+                    operators, served by idx_products_org_description_trgm
+                    (see sql/add_products_description_trgm_index.sql)
+          - "scan": legacy similarity() filter, scans every active product of the org
+        cache: resolution cache; defaults to the process-wide persistent cache
+        """
+        if fuzzy_mode not in self.FUZZY_MODES:
+            raise ValueError(f"Unknown fuzzy_mode '{fuzzy_mode}', expected one of {self.FUZZY_MODES}")
         self.cur = cur
-        self._product_cache: Dict[str, str] = {}  # hash -> product_id
+        self.fuzzy_mode = fuzzy_mode
+        self.cache = cache if cache is not None else get_shared_cache()  # (org, supplier, code, name) -> product_id
         self._supplier_cache: Dict[str, str] = {}  # supplier_id -> name
         self._batch_size = 100
 
@@ -35,10 +52,9 @@ class ProductMatcherOptimized:
         
         return normalized
 
-    def _get_cache_key(self, product_name: str, product_code: str, org_id: str, supplier_id: Optional[str]) -> str:
+    def _get_cache_key(self, product_name: str, product_code: str, org_id: str, supplier_id: Optional[str]) -> CacheKey:
         """Cache key includes supplier to avoid cross-supplier collisions."""
-        key_data = f"{org_id}:{supplier_id or ''}:{self._norm_code(product_code)}:{(product_name or '').lower().strip()}"
-        return hashlib.md5(key_data.encode()).hexdigest()
+        return (str(org_id), str(supplier_id or ""), self._norm_code(product_code), (product_name or "").lower().strip())
 
     def _load_supplier_cache(self, supplier_ids: List[str]):
         """Load supplier names into cache for performance."""
@@ -66,16 +82,19 @@ class ProductMatcherOptimized:
             print(f"Warning: Error loading supplier cache: {e}")
             # Continue without caching - not critical for functionality
 
-    def _batch_resolve_products(self, products: List[dict], org_id: str) -> Dict[str, Tuple[Optional[str], bool]]:
-        results: Dict[str, Tuple[Optional[str], bool]] = {}
+    def _batch_resolve_products(self, products: List[dict], org_id: str) -> Dict[CacheKey, Tuple[Optional[str], bool]]:
+        results: Dict[CacheKey, Tuple[Optional[str], bool]] = {}
 
-        exact_code_products: List[Tuple[str, dict]] = []
-        fuzzy_products: List[Tuple[str, dict]] = []
+        exact_code_products: List[Tuple[CacheKey, dict]] = []
+        fuzzy_products: List[Tuple[CacheKey, dict]] = []
 
         for p in products:
             cache_key = self._get_cache_key(p.get("name", ""), p.get("code", ""), org_id, p.get("supplier_id"))
-            if cache_key in self._product_cache:
-                results[cache_key] = (self._product_cache[cache_key], False)
+            if cache_key in results:
+                continue
+            cached_pid = self.cache.get(cache_key)
+            if cached_pid is not None:
+                results[cache_key] = (cached_pid, False)
                 continue
 
             if p.get("code"):
@@ -95,9 +114,9 @@ class ProductMatcherOptimized:
 
     def _batch_resolve_exact_codes(
         self,
-        products: List[Tuple[str, dict]],
+        products: List[Tuple[CacheKey, dict]],
         org_id: str,
-        results: Dict[str, Tuple[Optional[str], bool]],
+        results: Dict[CacheKey, Tuple[Optional[str], bool]],
     ):
         """Resolve products by exact code matching with supplier priority."""
         try:
@@ -138,7 +157,7 @@ class ProductMatcherOptimized:
                 if i in hard_hits:
                     pid = hard_hits[i]
                     results[cache_key] = (pid, False)
-                    self._product_cache[cache_key] = pid
+                    self.cache.put(cache_key, pid)
 
             # 2) Fallback: exact (org_id, product_code) regardless of supplier (only for still-unmatched)
             remain = [(i, cache_key, p) for i, (cache_key, p) in enumerate(products) if cache_key not in results]
@@ -169,7 +188,7 @@ class ProductMatcherOptimized:
                 if i in soft_hits:
                     pid = soft_hits[i]
                     results[cache_key] = (pid, False)
-                    self._product_cache[cache_key] = pid
+                    self.cache.put(cache_key, pid)
                     
         except psycopg2.Error as e:
             print(f"Error in batch resolve exact codes: {e}")
@@ -180,14 +199,141 @@ class ProductMatcherOptimized:
 
     def _batch_resolve_fuzzy(
         self,
-        products: List[Tuple[str, dict]],
+        products: List[Tuple[CacheKey, dict]],
         org_id: str,
-        results: Dict[str, Tuple[Optional[str], bool]],
+        results: Dict[CacheKey, Tuple[Optional[str], bool]],
         supplier_first_threshold: float = 0.78,
         org_threshold: float = 0.82,
+    ):
+        if self.fuzzy_mode == "knn":
+            return self._batch_resolve_fuzzy_knn(products, org_id, results, supplier_first_threshold, org_threshold)
+        return self._batch_resolve_fuzzy_scan(products, org_id, results, supplier_first_threshold, org_threshold)
+
+    def _set_similarity_threshold(self, threshold: float):
+        """Transaction-local pg_trgm threshold used by the `%` operator."""
+        self.cur.execute("SELECT set_config('pg_trgm.similarity_threshold', %s, true)", (str(threshold),))
+
+    def _batch_resolve_fuzzy_knn(
+        self,
+        products: List[Tuple[CacheKey, dict]],
+        org_id: str,
+        results: Dict[CacheKey, Tuple[Optional[str], bool]],
+        supplier_first_threshold: float,
+        org_threshold: float,
+    ):
+        """
+        Nearest-neighbour fuzzy match by description.
+        Each input does one LATERAL index probe:
+          `%`   prunes candidates below the session similarity_threshold (GiST index condition)
+          `<->` orders the survivors by trigram distance, LIMIT 1 keeps the best
+        so cost grows with the number of inputs, not inputs x catalogue size.
+        Same two passes as the scan mode: same supplier first, then org-wide.
+        """
+        try:
+            names = [(i, (p.get("name") or "").lower().strip()) for i, (ck, p) in enumerate(products)]
+            if not any(n for _, n in names):
+                for ck, _ in products:
+                    results[ck] = (None, True)
+                return
+
+            # Same-supplier nearest neighbour (inputs without supplier cannot match here)
+            supplier_inputs = [
+                (i, name, products[i][1].get("supplier_id"))
+                for i, name in names
+                if name and products[i][1].get("supplier_id")
+            ]
+            s_hits = {}
+            if supplier_inputs:
+                values_clause = ",".join(["(%s,%s,%s::uuid)"] * len(supplier_inputs))
+                flat = []
+                for t in supplier_inputs:
+                    flat.extend(t)
+
+                self._set_similarity_threshold(supplier_first_threshold)
+                self.cur.execute(
+                    f"""
+                    WITH inputs(idx, search_name, supplier_id) AS (VALUES {values_clause})
+                    SELECT i.idx, nn.product_id, nn.sim
+                    FROM inputs i
+                    CROSS JOIN LATERAL (
+                      SELECT p.product_id,
+                             similarity(lower(p.description), i.search_name) AS sim
+                      FROM products p
+                      WHERE p.organization_id = %s
+                        AND p.active = TRUE
+                        AND p.supplier_id = i.supplier_id
+                        AND lower(p.description) %% i.search_name
+                      ORDER BY lower(p.description) <-> i.search_name
+                      LIMIT 1
+                    ) nn
+                    """,
+                    flat + [org_id],
+                )
+                s_hits = {r[0]: (r[1], r[2]) for r in self.cur.fetchall() or []}
+
+            for i, (cache_key, p) in enumerate(products):
+                if i in s_hits:
+                    pid, _ = s_hits[i]
+                    results[cache_key] = (pid, False)
+                    self.cache.put(cache_key, pid)
+
+            # Org-wide nearest neighbour for still-unmatched
+            remain = [(i, name) for i, name in names if products[i][0] not in results]
+            org_inputs = [(i, name) for i, name in remain if name]
+            o_hits = {}
+            if org_inputs:
+                values_clause2 = ",".join(["(%s,%s)"] * len(org_inputs))
+                flat2 = []
+                for t in org_inputs:
+                    flat2.extend(t)
+
+                self._set_similarity_threshold(org_threshold)
+                self.cur.execute(
+                    f"""
+                    WITH inputs(idx, search_name) AS (VALUES {values_clause2})
+                    SELECT i.idx, nn.product_id, nn.sim
+                    FROM inputs i
+                    CROSS JOIN LATERAL (
+                      SELECT p.product_id,
+                             similarity(lower(p.description), i.search_name) AS sim
+                      FROM products p
+                      WHERE p.organization_id = %s
+                        AND p.active = TRUE
+                        AND lower(p.description) %% i.search_name
+                      ORDER BY lower(p.description) <-> i.search_name
+                      LIMIT 1
+                    ) nn
+                    """,
+                    flat2 + [org_id],
+                )
+                o_hits = {r[0]: (r[1], r[2]) for r in self.cur.fetchall() or []}
+
+            for i, _ in remain:
+                cache_key = products[i][0]
+                if i in o_hits:
+                    pid, _ = o_hits[i]
+                    results[cache_key] = (pid, False)
+                    self.cache.put(cache_key, pid)
+                else:
+                    results[cache_key] = (None, True)
+
+        except psycopg2.Error as e:
+            print(f"Error in batch resolve fuzzy (knn): {e}")
+            # Fallback: mark all as pending for manual review
+            for cache_key, p in products:
+                if cache_key not in results:
+                    results[cache_key] = (None, True)
+
+    def _batch_resolve_fuzzy_scan(
+        self,
+        products: List[Tuple[CacheKey, dict]],
+        org_id: str,
+        results: Dict[CacheKey, Tuple[Optional[str], bool]],
+        supplier_first_threshold: float,
+        org_threshold: float,
     ):
         """
-        Fuzzy by description using pg_trgm, but:
+        Fuzzy by description using pg_trgm similarity() filter, but:
           - Try within same supplier first (lower threshold).
           - If no hit, widen to org with a slightly higher threshold.
         """
@@ -238,7 +384,7 @@ class ProductMatcherOptimized:
                 if i in s_hits:
                     pid, _ = s_hits[i]
                     results[cache_key] = (pid, False)
-                    self._product_cache[cache_key] = pid
+                    self.cache.put(cache_key, pid)
 
             # Org-wide fuzzy for still-unmatched
             remain = [(i, (cache_key, p)) for i, (cache_key, p) in enumerate(products) if cache_key not in results]
@@ -264,8 +410,8 @@ class ProductMatcherOptimized:
                 ),
                 ranked AS (
                   SELECT DISTINCT ON (idx) idx, product_id, sim
-                  ORDER BY idx, sim DESC
                   FROM cte
+                  ORDER BY idx, sim DESC
                 )
                 SELECT idx, product_id, sim FROM ranked
                 """,
@@ -277,7 +423,7 @@ class ProductMatcherOptimized:
                 if i in o_hits:
                     pid, _ = o_hits[i]
                     results[cache_key] = (pid, False)
-                    self._product_cache[cache_key] = pid
+                    self.cache.put(cache_key, pid)
                 else:
                     results[cache_key] = (None, True)
                     
@@ -291,7 +437,9 @@ class ProductMatcherOptimized:
     def resolve_products_batch(self, products: List[dict], org_id: str) -> List[Tuple[Optional[str], bool]]:
         supplier_ids = list(set(p.get("supplier_id") for p in products if p.get("supplier_id")))
         self._load_supplier_cache(supplier_ids)
+        self.cache.sync_watermark(self.cur, org_id)
         results = self._batch_resolve_products(products, org_id)
+        self.cache.flush()
         out: List[Tuple[Optional[str], bool]] = []
         for p in products:
             ck = self._get_cache_key(p.get("name", ""), p.get("code", ""), org_id, p.get("supplier_id"))
@@ -299,8 +447,8 @@ class ProductMatcherOptimized:
         return out
 
 
-def resolve_product_optimized(cur, product_name, product_code, supplier_id, org_id):
-    matcher = ProductMatcherOptimized(cur)
+def resolve_product_optimized(cur, product_name, product_code, supplier_id, org_id, fuzzy_mode="knn", cache=None):
+    matcher = ProductMatcherOptimized(cur, fuzzy_mode=fuzzy_mode, cache=cache)
     return matcher.resolve_products_batch(
         [{"name": product_name, "code": product_code, "supplier_id": supplier_id}],
         org_id,
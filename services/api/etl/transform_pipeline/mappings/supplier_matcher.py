@@ -1,13 +1,29 @@
 from rapidfuzz import fuzz
 from normalizers.address_normalizer import normalize_address
+from collections import defaultdict
 import unicodedata
 import re
 
+# Legal forms and filler words that say nothing about which supplier it is
+BLOCKING_STOPWORDS = {
+    "aps", "as", "ab", "is", "amba", "asa", "gmbh", "ltd", "oy", "kg", "bv", "sa", "srl",
+    "og", "and", "the", "af", "i", "co", "company", "holding", "group", "danmark", "denmark",
+}
+PREFIX_LENGTH = 4
+
+# Labelled VAT/CVR numbers in OCR text, e.g. "CVR-nr. 32 32 26 54", "VAT: DK10665841", "Org.nr NO 936 966 802 MVA"
+TAX_ID_PATTERN = re.compile(
+    r"\b(?:cvr|se|vat|moms|org)\b[\s.\-]*(?:nr|no|nummer|number|reg)?[\s.:\-]*"
+    r"((?:[a-z]{2}[\s\-]?)?\d[\d\s\-]{6,14}\d(?:\s?mva)?)",
+    re.IGNORECASE,
+)
+# Bare country-prefixed numbers, e.g. "DK41619821"
+PREFIXED_TAX_ID_PATTERN = re.compile(r"\b((?:DK|NO|SE|DE|GB)[\s\-]?\d[\d\s]{6,12}\d(?:\s?MVA)?)\b")
+
 def clean_text(text):
     if not text:
         return ""
     text = str(text).lower().strip()
-    import unicodedata, re
     text = unicodedata.normalize("NFKD", text).encode("ascii", "ignore").decode("utf-8")
     text = re.sub(r'\s+', ' ', text)
     text = re.sub(r'[^\w\s,]', '', text)
@@ -21,7 +37,190 @@ def fetch_all_suppliers(cur, organization_id):
     """, (organization_id,))
     return cur.fetchall()
 
-def fuzzy_match_supplier(cur, variant_name, variant_address, organization_id, threshold=85):
+def normalize_tax_id(value):
+    """
+    Normalize a CVR/VAT/org number to its digits, dropping country prefix and MVA suffix.
+    'DK 10665841' -> '10665841', 'NO 936 966 802 MVA' -> '936966802'. Returns None if not plausible.
+    """
+    if not value:
+        return None
+    text = re.sub(r"[^0-9A-Za-z]", "", str(value)).upper()
+    if text.endswith("MVA"):
+        text = text[:-3]
+    if len(text) > 2 and text[:2].isalpha():
+        text = text[2:]
+    if not text.isdigit() or not 8 <= len(text) <= 12:
+        return None
+    return text
+
+def extract_tax_ids(*tax_fields, free_text=()):
+    """
+    Collect normalized CVR/VAT numbers from OCR supplier fields.
+    tax_fields are dedicated tax id / VAT fields, which may hold just the number. In free_text
+    (supplier name, address) only labelled or country-prefixed numbers count, so phone numbers
+    and other digit runs are not taken for a CVR.
+    """
+    found = []
+    for text, bare_allowed in [(t, True) for t in tax_fields] + [(t, False) for t in free_text]:
+        if not text:
+            continue
+        text = str(text)
+        candidates = [text] if bare_allowed else []
+        candidates += TAX_ID_PATTERN.findall(text)
+        candidates += PREFIXED_TAX_ID_PATTERN.findall(text)
+        for candidate in candidates:
+            tax_id = normalize_tax_id(candidate)
+            if tax_id and tax_id not in found:
+                found.append(tax_id)
+    return found
+
+def phonetic_key(token):
+    """Soundex-style code so OCR/spelling variants (e.g. 'Hørkram'/'Horkram', 'Dansk'/'Dansc') share a key."""
+    token = re.sub(r"[^a-z]", "", token)
+    if not token:
+        return ""
+    codes = {
+        **dict.fromkeys("bfpv", "1"), **dict.fromkeys("cgjkqsxz", "2"),
+        **dict.fromkeys("dt", "3"), "l": "4", **dict.fromkeys("mn", "5"), "r": "6",
+    }
+    key = token[0]
+    last = codes.get(token[0], "")
+    for char in token[1:]:
+        code = codes.get(char, "")
+        if code and code != last:
+            key += code
+        if char not in "hw":
+            last = code
+    return (key + "000")[:4]
+
+def blocking_keys(cleaned_name):
+    """Token, prefix and phonetic keys of an already clean_text()-ed name."""
+    tokens = [t for t in re.split(r"[\s,]+", cleaned_name) if len(t) >= 3 and t not in BLOCKING_STOPWORDS]
+    keys = set()
+    for token in tokens:
+        keys.add(("t", token))
+        keys.add(("p", phonetic_key(token)))
+    compact = cleaned_name.replace(" ", "").replace(",", "")
+    if len(compact) >= PREFIX_LENGTH:
+        keys.add(("x", compact[:PREFIX_LENGTH]))
+    return keys
+
+def score_supplier(variant_name, variant_address, std_name, std_address):
+    """Combined name/address score; all inputs already clean_text()-ed."""
+    score_name = fuzz.partial_ratio(variant_name, std_name)
+    score_addr = fuzz.partial_ratio(variant_address, std_address)
+
+    if score_name >= 90 and score_addr < 50:
+        return score_name
+    return 0.6 * score_name + 0.4 * score_addr
+
+def has_supplier_tax_id_column(cur):
+    """supplier_mappings.tax_id only exists once add_supplier_mappings_tax_id.sql has run."""
+    cur.execute("""
+        SELECT 1
+        FROM information_schema.columns
+        WHERE table_schema = current_schema()
+          AND table_name = 'supplier_mappings'
+          AND column_name = 'tax_id'
+    """)
+    return cur.fetchone() is not None
+
+def fetch_supplier_tax_ids(cur, organization_id):
+    if not has_supplier_tax_id_column(cur):
+        print("⚠️ supplier_mappings.tax_id missing (run sql/add_supplier_mappings_tax_id.sql); matching suppliers without CVR/VAT")
+        return []
+    cur.execute("""
+        SELECT tax_id, supplier_id
+        FROM supplier_mappings
+        WHERE organization_id = %s
+          AND tax_id IS NOT NULL
+          AND supplier_id IS NOT NULL
+    """, (organization_id,))
+    return cur.fetchall()
+
+class SupplierIndex:
+    """
+    Org-scoped supplier candidates built once per run:
+      - exact CVR/VAT fast path from supplier_mappings.tax_id
+      - inverted index of token / prefix / phonetic keys to narrow fuzzy scoring
+    Falls back to scoring every supplier when blocking finds no candidates.
+    """
+
+    def __init__(self, suppliers, tax_ids=()):
+        self.suppliers = []
+        self.by_key = defaultdict(set)
+        for supplier_id, name, address in suppliers:
+            std_name = clean_text(name or "")
+            idx = len(self.suppliers)
+            self.suppliers.append((supplier_id, std_name, clean_text(address or "")))
+            for key in blocking_keys(std_name):
+                self.by_key[key].add(idx)
+
+        self.by_tax_id = {}
+        for tax_id, supplier_id in tax_ids:
+            normalized = normalize_tax_id(tax_id)
+            if normalized:
+                self.by_tax_id.setdefault(normalized, supplier_id)
+
+        self.stats = {"tax_id_hits": 0, "blocked": 0, "full_scans": 0, "scored": 0}
+
+    @classmethod
+    def load(cls, cur, organization_id):
+        return cls(fetch_all_suppliers(cur, organization_id), fetch_supplier_tax_ids(cur, organization_id))
+
+    def candidates(self, cleaned_name):
+        """Indexes of suppliers sharing at least one blocking key, or None if nothing shares one."""
+        found = set()
+        for key in blocking_keys(cleaned_name):
+            found |= self.by_key.get(key, set())
+        return found or None
+
+    def match(self, variant_name, variant_address, tax_ids=(), threshold=85):
+        for tax_id in tax_ids or ():
+            supplier_id = self.by_tax_id.get(tax_id)
+            if supplier_id:
+                self.stats["tax_id_hits"] += 1
+                return supplier_id, 100.0
+
+        variant_name = clean_text(variant_name or "")
+        variant_address = clean_text(normalize_address(variant_address or "") or "")
+
+        candidate_idx = self.candidates(variant_name) if variant_name else None
+        if candidate_idx is None:
+            self.stats["full_scans"] += 1
+            pool = self.suppliers
+        else:
+            self.stats["blocked"] += 1
+            pool = [self.suppliers[i] for i in candidate_idx]
+
+        best_match = None
+        best_score = 0
+        for supplier_id, std_name, std_address in pool:
+            total = score_supplier(variant_name, variant_address, std_name, std_address)
+            if total > best_score:
+                best_score = total
+                best_match = supplier_id
+        self.stats["scored"] += len(pool)
+
+        if best_score >= threshold:
+            return best_match, best_score
+        return None, best_score
+
+_supplier_indexes = {}
+
+def get_supplier_index(cur, organization_id):
+    """SupplierIndex for the organization, loaded on first use and kept for the rest of the run."""
+    index = _supplier_indexes.get(organization_id)
+    if index is None:
+        index = SupplierIndex.load(cur, organization_id)
+        _supplier_indexes[organization_id] = index
+    return index
+
+def fuzzy_match_supplier(cur, variant_name, variant_address, organization_id, threshold=85, tax_ids=None, use_index=True):
+    if use_index:
+        return get_supplier_index(cur, organization_id).match(variant_name, variant_address, tax_ids, threshold)
+
+    # Exhaustive scan, kept as the recall baseline for the index
     variant_name = clean_text(variant_name or "")
     variant_address = clean_text(normalize_address(variant_address or "") or "")
 
@@ -33,13 +232,7 @@ def fuzzy_match_supplier(cur, variant_name, variant_address, organization_id, th
         std_name = clean_text(name or "")
         std_address = clean_text(address or "")
 
-        score_name = fuzz.partial_ratio(variant_name, std_name)
-        score_addr = fuzz.partial_ratio(variant_address, std_address)
-
-        if score_name >= 90 and score_addr < 50:
-            total = score_name
-        else:
-            total = 0.6 * score_name + 0.4 * score_addr
+        total = score_supplier(variant_name, variant_address, std_name, std_address)
 
         if total > best_score:
             best_score = total
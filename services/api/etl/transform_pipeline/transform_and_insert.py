@@ -16,11 +16,13 @@ from normalizers.unit_normalizer import normalize_unit
 from normalizers.date_normalizer import normalize_date
 from normalizers.number_normalizer import normalize_number
 
-from mappings.location_matcher import fuzzy_match_location
+from mappings.location_matcher import get_location_index
 from mappings.pending_location_handler import insert_pending_location_mapping
-from mappings.supplier_matcher import fuzzy_match_supplier
+from mappings.supplier_matcher import fuzzy_match_supplier, extract_tax_ids
 from mappings.pending_supplier_handler import insert_pending_supplier_mapping
 from mappings.category_resolver import resolve_product_category
+from mappings.pending_buffer import PendingMappingBuffer
+from mappings.product_cache import CategoryResolutionCache
 
 load_dotenv()
 
@@ -77,6 +79,12 @@ def get_cursor():
 
 cur = get_cursor()
 
+# Unresolved supplier/location/category variants, written once at the end of the run
+pending_buffer = PendingMappingBuffer()
+
+# Resolved (org, supplier, code, name) -> category, kept between runs in .cache/category_resolution.db
+category_cache = CategoryResolutionCache()
+
 def get_non_processed_rows():
     cur = get_cursor()
     # First, let's see what's in the table
@@ -111,7 +119,7 @@ def get_mappings_for_source(source_id, cur=None):
     """, (source_id,))
     return cur.fetchall()
 
-def resolve_supplier(name, address, org_id, cur=None):
+def resolve_supplier(name, address, org_id, cur=None, tax_ids=None):
     if cur is None:
         cur = get_cursor()
     # 1. Try to resolve via supplier_mappings (exact match)
@@ -127,58 +135,45 @@ def resolve_supplier(name, address, org_id, cur=None):
         # Found mapping in supplier_mappings
         return row[0]
 
-    # 2. Fallback to fuzzy matching
-    supplier_id, score = fuzzy_match_supplier(cur, name, address, org_id)
+    # 2. Fallback to CVR/VAT fast path + blocked fuzzy matching
+    supplier_id, score = fuzzy_match_supplier(cur, name, address, org_id, tax_ids=tax_ids)
     if supplier_id and score >= 80:  # or your preferred threshold
         # Fuzzy matched supplier
         return supplier_id
 
-    # 3. If not resolved, add to pending_supplier_mappings
-    # Could not resolve supplier, adding to pending_supplier_mappings
-    cur.execute("""
-        INSERT INTO pending_supplier_mappings
-            (variant_supplier_name, variant_address, suggested_supplier_id, similarity_score, organization_id)
-        VALUES (%s, %s, %s, %s, %s)
-        ON CONFLICT DO NOTHING
-    """, (name, address, supplier_id, score, org_id))
+    # 3. If not resolved, add to pending_supplier_mappings (buffered, flushed at the end of the run)
+    pending_buffer.add_supplier(name, address, supplier_id, score, org_id)
     return None
 
 def resolve_location(name, address, receiver_name, org_id, cur=None):
     if cur is None:
         cur = get_cursor()
+    location_index = get_location_index(cur, org_id)
+
     # 1. Try to resolve via location_mappings
-    cur.execute("""
-        SELECT location_id FROM location_mappings
-        WHERE organization_id = %s
-          AND (
-            (variant_name = %s AND (variant_address = %s OR variant_address IS NULL))
-            OR (variant_receiver_name = %s)
-          )
-        LIMIT 1
-    """, (org_id, name, address, receiver_name))
-    row = cur.fetchone()
-    if row:
-        return row[0]
+    location_id = location_index.lookup_mapping(name, address, receiver_name)
+    if location_id:
+        return location_id
 
     # 2. Fuzzy matching fallback...
-    location_id, score = fuzzy_match_location(cur, name, address)
+    location_id, score = location_index.fuzzy_match(name, address)
     if location_id and score >= 80:
         return location_id
 
-    # 3. If still unresolved, insert into pending_location_mappings
-    cur.execute("""
-        INSERT INTO pending_location_mappings
-            (variant_receiver_name, variant_address, suggested_location_id, similarity_score, organization_id)
-        VALUES (%s, %s, %s, %s, %s)
-        ON CONFLICT DO NOTHING
-    """, (receiver_name, address, location_id, score, org_id))
+    # 3. If still unresolved, add to pending_location_mappings (buffered, flushed at the end of the run)
+    pending_buffer.add_location(receiver_name, address, location_id, score, org_id)
     return None
 
-def resolve_business_unit(location_id):
+def resolve_business_unit(location_id, org_id=None):
     if not location_id:
         # No location_id provided for business unit resolution
         return None
-    
+
+    if org_id is not None:
+        location_index = get_location_index(get_cursor(), org_id)
+        if location_index.has_location(location_id):
+            return location_index.business_unit_for(location_id)
+
     cur = get_cursor()
     cur.execute("SELECT business_unit_id, name FROM locations WHERE location_id = %s", (location_id,))
     row = cur.fetchone()
@@ -196,8 +191,9 @@ def parse_extracted_data(data):
     table = {}
     for item in data:
         if item.get("type") == "table" and "columns" in item and "rows" in item:
-            for idx, row_values in enumerate(item["rows"], start=1):
-                table[idx] = dict(zip(item["columns"], row_values))
+            # Documents can hold several tables (one item each): number their rows consecutively
+            for row_values in item["rows"]:
+                table[len(table) + 1] = dict(zip(item["columns"], row_values))
         elif "label" in item and "ocr_text" in item:
             flat[item["label"]] = item["ocr_text"]
     return flat, table
@@ -316,11 +312,18 @@ def transform_row_optimized(row, mappings, product_matcher=None, cur=None):
         except Exception as e:
             print(f"   ⚠️ Could not parse subtotal: {e}")
 
+    supplier_tax_ids = extract_tax_ids(
+        flat_data.get("supplier_tax_id"),
+        flat_data.get("supplier_vat_number"),
+        free_text=(supplier_name, supplier_address),
+    )
+
     supplier_id = resolve_supplier(
         supplier_name,
         supplier_address,
         org_id,
-        cur
+        cur,
+        supplier_tax_ids
     )
     supplier_pending = supplier_id is None
     
@@ -335,7 +338,7 @@ def transform_row_optimized(row, mappings, product_matcher=None, cur=None):
     )
     location_pending = location_id is None
 
-    business_unit_id = resolve_business_unit(location_id)
+    business_unit_id = resolve_business_unit(location_id, org_id)
     if not business_unit_id:
         print(f"   ❌ Skipping extracted_data.id={ed_id} — could not resolve business unit.")
         return
@@ -463,7 +466,9 @@ def transform_row_optimized(row, mappings, product_matcher=None, cur=None):
             product['name'], 
             product['code'], 
             supplier_name, 
-            org_id
+            org_id,
+            pending_buffer,
+            category_cache,
         )
         category_results.append((category_id, mapping_id, category_pending))
         if category_id:
@@ -705,18 +710,34 @@ def main():
                 processed_count += 1
                 # Commit after each successful record to prevent rollback of successful records
                 conn.commit()
+                pending_buffer.commit()
                 print(f"   💾 Committed successful processing of record {row[0][:8]}...")
+            else:
+                pending_buffer.discard()
         except Exception as e:
             print(f"❌ Error processing row {row[0]}: {e}")
             print("🔄 Rolling back transaction for this record only...")
             conn.rollback()
+            pending_buffer.discard()
             # Get fresh cursor after rollback
             cur = get_cursor()
             continue
     
     print(f"✅ All rows processed. Successfully processed {processed_count} rows.")
     print("ℹ️ Note: Each successful record was committed individually to prevent rollback issues.")
-    
+
+    try:
+        pending_counts = pending_buffer.flush(cur)
+        conn.commit()
+        for kind, (variants, occurrences) in pending_counts.items():
+            print(f"📝 Pending {kind} mappings: {variants} variant(s) upserted from {occurrences} occurrence(s)")
+    except Exception as e:
+        print(f"❌ Failed to write pending mappings: {e}")
+        conn.rollback()
+
+    print(f"🗄️ {category_cache.summary()}")
+    category_cache.close()
+
     return processed_count
 
 def clean_text(text):
@@ -0,0 +1,207 @@
+#!/usr/bin/env python3
+"""
+Benchmark the ingesters against the local stub servers.
+
+  python benchmark.py                                          # both ingesters, every profile, concurrency 2,4,8
+  python benchmark.py --ingester production --profiles throttled --concurrency 4,16 --tenants 5
+  python benchmark.py --documents 100 --rate-nanonets 4 --output results.json
+
+Every run gets fresh stubs and its own working directory (a copy of the ingester with a
+generated config, its own tracker, PDF spool and cursor files), so runs never share state.
+Docs/min comes from the run's telemetry report; the stub counters show how many 429s,
+503s and hung requests the ingester had to deal with.
+
+Concurrency is --download-concurrency/--upload-concurrency for the dev ingester and
+--workers for the production one.
+"""
+
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+from pathlib import Path
+
+from stub_servers import ApiProfile, StubServers, StubState
+
+API_DIR = Path(__file__).resolve().parent.parent
+YEAR = 2025
+
+INGESTERS = {
+    "dev": API_DIR / "nanonets-ingestion",
+    "production": API_DIR / "nanonets-ingestion-production",
+}
+
+# profile -> (e-conomic, Nanonets)
+PROFILES = {
+    "baseline": (ApiProfile(latency_ms=40, jitter_ms=20), ApiProfile(latency_ms=300, jitter_ms=150)),
+    "throttled": (
+        ApiProfile(latency_ms=40, jitter_ms=20, rps=8, retry_after=1),
+        ApiProfile(latency_ms=300, jitter_ms=150, rps=2, retry_after=5),
+    ),
+    "flaky": (
+        ApiProfile(latency_ms=120, jitter_ms=100, error_rate=0.03),
+        ApiProfile(latency_ms=600, jitter_ms=400, error_rate=0.03, hang_rate=0.01, hang_seconds=35),
+    ),
+}
+
+# The dev ingester reads its settings from config.py (gitignored), so each run gets one that reads the environment
+DEV_CONFIG = """import os
+
+ECONOMIC_APP_SECRET = os.getenv("ECONOMIC_APP_SECRET")
+ECONOMIC_GRANT_TOKEN = os.getenv("ECONOMIC_GRANT_TOKEN")
+ECONOMIC_BASE_URL = os.getenv("ECONOMIC_BASE_URL")
+NANONETS_API_KEY = os.getenv("NANONETS_API_KEY")
+NANONETS_MODEL_ID = os.getenv("NANONETS_MODEL_ID")
+"""
+
+# Settings of the caller's shell that would leak into a run
+ISOLATED_ENV_PREFIXES = ("ECONOMIC_", "NANONETS_", "SUPABASE_", "TELEMETRY_", "PDF_SPOOL_", "TRACKER_DB", "RATE_LIMIT_",
+                         "INGESTION_WORKERS")
+
+
+def prepare_run_dir(ingester: str, run_dir: Path):
+    shutil.copytree(
+        INGESTERS[ingester], run_dir, dirs_exist_ok=True,
+        ignore=shutil.ignore_patterns("config.py", "*.json", "*.db*", "pdf_spool", "telemetry", "processed", "pending",
+                                      "__pycache__", "venv"),
+    )
+    if ingester == "dev":
+        (run_dir / "config.py").write_text(DEV_CONFIG)
+    else:
+        shutil.copy(INGESTERS[ingester] / "config.py", run_dir / "config.py")
+
+
+def run_environment(servers: StubServers, run_dir: Path, tenants: int, args) -> dict:
+    env = {k: v for k, v in os.environ.items() if not k.startswith(ISOLATED_ENV_PREFIXES)}
+    env.update(servers.environment())
+    env.update({
+        "ECONOMIC_APP_SECRET": "bench",
+        "ECONOMIC_GRANT_TOKEN": "tenant-1",
+        "NANONETS_API_KEY": "bench",
+        "NANONETS_MODEL_ID": "bench-model",
+        "TELEMETRY_DIR": str(run_dir / "telemetry"),
+        "PYTHONUNBUFFERED": "1",
+    })
+    for i in range(1, tenants + 1):
+        env[f"ECONOMIC_GRANT_TOKEN_T{i}"] = f"tenant-{i}"
+    if args.rate_nanonets:
+        env["RATE_LIMIT_NANONETS"] = str(args.rate_nanonets)
+    if args.rate_economic:
+        env["RATE_LIMIT_ECONOMIC"] = str(args.rate_economic)
+    return env
+
+
+def ingester_command(ingester: str, concurrency: int, documents: int, async_mode: bool):
+    async_arg = "true" if async_mode else "false"
+    if ingester == "dev":
+        return [sys.executable, "main.py", str(YEAR), str(documents), async_arg,
+                f"--download-concurrency={concurrency}", f"--upload-concurrency={concurrency}"]
+    # 0 = every listed document of every tenant
+    return [sys.executable, "main.py", str(YEAR), "0", async_arg, f"--workers={concurrency}"]
+
+
+def run_once(ingester: str, profile: str, concurrency: int, args) -> dict:
+    tenants = 1 if ingester == "dev" else args.tenants
+    economic, nanonets = PROFILES[profile]
+    state = StubState(documents=args.documents, page_size=args.page_size, pdf_kb=args.pdf_kb)
+    servers = StubServers(state, economic=economic, nanonets=nanonets).start()
+    run_dir = Path(tempfile.mkdtemp(prefix=f"bench_{ingester}_{profile}_{concurrency}_"))
+    try:
+        prepare_run_dir(ingester, run_dir)
+        started = time.perf_counter()
+        with open(run_dir / "output.log", "w") as log:
+            completed = subprocess.run(
+                ingester_command(ingester, concurrency, args.documents, not args.sync),
+                cwd=run_dir, env=run_environment(servers, run_dir, tenants, args),
+                stdout=log, stderr=subprocess.STDOUT, timeout=args.timeout,
+            )
+        elapsed = time.perf_counter() - started
+        reports = sorted((run_dir / "telemetry").glob("*.json"))
+        report = json.loads(reports[-1].read_text()) if reports else {}
+        totals = report.get("totals", {})
+        nanonets_http = report.get("http", {}).get("app.nanonets.com", {})
+        return {
+            "ingester": ingester,
+            "profile": profile,
+            "concurrency": concurrency,
+            "tenants": tenants,
+            "exit_code": completed.returncode,
+            "wall_seconds": round(elapsed, 1),
+            "docs_per_minute": report.get("docs_per_minute"),
+            "uploaded": totals.get("uploaded", 0),
+            "failed": totals.get("failed", 0),
+            "nanonets_p95_seconds": nanonets_http.get("p95_seconds"),
+            "stub": servers.stats(),
+            "log": str(run_dir / "output.log") if args.keep else None,
+        }
+    finally:
+        servers.stop()
+        if not args.keep:
+            shutil.rmtree(run_dir, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--ingester", choices=["dev", "production", "both"], default="both")
+    parser.add_argument("--profiles", default=",".join(PROFILES), help=f"comma-separated, from {', '.join(PROFILES)}")
+    parser.add_argument("--concurrency", default="2,4,8", help="comma-separated worker counts")
+    parser.add_argument("--documents", type=int, default=200, help="documents per tenant")
+    parser.add_argument("--tenants", type=int, default=3, help="restaurants for the production ingester")
+    parser.add_argument("--page-size", type=int, default=100)
+    parser.add_argument("--pdf-kb", type=int, default=120)
+    parser.add_argument("--sync", action="store_true", help="synchronous Nanonets uploads")
+    parser.add_argument("--rate-nanonets", type=float, help="starting Nanonets rate of the ingester's limiter (req/s)")
+    parser.add_argument("--rate-economic", type=float, help="starting e-conomic rate of the ingester's limiter (req/s)")
+    parser.add_argument("--timeout", type=float, default=1800, help="seconds before a run is killed")
+    parser.add_argument("--keep", action="store_true", help="keep each run's working directory and log")
+    parser.add_argument("--output", help="results JSON (default bench_results_<timestamp>.json)")
+    args = parser.parse_args()
+
+    ingesters = list(INGESTERS) if args.ingester == "both" else [args.ingester]
+    profiles = [profile.strip() for profile in args.profiles.split(",") if profile.strip()]
+    unknown = set(profiles) - set(PROFILES)
+    if unknown:
+        parser.error(f"unknown profiles: {', '.join(sorted(unknown))}")
+    concurrencies = [int(value) for value in args.concurrency.split(",")]
+
+    results = []
+    for ingester in ingesters:
+        for profile in profiles:
+            for concurrency in concurrencies:
+                print(f"🏃 {ingester} / {profile} / concurrency {concurrency}...", flush=True)
+                try:
+                    result = run_once(ingester, profile, concurrency, args)
+                except subprocess.TimeoutExpired:
+                    print(f"⏰ Killed after {args.timeout:.0f}s")
+                    continue
+                results.append(result)
+                stub = result["stub"]
+                print(f"   {result['docs_per_minute']} docs/min, {result['uploaded']} uploaded, {result['failed']} failed "
+                      f"in {result['wall_seconds']}s (exit {result['exit_code']}); stubs served "
+                      f"{stub.get('nanonets.429', 0) + stub.get('economic.429', 0)}×429, "
+                      f"{stub.get('nanonets.503', 0) + stub.get('economic.503', 0)}×503, "
+                      f"{stub.get('nanonets.hung', 0)} hung uploads")
+
+    print("\n📊 docs/min")
+    print(f"{'ingester':<12}{'profile':<12}{'concurrency':>12}{'docs/min':>12}{'failed':>8}{'p95 upload s':>14}")
+    for r in results:
+        print(f"{r['ingester']:<12}{r['profile']:<12}{r['concurrency']:>12}{r['docs_per_minute'] or 0:>12.1f}"
+              f"{r['failed']:>8}{r['nanonets_p95_seconds'] or 0:>14g}")
+
+    output = Path(args.output or f"bench_results_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json")
+    output.write_text(json.dumps({
+        "documents": args.documents,
+        "tenants": args.tenants,
+        "profiles": {name: {"economic": e.as_dict(), "nanonets": n.as_dict()} for name, (e, n) in PROFILES.items()},
+        "results": results,
+    }, indent=2))
+    print(f"💾 Results written to {output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,391 @@
+#!/usr/bin/env python3
+"""
+Local stand-ins for the APIs the ingesters call, for load tests and benchmarks.
+
+  python stub_servers.py [--documents 500] [--tenants 3] [--nanonets-rps 2 --retry-after 5] [--hang-rate 0.01]
+
+  e-conomic  GET /self
+             GET /documentsapi/v2.0.0/AttachedDocuments?filter=...&cursor=...   (cursor pagination)
+             GET /documentsapi/v2.0.0/AttachedDocuments/<number>/pdf
+  Nanonets   POST /api/v2/OCR/Model/<model id>/LabelFile/?async=true|false     (sync replies take longer)
+  Supabase   PostgREST subset used by the production tracker: GET with eq./in. filters and Range
+             headers, POST upserts (one row or an array), DELETE
+
+Every agreement grant token is a tenant with its own documents. Per API, an ApiProfile sets the
+latency, a request rate above which requests get 429 with Retry-After, the share of 503 replies,
+and the share of requests that hang past the client's read timeout.
+
+The servers print the environment that points the ingesters at them (see StubServers.environment()).
+"""
+
+import argparse
+import json
+import random
+import re
+import threading
+import time
+import zlib
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl, urlparse
+
+ECONOMIC_DOCUMENTS_PATH = "/documentsapi/v2.0.0"
+NANONETS_API_PATH = "/api/v2"
+SUPABASE_TABLE = "processed_tracker"
+TRACKER_KEY = ("document_id", "accounting_year", "organization_id")
+
+
+class ApiProfile:
+    def __init__(self, latency_ms: float = 20.0, jitter_ms: float = 10.0, rps: float = 0.0, retry_after: float = 1.0,
+                 error_rate: float = 0.0, hang_rate: float = 0.0, hang_seconds: float = 35.0):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.rps = rps  # 0 = never throttle
+        self.retry_after = retry_after
+        self.error_rate = error_rate
+        self.hang_rate = hang_rate
+        self.hang_seconds = hang_seconds
+
+    def as_dict(self) -> dict:
+        return dict(vars(self))
+
+
+class Throttle:
+    """Token bucket of the stub API; requests that find it empty get a 429."""
+
+    def __init__(self, rps: float):
+        self.rps = rps
+        self.capacity = max(rps, 1.0)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        if not self.rps:
+            return True
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rps)
+            self.updated = now
+            if self.tokens >= 1.0:
+                self.tokens -= 1.0
+                return True
+            return False
+
+
+class StubState:
+    """Documents per tenant, the tracker table and request counters, shared by the three servers."""
+
+    def __init__(self, documents: int = 500, page_size: int = 100, pdf_kb: int = 120, sync_latency_ms: float = 1500.0,
+                 seed: int = 42):
+        self.documents = documents
+        self.page_size = page_size
+        self.pdf_kb = pdf_kb
+        self.sync_latency_ms = sync_latency_ms
+        self.random = random.Random(seed)
+        self.tracker = {}
+        self.stats = Counter()
+        self._lock = threading.Lock()
+
+    def document_numbers(self, grant_token: str):
+        # Distinct, stable numbers per tenant so tenants never share document ids
+        base = (zlib.crc32(grant_token.encode()) % 900 + 100) * 100000
+        return range(base + 1, base + self.documents + 1)
+
+    def pdf(self, number: int) -> bytes:
+        # Unique bytes per document, so the content-hash dedup of the ingesters does not collapse them
+        header = f"%PDF-1.4\n% stub document {number}\n".encode()
+        return header + b"0" * max(self.pdf_kb * 1024 - len(header) - 6, 0) + b"\n%%EOF"
+
+    def count(self, key: str, n: int = 1):
+        with self._lock:
+            self.stats[key] += n
+
+    def chance(self, rate: float) -> bool:
+        if not rate:
+            return False
+        with self._lock:
+            return self.random.random() < rate
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    # Keep-alive, like the real APIs, so connection reuse in the ingesters shows up in benchmarks
+    protocol_version = "HTTP/1.1"
+    api = "stub"
+
+    @property
+    def state(self) -> StubState:
+        return self.server.state
+
+    def log_message(self, format, *args):
+        pass
+
+    def read_body(self) -> bytes:
+        length = int(self.headers.get("Content-Length") or 0)
+        return self.rfile.read(length) if length else b""
+
+    def send(self, status: int, body: bytes = b"", content_type: str = "application/json", headers: dict = None):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+        self.state.count(f"{self.api}.{status}")
+
+    def send_json(self, status: int, data, headers: dict = None):
+        self.send(status, json.dumps(data).encode(), headers=headers)
+
+    def fault(self) -> bool:
+        """Apply the API profile: latency, 429, 503 or a hang. True if the reply was already sent."""
+        profile, throttle = self.server.profile, self.server.throttle
+        self.state.count(f"{self.api}.requests")
+        if not throttle.allow():
+            self.send_json(429, {"message": "Too Many Requests"}, {"Retry-After": f"{profile.retry_after:g}"})
+            return True
+        if self.state.chance(profile.error_rate):
+            self.send_json(503, {"message": "Service Unavailable"})
+            return True
+        if self.state.chance(profile.hang_rate):
+            self.state.count(f"{self.api}.hung")
+            time.sleep(profile.hang_seconds)
+        latency = profile.latency_ms + (self.state.random.uniform(-1, 1) * profile.jitter_ms if profile.jitter_ms else 0)
+        time.sleep(max(latency, 0.0) / 1000)
+        return False
+
+    def handle_one_request(self):
+        try:
+            super().handle_one_request()
+        except (BrokenPipeError, ConnectionResetError):
+            # The client gave up on a hung request
+            self.close_connection = True
+
+
+class EconomicHandler(StubHandler):
+    api = "economic"
+    documents_re = re.compile(r"/AttachedDocuments/?$")
+    pdf_re = re.compile(r"/AttachedDocuments/(\d+)/pdf/?$")
+
+    def do_GET(self):
+        if self.fault():
+            return
+        token = self.headers.get("X-AgreementGrantToken")
+        if not token:
+            return self.send_json(401, {"message": "Missing X-AgreementGrantToken"})
+        url = urlparse(self.path)
+
+        if url.path.rstrip("/") == "/self":
+            number = zlib.crc32(token.encode()) % 900000 + 100000
+            return self.send_json(200, {"company": {"name": f"Stub {token}"}, "agreementNumber": number})
+
+        if self.documents_re.search(url.path):
+            numbers = self.state.document_numbers(token)
+            cursor = dict(parse_qsl(url.query)).get("cursor")
+            offset = int(cursor) if cursor and cursor.isdigit() else 0
+            end = offset + self.state.page_size
+            items = [{"number": number, "pageCount": 1} for number in numbers[offset:end]]
+            return self.send_json(200, {"items": items, "cursor": str(end) if end < len(numbers) else None})
+
+        match = self.pdf_re.search(url.path)
+        if match:
+            number = int(match.group(1))
+            if number not in self.state.document_numbers(token):
+                return self.send_json(404, {"message": "Document not found"})
+            self.state.count("economic.pdf_bytes", self.state.pdf_kb * 1024)
+            return self.send(200, self.state.pdf(number), "application/pdf")
+
+        self.send_json(404, {"message": "Not found"})
+
+
+class NanonetsHandler(StubHandler):
+    api = "nanonets"
+    label_file_re = re.compile(r"/OCR/Model/[^/]+/LabelFile/?$")
+
+    def do_POST(self):
+        body = self.read_body()
+        if self.fault():
+            return
+        url = urlparse(self.path)
+        if not self.label_file_re.search(url.path):
+            return self.send_json(404, {"message": "Not found"})
+        match = re.search(rb'filename="([^"]+)"', body)
+        filename = match.group(1).decode() if match else "upload.pdf"
+        async_mode = dict(parse_qsl(url.query)).get("async", "false") == "true"
+        if not async_mode:
+            time.sleep(self.state.sync_latency_ms / 1000)
+        self.state.count("nanonets.uploaded_bytes", len(body))
+        result = {"message": "Success", "input": filename, "prediction": [] if async_mode else [
+            {"label": "invoice_number", "ocr_text": filename.rsplit(".", 1)[0]},
+        ]}
+        self.send_json(200, {"message": "Success", "result": [result]})
+
+
+class SupabaseHandler(StubHandler):
+    api = "supabase"
+
+    def table_query(self):
+        url = urlparse(self.path)
+        if url.path.rstrip("/") != f"/rest/v1/{SUPABASE_TABLE}":
+            self.send_json(404, {"message": f"relation {url.path} does not exist"})
+            return None
+        filters = []
+        for column, condition in parse_qsl(url.query):
+            if column in ("select", "order"):
+                continue
+            op, _, value = condition.partition(".")
+            values = set(value.strip("()").split(",")) if op == "in" else {value}
+            filters.append((column, values))
+        return filters
+
+    def matching(self, filters):
+        return [
+            key for key, row in self.state.tracker.items()
+            if all(str(row.get(column)) in values for column, values in filters)
+        ]
+
+    def do_GET(self):
+        if self.fault():
+            return
+        filters = self.table_query()
+        if filters is None:
+            return
+        with self.server.table_lock:
+            rows = [self.state.tracker[key] for key in sorted(self.matching(filters))]
+        start, end = 0, len(rows) - 1
+        match = re.match(r"(\d+)-(\d+)", self.headers.get("Range", ""))
+        if match:
+            start, end = int(match.group(1)), int(match.group(2))
+        page = rows[start:end + 1]
+        content_range = f"{start}-{start + len(page) - 1}/{len(rows)}" if page else f"*/{len(rows)}"
+        self.send_json(200, page, {"Content-Range": content_range})
+
+    def do_POST(self):
+        body = self.read_body()
+        if self.fault():
+            return
+        if self.table_query() is None:
+            return
+        payload = json.loads(body or b"[]")
+        rows = payload if isinstance(payload, list) else [payload]
+        with self.server.table_lock:
+            for row in rows:
+                key = tuple(str(row.get(column)) for column in TRACKER_KEY)
+                self.state.tracker[key] = {**self.state.tracker.get(key, {}), **row}
+        self.send(201)
+
+    def do_DELETE(self):
+        if self.fault():
+            return
+        filters = self.table_query()
+        if filters is None:
+            return
+        with self.server.table_lock:
+            for key in self.matching(filters):
+                del self.state.tracker[key]
+        self.send(204)
+
+
+class StubServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, handler, state: StubState, profile: ApiProfile):
+        super().__init__(address, handler)
+        self.state = state
+        self.profile = profile
+        self.throttle = Throttle(profile.rps)
+        self.table_lock = threading.Lock()
+
+
+class StubServers:
+    """The three stand-in APIs on one host; port 0 picks free ports."""
+
+    def __init__(self, state: StubState, economic: ApiProfile = None, nanonets: ApiProfile = None,
+                 supabase: ApiProfile = None, host: str = "127.0.0.1", ports=(0, 0, 0)):
+        self.state = state
+        self.host = host
+        self.servers = {
+            "economic": StubServer((host, ports[0]), EconomicHandler, state, economic or ApiProfile()),
+            "nanonets": StubServer((host, ports[1]), NanonetsHandler, state, nanonets or ApiProfile(latency_ms=150)),
+            "supabase": StubServer((host, ports[2]), SupabaseHandler, state, supabase or ApiProfile(latency_ms=5)),
+        }
+        self._threads = []
+
+    def url(self, api: str) -> str:
+        return f"http://{self.host}:{self.servers[api].server_address[1]}"
+
+    def start(self):
+        for server in self.servers.values():
+            thread = threading.Thread(target=server.serve_forever, daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        return self
+
+    def stop(self):
+        for server in self.servers.values():
+            server.shutdown()
+            server.server_close()
+
+    def environment(self) -> dict:
+        """Environment variables that point both ingesters at the stubs."""
+        netloc = {api: urlparse(self.url(api)).netloc for api in self.servers}
+        return {
+            "ECONOMIC_BASE_URL": self.url("economic") + ECONOMIC_DOCUMENTS_PATH,
+            "ECONOMIC_REST_URL": self.url("economic"),
+            "NANONETS_BASE_URL": self.url("nanonets") + NANONETS_API_PATH,
+            "SUPABASE_URL": self.url("supabase"),
+            "SUPABASE_KEY": "stub",
+            # Give the stubs the timeouts and rate limits of the APIs they imitate
+            "HTTP_HOST_ALIASES": ",".join([
+                f"{netloc['economic']}=apis.e-conomic.com",
+                f"{netloc['nanonets']}=app.nanonets.com",
+                f"{netloc['supabase']}=stub.supabase.co",
+            ]),
+        }
+
+    def stats(self) -> dict:
+        return dict(self.state.stats)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--ports", default="8301,8302,8303", help="e-conomic, Nanonets and Supabase ports")
+    parser.add_argument("--documents", type=int, default=500, help="documents per tenant")
+    parser.add_argument("--page-size", type=int, default=100)
+    parser.add_argument("--pdf-kb", type=int, default=120)
+    parser.add_argument("--economic-latency-ms", type=float, default=40.0)
+    parser.add_argument("--economic-rps", type=float, default=0.0, help="429 above this rate (0 = never)")
+    parser.add_argument("--nanonets-latency-ms", type=float, default=300.0)
+    parser.add_argument("--nanonets-sync-latency-ms", type=float, default=1500.0)
+    parser.add_argument("--nanonets-rps", type=float, default=0.0, help="429 above this rate (0 = never)")
+    parser.add_argument("--retry-after", type=float, default=2.0, help="Retry-After seconds on 429")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="share of 503 replies (both APIs)")
+    parser.add_argument("--hang-rate", type=float, default=0.0, help="share of Nanonets uploads that hang")
+    parser.add_argument("--hang-seconds", type=float, default=35.0)
+    args = parser.parse_args()
+
+    state = StubState(args.documents, args.page_size, args.pdf_kb, args.nanonets_sync_latency_ms)
+    servers = StubServers(
+        state,
+        economic=ApiProfile(args.economic_latency_ms, args.economic_latency_ms / 2, args.economic_rps, args.retry_after,
+                            args.error_rate),
+        nanonets=ApiProfile(args.nanonets_latency_ms, args.nanonets_latency_ms / 2, args.nanonets_rps, args.retry_after,
+                            args.error_rate, args.hang_rate, args.hang_seconds),
+        host=args.host,
+        ports=[int(port) for port in args.ports.split(",")],
+    ).start()
+    print("🧪 Stub servers running. Point the ingesters at them with:")
+    for name, value in servers.environment().items():
+        print(f"export {name}='{value}'")
+    try:
+        while True:
+            time.sleep(60)
+            print(f"📊 {servers.stats()}")
+    except KeyboardInterrupt:
+        servers.stop()
+        print(f"🛑 Stopped. {servers.stats()}")
+
+
+if __name__ == "__main__":
+    main()
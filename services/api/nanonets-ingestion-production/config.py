@@ -3,11 +3,22 @@ import os
 # e-conomic
 ECONOMIC_APP_SECRET = os.getenv('ECONOMIC_APP_SECRET')
 ECONOMIC_BASE_URL = os.getenv('ECONOMIC_BASE_URL', 'https://apis.e-conomic.com/documentsapi/v2.0.0')
+ECONOMIC_REST_URL = os.getenv('ECONOMIC_REST_URL', 'https://restapi.e-conomic.com')
 
 # Nanonets
 NANONETS_API_KEY = os.getenv('NANONETS_API_KEY')
 NANONETS_MODEL_ID = os.getenv('NANONETS_MODEL_ID')
+NANONETS_BASE_URL = os.getenv('NANONETS_BASE_URL', 'https://app.nanonets.com/api/v2')
 
 def get_grant_tokens():
     # Collect all ECONOMIC_GRANT_TOKEN_X from environment
-    return [v for k, v in os.environ.items() if k.startswith('ECONOMIC_GRANT_TOKEN_')] 
\ No newline at end of file
+    return [v for k, v in os.environ.items() if k.startswith('ECONOMIC_GRANT_TOKEN_')]
+
+def get_tenants():
+    # (name, grant token, weight) per ECONOMIC_GRANT_TOKEN_X; optional ECONOMIC_TENANT_WEIGHT_X
+    # gives a restaurant a larger share of the upload workers (default 1)
+    prefix = 'ECONOMIC_GRANT_TOKEN_'
+    return [
+        (k[len(prefix):], v, float(os.getenv(f'ECONOMIC_TENANT_WEIGHT_{k[len(prefix):]}', '1')))
+        for k, v in sorted(os.environ.items()) if k.startswith(prefix)
+    ] 
\ No newline at end of file
@@ -1,8 +1,10 @@
 import json
 import requests
+import http_transport
 import time
 from pathlib import Path
 from config import ECONOMIC_APP_SECRET, ECONOMIC_BASE_URL, get_grant_tokens
+from rate_limiter import limiter_for
 
 def get_cursor_file(org):
     return Path(f"cursor_state_{org}.json")
@@ -24,53 +26,59 @@ def save_cursor(cursor, org):
     CURSOR_FILE = get_cursor_file(org)
     CURSOR_FILE.write_text(json.dumps({"cursor": cursor}, indent=2))
 
-def safe_get(url, headers, retries=3, backoff_factor=0.5, timeout=10):
+def safe_get(url, headers, retries=3, backoff_factor=0.5, timeout=None):
+    # Pacing and 429 backoff are shared by all workers through the host's rate limiter
+    # timeout=None uses the transport's per-host timeouts
+    limiter = limiter_for(url)
     for attempt in range(retries):
+        limiter.acquire()
         try:
-            response = requests.get(url, headers=headers, timeout=timeout)
-            if response.status_code in (502, 503, 429):
+            response = http_transport.get(url, headers=headers, timeout=timeout)
+            if response.status_code == 429:
+                limiter.on_throttle(response.headers.get("Retry-After"))
+                print(f"⚠️ Retry {attempt+1}: throttled, e-conomic rate now {limiter.rate:.2f} req/s")
+                continue
+            if response.status_code in (502, 503):
+                limiter.on_server_error()
                 wait = backoff_factor * (2 ** attempt)
                 print(f"⚠️ Retry {attempt+1} after {wait:.1f}s (Status: {response.status_code})")
                 time.sleep(wait)
                 continue
             response.raise_for_status()
+            limiter.on_success()
             return response
         except requests.exceptions.RequestException as e:
             print(f"⚠️ Error on attempt {attempt+1}: {e}")
             time.sleep(backoff_factor * (2 ** attempt))
     raise Exception(f"❌ Failed to GET {url} after {retries} attempts.")
 
-def get_document_ids(year: int, limit: int, grant_token: str, org: str, resume: bool = True):
+def iter_document_pages(year: int, grant_token: str, org: str, resume: bool = True):
+    """
+    Yield (document numbers, next cursor) per page of AttachedDocuments, one request at a time.
+
+    The cursor is not saved here: the caller checkpoints it with save_cursor() once the
+    page's documents are tracked, so a crash never skips documents that were not handled.
+    """
     headers = {
         'X-AppSecretToken': ECONOMIC_APP_SECRET,
         'X-AgreementGrantToken': grant_token,
     }
-    document_ids = []
     cursor = load_cursor(org) if resume else None
     seen_cursors = set()
-    while len(document_ids) < limit:
+    while True:
         if cursor:
             if cursor in seen_cursors:
                 print("⚠️ Cursor repeated — breaking to prevent infinite loop.")
-                break
+                return
             seen_cursors.add(cursor)
             url = f"{ECONOMIC_BASE_URL}/AttachedDocuments?filter=accountingYear$eq:{year}&cursor={cursor}"
         else:
             url = f"{ECONOMIC_BASE_URL}/AttachedDocuments?filter=accountingYear$eq:{year}"
-        response = safe_get(url, headers)
-        data = response.json()
-        for item in data.get("items", []):
-            document_ids.append(item["number"])
-            if len(document_ids) >= limit:
-                break
+        data = safe_get(url, headers).json()
         cursor = data.get("cursor")
-        if cursor:
-            save_cursor(cursor, org)
-        print(f"📥 Total so far: {len(document_ids)}. Next cursor: {cursor}")
-        time.sleep(0.5)
+        yield [item["number"] for item in data.get("items", [])], cursor
         if not cursor:
-            break
-    return document_ids
+            return
 
 def fetch_pdf_economic(document_id: int, grant_token: str):
     url = f"{ECONOMIC_BASE_URL}/AttachedDocuments/{document_id}/pdf"
@@ -79,5 +87,4 @@ def fetch_pdf_economic(document_id: int, grant_token: str):
         'X-AgreementGrantToken': grant_token,
     }
     response = safe_get(url, headers)
-    time.sleep(0.5)
     return response.content 
\ No newline at end of file
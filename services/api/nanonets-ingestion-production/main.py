@@ -1,74 +1,161 @@
-from economic_client import get_document_ids, fetch_pdf_economic
+from economic_client import iter_document_pages, fetch_pdf_economic, save_cursor
 from nanonets_client import send_pdf_to_nanonets
+from pdf_spool import get_spool
 from processed_tracker import (
-    has_been_processed,
-    is_pending,
-    save_pending_entry,
+    save_pending_entries,
+    new_document_ids,
     remove_pending_entry,
     save_processed_entry,
     get_agreement_identifier,
     mark_failed_entry,
-    load_pending_entries,
-    load_processed_entries,
+    load_entries,
 )
-from config import get_grant_tokens
-import time
+from config import get_tenants
+from tenant_scheduler import FairScheduler, Tenant
+from telemetry import RunTelemetry
+import http_transport
+import rate_limiter
+import os
 import sys
+import threading
+import time
 
-def initialize_pending_entries(grant_token, year, org_id):
-    # Fetch all document_ids for the year and insert as 'pending' if not present
-    document_ids = get_document_ids(year, 10000, grant_token, org_id)  # Large limit to get all
-    processed = {e['document_id'] for e in load_processed_entries(org_id)}
-    pending = {e['document_id'] for e in load_pending_entries(org_id)}
-    for doc_id in document_ids:
-        if doc_id not in processed and doc_id not in pending:
-            save_pending_entry(year, doc_id, filename=f"{doc_id}.pdf", org_id=org_id)
+DEFAULT_WORKERS = int(os.getenv("INGESTION_WORKERS", "4"))
+REPORT_INTERVAL = 60.0
 
 def process_document(doc_id, year, async_flag, grant_token, org_id):
+    """Returns (outcome, PDF size in bytes or 0 if it never got downloaded)."""
     filename = f"{doc_id}.pdf"
+    nbytes = 0
     try:
-        pdf_data = fetch_pdf_economic(doc_id, grant_token)
+        # Leftover pending documents were usually downloaded already: read them from the spool
+        pdf_data = get_spool().fetch(org_id, doc_id, lambda document_id: fetch_pdf_economic(document_id, grant_token))
+        nbytes = len(pdf_data)
         result = send_pdf_to_nanonets(pdf_data, filename=filename, async_mode=async_flag)
         if result.get("message") in ("Success", "TimeoutAssumedSuccess"):
             print(f"✅ Success for {doc_id} (including assumed)")
             save_processed_entry(year, doc_id, filename, org_id)
-        else:
-            print(f"❌ Upload failed for {doc_id}")
-            mark_failed_entry(year, doc_id, filename, org_id)
+            return "processed", nbytes
+        print(f"❌ Upload failed for {doc_id}")
+        mark_failed_entry(year, doc_id, filename, org_id)
     except Exception as e:
         print(f"💥 Exception for {doc_id}: {e}")
         mark_failed_entry(year, doc_id, filename, org_id)
     finally:
         remove_pending_entry(year, doc_id, org_id)
-        time.sleep(0.3)
+    return "failed", nbytes
+
+def list_for_restaurant(tenant, scheduler, year, limit):
+    """Queue up to `limit` documents of one restaurant: leftover pending entries first, then new pages."""
+    try:
+        org_id = tenant.org_id = get_agreement_identifier(tenant.grant_token)
+        entries = load_entries(org_id, ("processed", "pending"))
+        pending = [e['document_id'] for e in entries if e['status'] == 'pending']
+        known = {e['document_id'] for e in entries}
+        queued = 0
+
+        # Documents left pending by an earlier run go first
+        for doc_id in pending:
+            if limit and queued >= limit:
+                return
+            scheduler.put(tenant, doc_id)
+            queued += 1
+
+        # Then list page by page. A page's new documents are saved as pending before its
+        # cursor is checkpointed, so a crash never skips any.
+        for document_ids, cursor in iter_document_pages(year, tenant.grant_token, org_id):
+            new_ids = new_document_ids(document_ids, known)
+            save_pending_entries(year, new_ids, org_id)
+            known.update(new_ids)
+            if cursor:
+                save_cursor(cursor, org_id)
+            print(f"📥 {org_id}: page listed, {len(document_ids)} documents, {len(new_ids)} new. Next cursor: {cursor}")
+            for doc_id in new_ids:
+                if limit and queued >= limit:
+                    return
+                scheduler.put(tenant, doc_id)
+                queued += 1
+    except Exception as e:
+        print(f"💥 Listing failed for {tenant.org_id or tenant.name}: {e}")
+    finally:
+        scheduler.finish_listing(tenant)
+
+def upload_worker(scheduler, year, async_flag):
+    while True:
+        item = scheduler.next()
+        if item is None:
+            return
+        tenant, doc_id = item
+        try:
+            tenant.record(*process_document(doc_id, year, async_flag, tenant.grant_token, tenant.org_id))
+        except Exception as e:
+            # e.g. the tracker update in process_document's finally failed: count the document
+            # as failed and keep the worker alive, or listers block in put() and join() hangs
+            print(f"💥 Worker error for {doc_id} ({tenant.org_id or tenant.name}): {e}")
+            tenant.record("failed")
+        finally:
+            scheduler.task_done(tenant)
+
+def report(tenants, stop):
+    while not stop.wait(REPORT_INTERVAL):
+        print("📊 Progress:\n" + "\n".join(f"   {tenant.summary()}" for tenant in tenants))
 
-def ingest_for_restaurant(grant_token, year, limit, async_flag):
-    org_id = get_agreement_identifier(grant_token)
-    initialize_pending_entries(grant_token, year, org_id)
-    # Get all pending or failed entries
-    pending_entries = [e for e in load_pending_entries(org_id)]
-    failed_entries = []  # Optionally, you can add a function to load failed entries from Supabase
-    to_process = pending_entries + failed_entries
-    if limit:
-        to_process = to_process[:limit]
-    for entry in to_process:
-        doc_id = entry['document_id']
-        process_document(doc_id, year, async_flag, grant_token, org_id)
+def get_int_option(name, default):
+    for arg in sys.argv:
+        if arg.startswith(f"{name}="):
+            return int(arg.split("=", 1)[1])
+    return default
 
 def main():
     if len(sys.argv) < 3:
-        print("Usage: python main.py <ACCOUNTING_YEAR> <NUM_DOCUMENTS> [async: true|false]")
+        print("Usage: python main.py <ACCOUNTING_YEAR> <NUM_DOCUMENTS> [async: true|false] [--workers=N]")
         sys.exit(1)
     year = int(sys.argv[1])
     limit = int(sys.argv[2])
     async_flag = True
     if len(sys.argv) >= 4 and sys.argv[3].lower() in ("true", "false"):
         async_flag = sys.argv[3].lower() == "true"
-    grant_tokens = get_grant_tokens()
-    for grant_token in grant_tokens:
-        print(f"\n🚀 Processing restaurant with token: {grant_token[:8]}...\n")
-        ingest_for_restaurant(grant_token, year, limit, async_flag)
-        time.sleep(60)  # Wait 1 minute between restaurants
+    workers = get_int_option("--workers", DEFAULT_WORKERS)
+
+    # All restaurants run at once. The per-host rate limiters are process-wide, so they are
+    # one global e-conomic / Nanonets budget shared by every tenant.
+    tenants = [Tenant(name, grant_token, weight) for name, grant_token, weight in get_tenants()]
+    scheduler = FairScheduler(tenants)
+    # Upload workers and listing threads share the pooled connections per host
+    http_transport.configure(workers + len(tenants))
+    telemetry = RunTelemetry("production")
+    print(f"🚀 Processing {len(tenants)} restaurants, up to {limit or 'all'} documents each, with {workers} upload workers")
+    started = time.perf_counter()
+
+    listers = [
+        threading.Thread(target=list_for_restaurant, args=(tenant, scheduler, year, limit), daemon=True)
+        for tenant in tenants
+    ]
+    uploaders = [
+        threading.Thread(target=upload_worker, args=(scheduler, year, async_flag), daemon=True)
+        for _ in range(workers)
+    ]
+    stop_reporting = threading.Event()
+    reporter = threading.Thread(target=report, args=(tenants, stop_reporting), daemon=True)
+    for thread in listers + uploaders + [reporter]:
+        thread.start()
+    for thread in listers + uploaders:
+        thread.join()
+    stop_reporting.set()
+
+    processed = sum(tenant.processed for tenant in tenants)
+    failed = sum(tenant.failed for tenant in tenants)
+    elapsed = time.perf_counter() - started
+    print(f"\n🏁 Done in {elapsed:.0f}s: {processed} processed, {failed} failed "
+          f"({60.0 * (processed + failed) / elapsed if elapsed else 0:.1f} docs/min)")
+    for tenant in tenants:
+        print(f"   {tenant.summary()}")
+    print(get_spool().summary())
+    print(rate_limiter.summary())
+    print(http_transport.summary())
+    for tenant in tenants:
+        telemetry.set_tenant(tenant.org_id or tenant.name, tenant.counters())
+    telemetry.write()
 
 if __name__ == "__main__":
-    main() 
\ No newline at end of file
+    main()
@@ -1,6 +1,8 @@
 import requests
+import http_transport
 import time
-from config import NANONETS_API_KEY, NANONETS_MODEL_ID
+from config import NANONETS_API_KEY, NANONETS_MODEL_ID, NANONETS_BASE_URL
+from rate_limiter import limiter_for
 
 def send_pdf_to_nanonets(pdf_data: bytes, filename: str, async_mode: bool = True, retries: int = 5, delay: float = 30.0):
     """
@@ -11,48 +13,47 @@ def send_pdf_to_nanonets(pdf_data: bytes, filename: str, async_mode: bool = True
         filename: Name of the file
         async_mode: Whether to use async processing
         retries: Maximum number of retry attempts
-        delay: Initial delay in seconds (will be exponentially increased)
+        delay: Initial delay in seconds after a connection error (will be exponentially increased)
+
+    Requests are paced by the shared Nanonets rate limiter: a 429 lowers the rate
+    and holds every worker until Retry-After has passed, instead of sleeping here.
     """
     async_str = "true" if async_mode else "false"
-    url = f'https://app.nanonets.com/api/v2/OCR/Model/{NANONETS_MODEL_ID}/LabelFile/?async={async_str}'
+    url = f'{NANONETS_BASE_URL}/OCR/Model/{NANONETS_MODEL_ID}/LabelFile/?async={async_str}'
 
     files = {
         'file': (filename, pdf_data, 'application/pdf')
     }
 
+    limiter = limiter_for(url)
     for attempt in range(retries):
+        limiter.acquire()
         try:
-            response = requests.post(
+            response = http_transport.post(
                 url,
                 auth=requests.auth.HTTPBasicAuth(NANONETS_API_KEY, ''),
                 files=files,
-                timeout=30
             )
 
-            # Handle rate limiting (429) with exponential backoff
+            # Rate limiting (429): the limiter halves the rate and blocks all workers for Retry-After
             if response.status_code == 429:
+                limiter.on_throttle(response.headers.get("Retry-After"))
                 if attempt == retries - 1:
                     raise Exception(f"Rate limit exceeded after {retries} retries for {filename}")
-                
-                # Exponential backoff: 30s, 60s, 120s, 240s, 480s
-                wait_time = delay * (2 ** attempt)
-                print(f"⚠️ Rate limit hit for {filename}. Retrying after {wait_time:.1f}s (attempt {attempt + 1}/{retries})")
-                time.sleep(wait_time)
+                print(f"⚠️ Rate limit hit for {filename}. Nanonets rate now {limiter.rate:.2f} req/s (attempt {attempt + 1}/{retries})")
                 continue
 
             # Handle other server errors (502, 503) with shorter delays
             if response.status_code in (502, 503):
+                limiter.on_server_error()
                 wait_time = 5 * (2 ** attempt)  # 5s, 10s, 20s, 40s, 80s
                 print(f"⚠️ Server error {response.status_code} for {filename}. Retrying after {wait_time:.1f}s (attempt {attempt + 1}/{retries})")
                 time.sleep(wait_time)
                 continue
 
             response.raise_for_status()
-            
-            # Small delay between successful requests to avoid hitting rate limits
-            if attempt > 0:
-                time.sleep(1)
-                
+            limiter.on_success()
+
             print(f"✅ Upload succeeded for {filename} on attempt {attempt + 1}")
             return response.json()
 
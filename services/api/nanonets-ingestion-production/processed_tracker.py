@@ -1,7 +1,7 @@
 import json
-import requests
+import http_transport
 from pathlib import Path
-from config import ECONOMIC_APP_SECRET
+from config import ECONOMIC_APP_SECRET, ECONOMIC_REST_URL
 import os
 from datetime import datetime
 
@@ -21,13 +21,19 @@ HEADERS = {
     'Content-Type': 'application/json',
 }
 
+# PostgREST caps rows per response (1000 by default): loads page with Range headers,
+# bulk writes send arrays of at most UPSERT_CHUNK_SIZE rows per request
+PAGE_SIZE = 1000
+UPSERT_CHUNK_SIZE = 500
+ENTRY_COLUMNS = "document_id,accounting_year,organization_id,filename,status"
+
 def get_agreement_identifier(grant_token) -> str:
-    url = "https://restapi.e-conomic.com/self"
+    url = f"{ECONOMIC_REST_URL}/self"
     headers = {
         'X-AppSecretToken': ECONOMIC_APP_SECRET,
         'X-AgreementGrantToken': grant_token
     }
-    response = requests.get(url, headers=headers, timeout=10)
+    response = http_transport.get(url, headers=headers, timeout=10)
     response.raise_for_status()
     data = response.json()
     name = data.get("company", {}).get("name", "").replace(" ", "_")
@@ -48,17 +54,28 @@ def load_json(file_path: Path):
 def save_json(data, file_path: Path):
     file_path.write_text(json.dumps(sorted(data, key=lambda x: x["key"]), indent=2))
 
+def fetch_all(query: str):
+    """Every row matching a PostgREST query, fetched PAGE_SIZE rows at a time with Range headers."""
+    url = f"{SUPABASE_URL}/rest/v1/{SUPABASE_TABLE}?{query}&select={ENTRY_COLUMNS}&order=document_id.asc,accounting_year.asc"
+    rows = []
+    while True:
+        headers = {**HEADERS, 'Range-Unit': 'items', 'Range': f"{len(rows)}-{len(rows) + PAGE_SIZE - 1}"}
+        r = http_transport.get(url, headers=headers)
+        r.raise_for_status()
+        page = r.json()
+        rows.extend(page)
+        if len(page) < PAGE_SIZE:
+            return rows
+
 def load_processed_entries(org_id):
-    url = f"{SUPABASE_URL}/rest/v1/{SUPABASE_TABLE}?organization_id=eq.{org_id}&status=eq.processed"
-    r = requests.get(url, headers=HEADERS)
-    r.raise_for_status()
-    return r.json()
+    return fetch_all(f"organization_id=eq.{org_id}&status=eq.processed")
 
 def load_pending_entries(org_id):
-    url = f"{SUPABASE_URL}/rest/v1/{SUPABASE_TABLE}?organization_id=eq.{org_id}&status=eq.pending"
-    r = requests.get(url, headers=HEADERS)
-    r.raise_for_status()
-    return r.json()
+    return fetch_all(f"organization_id=eq.{org_id}&status=eq.pending")
+
+def load_entries(org_id, statuses=("processed", "pending")):
+    """Entries in any of `statuses` with a single paginated query."""
+    return fetch_all(f"organization_id=eq.{org_id}&status=in.({','.join(statuses)})")
 
 def save_processed_entry(year: int, document_id: int, filename: str, org_id):
     url = f"{SUPABASE_URL}/rest/v1/{SUPABASE_TABLE}"
@@ -71,7 +88,7 @@ def save_processed_entry(year: int, document_id: int, filename: str, org_id):
         "updated_at": datetime.utcnow().isoformat() + 'Z',
     }
     # Upsert (insert or update)
-    r = requests.post(url, headers={**HEADERS, 'Prefer': 'resolution=merge-duplicates'}, json=payload)
+    r = http_transport.post(url, headers={**HEADERS, 'Prefer': 'resolution=merge-duplicates'}, json=payload)
     r.raise_for_status()
 
 def save_pending_entry(year: int, document_id: int, filename: str, org_id):
@@ -84,24 +101,57 @@ def save_pending_entry(year: int, document_id: int, filename: str, org_id):
         "status": "pending",
         "updated_at": datetime.utcnow().isoformat() + 'Z',
     }
-    r = requests.post(url, headers={**HEADERS, 'Prefer': 'resolution=merge-duplicates'}, json=payload)
+    r = http_transport.post(url, headers={**HEADERS, 'Prefer': 'resolution=merge-duplicates'}, json=payload)
     r.raise_for_status()
 
+def save_pending_entries(year: int, document_ids, org_id):
+    """Upsert many documents as pending, UPSERT_CHUNK_SIZE per request. Returns the number of requests made."""
+    url = f"{SUPABASE_URL}/rest/v1/{SUPABASE_TABLE}"
+    headers = {**HEADERS, 'Prefer': 'resolution=merge-duplicates,return=minimal'}
+    now = datetime.utcnow().isoformat() + 'Z'
+    payload = [
+        {
+            "document_id": document_id,
+            "accounting_year": year,
+            "organization_id": org_id,
+            "filename": f"{document_id}.pdf",
+            "status": "pending",
+            "updated_at": now,
+        }
+        for document_id in document_ids
+    ]
+    requests_made = 0
+    for start in range(0, len(payload), UPSERT_CHUNK_SIZE):
+        r = http_transport.post(url, headers=headers, json=payload[start:start + UPSERT_CHUNK_SIZE])
+        r.raise_for_status()
+        requests_made += 1
+    return requests_made
+
+def new_document_ids(document_ids, known_ids):
+    """Listed documents not tracked yet, in listing order (set difference done in memory)."""
+    seen = set(known_ids)
+    new_ids = []
+    for document_id in document_ids:
+        if document_id not in seen:
+            seen.add(document_id)
+            new_ids.append(document_id)
+    return new_ids
+
 def remove_pending_entry(year: int, document_id: int, org_id):
     url = f"{SUPABASE_URL}/rest/v1/{SUPABASE_TABLE}?document_id=eq.{document_id}&accounting_year=eq.{year}&organization_id=eq.{org_id}&status=eq.pending"
-    r = requests.delete(url, headers=HEADERS)
+    r = http_transport.delete(url, headers=HEADERS)
     r.raise_for_status()
 
 def has_been_processed(year: int, document_id: int, org_id) -> bool:
     url = f"{SUPABASE_URL}/rest/v1/{SUPABASE_TABLE}?document_id=eq.{document_id}&accounting_year=eq.{year}&organization_id=eq.{org_id}&status=eq.processed"
-    r = requests.get(url, headers=HEADERS)
+    r = http_transport.get(url, headers=HEADERS)
     r.raise_for_status()
     data = r.json()
     return len(data) > 0
 
 def is_pending(year: int, document_id: int, org_id) -> bool:
     url = f"{SUPABASE_URL}/rest/v1/{SUPABASE_TABLE}?document_id=eq.{document_id}&accounting_year=eq.{year}&organization_id=eq.{org_id}&status=eq.pending"
-    r = requests.get(url, headers=HEADERS)
+    r = http_transport.get(url, headers=HEADERS)
     r.raise_for_status()
     data = r.json()
     return len(data) > 0
@@ -119,5 +169,5 @@ def mark_failed_entry(year: int, document_id: int, filename: str, org_id: str):
         "status": "failed",
         "updated_at": datetime.utcnow().isoformat() + 'Z',
     }
-    r = requests.post(url, headers={**HEADERS, 'Prefer': 'resolution=merge-duplicates'}, json=payload)
+    r = http_transport.post(url, headers={**HEADERS, 'Prefer': 'resolution=merge-duplicates'}, json=payload)
     r.raise_for_status() 
\ No newline at end of file
@@ -0,0 +1,188 @@
+"""
+Process-wide adaptive rate limiting per API host.
+
+Every request to a host first takes a token from that host's bucket (acquire() in
+threads, await acquire_async() in asyncio code). The bucket refills at the current
+rate, which follows AIMD on the responses reported back:
+
+  on_success()         rate += increase, up to max_rate
+  on_throttle(after)   rate *= 0.5, and every caller waits out Retry-After (or the penalty)
+  on_server_error()    rate *= 0.75
+
+So one 429 slows down all workers hitting that host instead of stalling the one
+that got it. Starting rates can be overridden with RATE_LIMIT_NANONETS / RATE_LIMIT_ECONOMIC
+(requests per second).
+"""
+
+import asyncio
+import os
+import threading
+import time
+from email.utils import parsedate_to_datetime
+from typing import Dict, Optional
+
+from http_transport import host_of
+
+# host suffix -> (env var, start rate, min rate, max rate, burst, throttle penalty seconds)
+HOST_DEFAULTS = {
+    "nanonets.com": ("RATE_LIMIT_NANONETS", 1.0, 0.05, 4.0, 2, 15.0),
+    "e-conomic.com": ("RATE_LIMIT_ECONOMIC", 4.0, 0.2, 10.0, 4, 2.0),
+}
+GENERIC_DEFAULTS = (None, 2.0, 0.1, 10.0, 2, 2.0)
+
+# Don't halve again for throttles that were already in flight when the rate was cut
+DECREASE_COOLDOWN = 1.0
+
+
+def parse_retry_after(value) -> Optional[float]:
+    """Seconds to wait from a Retry-After header (delta-seconds or HTTP date)."""
+    if value is None:
+        return None
+    value = str(value).strip()
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+    try:
+        return max(parsedate_to_datetime(value).timestamp() - time.time(), 0.0)
+    except (TypeError, ValueError):
+        return None
+
+
+class AdaptiveRateLimiter:
+    def __init__(self, name: str, rate: float, min_rate: float, max_rate: float, burst: int = 1,
+                 throttle_penalty: float = 2.0, increase: float = 0.05,
+                 throttle_decrease: float = 0.5, error_decrease: float = 0.75):
+        self.name = name
+        self.rate = rate
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.burst = burst
+        self.throttle_penalty = throttle_penalty
+        self.increase = increase
+        self.throttle_decrease = throttle_decrease
+        self.error_decrease = error_decrease
+
+        self._lock = threading.Lock()
+        self._tokens = float(burst)
+        self._last_refill = time.monotonic()
+        self._blocked_until = 0.0
+        self._last_decrease = 0.0
+        self.stats = {
+            "acquired": 0,
+            "waited_seconds": 0.0,
+            "throttled_seconds": 0.0,
+            "successes": 0,
+            "throttled": 0,
+            "server_errors": 0,
+            "retry_after_waits": 0,
+        }
+
+    def _reserve(self) -> float:
+        """Take a token if one is available now; otherwise return how long to wait before trying again."""
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._last_refill) * self.rate)
+            self._last_refill = now
+            if now < self._blocked_until:
+                # Counted once per throttle window in on_throttle(), not per waiting caller
+                return self._blocked_until - now
+            if self._tokens >= 1.0:
+                self._tokens -= 1.0
+                self.stats["acquired"] += 1
+                return 0.0
+            wait = (1.0 - self._tokens) / self.rate
+            self.stats["waited_seconds"] += wait
+            return wait
+
+    def acquire(self):
+        while True:
+            wait = self._reserve()
+            if wait <= 0:
+                return
+            time.sleep(wait)
+
+    async def acquire_async(self):
+        while True:
+            wait = self._reserve()
+            if wait <= 0:
+                return
+            await asyncio.sleep(wait)
+
+    def on_success(self):
+        with self._lock:
+            self.stats["successes"] += 1
+            self.rate = min(self.max_rate, self.rate + self.increase)
+
+    def _decrease(self, factor: float):
+        now = time.monotonic()
+        if now - self._last_decrease >= DECREASE_COOLDOWN:
+            self.rate = max(self.min_rate, self.rate * factor)
+            self._last_decrease = now
+            self._tokens = min(self._tokens, 0.0)
+
+    def on_throttle(self, retry_after=None):
+        """429: cut the rate and hold every caller until Retry-After (or the penalty) has passed."""
+        wait = parse_retry_after(retry_after)
+        with self._lock:
+            self.stats["throttled"] += 1
+            if wait is not None:
+                self.stats["retry_after_waits"] += 1
+            else:
+                wait = self.throttle_penalty
+            now = time.monotonic()
+            until = now + wait
+            if until > self._blocked_until:
+                # Wall-clock time the host is blocked: only the part not already covered by an earlier throttle
+                self.stats["throttled_seconds"] += until - max(self._blocked_until, now)
+                self._blocked_until = until
+            self._decrease(self.throttle_decrease)
+
+    def on_server_error(self):
+        with self._lock:
+            self.stats["server_errors"] += 1
+            self._decrease(self.error_decrease)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {"host": self.name, "rate": round(self.rate, 3), **self.stats}
+
+    def summary(self) -> str:
+        s = self.snapshot()
+        return (f"{s['host']}: {s['rate']:.2f} req/s, {s['acquired']} requests, {s['throttled']} throttled "
+                f"({s['retry_after_waits']} with Retry-After), {s['server_errors']} server errors, "
+                f"{s['waited_seconds']:.1f}s waited")
+
+
+_limiters: Dict[str, AdaptiveRateLimiter] = {}
+_registry_lock = threading.Lock()
+
+
+def limiter_for(url_or_host: str) -> AdaptiveRateLimiter:
+    """The shared limiter for the URL's host, created with that host's defaults on first use."""
+    host = host_of(url_or_host) if "://" in url_or_host else url_or_host.lower()
+    with _registry_lock:
+        limiter = _limiters.get(host)
+        if limiter is None:
+            env_var, rate, min_rate, max_rate, burst, penalty = next(
+                (defaults for suffix, defaults in HOST_DEFAULTS.items() if host.endswith(suffix)),
+                GENERIC_DEFAULTS,
+            )
+            if env_var and os.getenv(env_var):
+                rate = float(os.getenv(env_var))
+                max_rate = max(max_rate, rate)
+            limiter = AdaptiveRateLimiter(host, rate, min_rate, max_rate, burst, penalty)
+            _limiters[host] = limiter
+        return limiter
+
+
+def all_stats() -> Dict[str, dict]:
+    with _registry_lock:
+        limiters = list(_limiters.values())
+    return {limiter.name: limiter.snapshot() for limiter in limiters}
+
+
+def summary() -> str:
+    with _registry_lock:
+        limiters = list(_limiters.values())
+    return "\n".join(f"🚦 {limiter.summary()}" for limiter in limiters) or "🚦 No rate-limited requests"
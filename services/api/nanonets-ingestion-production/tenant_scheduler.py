@@ -0,0 +1,120 @@
+"""
+Fair scheduling of documents from several restaurants (tenants) over one worker pool.
+
+Each tenant has a listing thread that puts its document ids into a small backlog.
+Workers take the next document with smooth weighted round-robin over the tenants
+that have work queued: a tenant with weight 2 gets two documents for every one of a
+weight-1 tenant, interleaved, and a large tenant can never hold up the others.
+"""
+
+import threading
+import time
+from collections import deque
+
+DEFAULT_MAX_BACKLOG = 50
+
+
+class Tenant:
+    def __init__(self, name: str, grant_token: str, weight: float = 1.0):
+        self.name = name
+        self.grant_token = grant_token
+        self.weight = weight
+        self.org_id = None
+        self.backlog = deque()
+        self.listing_done = False
+
+        self._lock = threading.Lock()
+        self.started = None
+        self.finished = None
+        self.queued = 0
+        self.processed = 0
+        self.failed = 0
+        self.downloaded = 0
+        self.bytes_downloaded = 0
+        self.bytes_uploaded = 0
+
+    def record(self, outcome: str, nbytes: int = 0):
+        with self._lock:
+            if nbytes:
+                self.downloaded += 1
+                self.bytes_downloaded += nbytes
+            if outcome == "processed":
+                self.processed += 1
+                self.bytes_uploaded += nbytes
+            else:
+                self.failed += 1
+
+    def counters(self) -> dict:
+        with self._lock:
+            return {
+                "listed": self.queued,
+                "downloaded": self.downloaded,
+                "uploaded": self.processed,
+                "failed": self.failed,
+                "bytes_downloaded": self.bytes_downloaded,
+                "bytes_uploaded": self.bytes_uploaded,
+            }
+
+    def summary(self) -> str:
+        with self._lock:
+            done = self.processed + self.failed
+            end = self.finished or time.perf_counter()
+            elapsed = end - self.started if self.started else 0.0
+            rate = 60.0 * done / elapsed if elapsed else 0.0
+            state = "done" if self.finished else ("listing" if not self.listing_done else "uploading")
+            return (f"{self.org_id or self.name}: {self.processed} processed, {self.failed} failed, "
+                    f"{len(self.backlog)} queued, {self.queued} listed — {rate:.1f} docs/min ({state})")
+
+
+class FairScheduler:
+    def __init__(self, tenants, max_backlog: int = DEFAULT_MAX_BACKLOG):
+        self.tenants = list(tenants)
+        self.max_backlog = max_backlog
+        self._cond = threading.Condition()
+        self._current = {id(tenant): 0.0 for tenant in self.tenants}
+        self._in_flight = {id(tenant): 0 for tenant in self.tenants}
+
+    def put(self, tenant: Tenant, doc_id):
+        """Queue a document; blocks while the tenant's backlog is full so listing stays ahead only a little."""
+        with self._cond:
+            while len(tenant.backlog) >= self.max_backlog:
+                self._cond.wait()
+            if tenant.started is None:
+                tenant.started = time.perf_counter()
+            tenant.backlog.append(doc_id)
+            tenant.queued += 1
+            self._cond.notify_all()
+
+    def finish_listing(self, tenant: Tenant):
+        with self._cond:
+            tenant.listing_done = True
+            self._finish_if_idle(tenant)
+            self._cond.notify_all()
+
+    def next(self):
+        """(tenant, doc_id) for the next document to process, or None once every tenant is drained."""
+        with self._cond:
+            while True:
+                ready = [tenant for tenant in self.tenants if tenant.backlog]
+                if ready:
+                    total = sum(tenant.weight for tenant in ready)
+                    for tenant in ready:
+                        self._current[id(tenant)] += tenant.weight
+                    chosen = max(ready, key=lambda tenant: self._current[id(tenant)])
+                    self._current[id(chosen)] -= total
+                    self._in_flight[id(chosen)] += 1
+                    doc_id = chosen.backlog.popleft()
+                    self._cond.notify_all()
+                    return chosen, doc_id
+                if all(tenant.listing_done for tenant in self.tenants):
+                    return None
+                self._cond.wait()
+
+    def task_done(self, tenant: Tenant):
+        with self._cond:
+            self._in_flight[id(tenant)] -= 1
+            self._finish_if_idle(tenant)
+
+    def _finish_if_idle(self, tenant: Tenant):
+        if tenant.listing_done and not tenant.backlog and not self._in_flight[id(tenant)] and tenant.finished is None:
+            tenant.finished = time.perf_counter()
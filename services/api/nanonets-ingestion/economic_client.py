@@ -1,7 +1,12 @@
+import asyncio
 import json
 import requests
+import http_transport
 import time
+import httpx
 from pathlib import Path
+from failures import is_client_error
+from rate_limiter import limiter_for
 from config import ECONOMIC_APP_SECRET, ECONOMIC_GRANT_TOKEN, ECONOMIC_BASE_URL
 
 
@@ -27,67 +32,106 @@ def load_cursor() -> str:
 def save_cursor(cursor: str):
     CURSOR_FILE.write_text(json.dumps({"cursor": cursor}, indent=2))
 
-def safe_get(url, headers, retries=3, backoff_factor=0.5, timeout=10):
+def safe_get(url, headers, retries=3, backoff_factor=0.5, timeout=None):
+    # Pacing and 429 backoff are shared by all workers through the host's rate limiter
+    # timeout=None uses the transport's per-host timeouts
+    limiter = limiter_for(url)
     for attempt in range(retries):
+        limiter.acquire()
         try:
-            response = requests.get(url, headers=headers, timeout=timeout)
-            if response.status_code in (502, 503, 429):
+            response = http_transport.get(url, headers=headers, timeout=timeout)
+            if response.status_code == 429:
+                limiter.on_throttle(response.headers.get("Retry-After"))
+                print(f"⚠️ Retry {attempt+1}: throttled, e-conomic rate now {limiter.rate:.2f} req/s")
+                continue
+            if response.status_code in (502, 503):
+                limiter.on_server_error()
                 wait = backoff_factor * (2 ** attempt)
                 print(f"⚠️ Retry {attempt+1} after {wait:.1f}s (Status: {response.status_code})")
                 time.sleep(wait)
                 continue
             response.raise_for_status()
+            limiter.on_success()
             return response
         except requests.exceptions.RequestException as e:
+            if is_client_error(e):
+                raise
             print(f"⚠️ Error on attempt {attempt+1}: {e}")
             time.sleep(backoff_factor * (2 ** attempt))
     raise Exception(f"❌ Failed to GET {url} after {retries} attempts.")
 
-def get_document_ids(year: int, limit: int, resume: bool = True):
+def fetch_pdf_economic(document_id: int) -> bytes:
+    url = f"{ECONOMIC_BASE_URL}/AttachedDocuments/{document_id}/pdf"
     headers = {
         'X-AppSecretToken': ECONOMIC_APP_SECRET,
         'X-AgreementGrantToken': ECONOMIC_GRANT_TOKEN,
     }
+    response = safe_get(url, headers)
+    return response.content
+
+
+# ---------- asyncio (used by pipeline.py) ----------
+
+def economic_headers() -> dict:
+    return {
+        'X-AppSecretToken': ECONOMIC_APP_SECRET,
+        'X-AgreementGrantToken': ECONOMIC_GRANT_TOKEN,
+    }
+
+async def safe_get_async(client: httpx.AsyncClient, url: str, retries=3, backoff_factor=0.5):
+    limiter = limiter_for(url)
+    for attempt in range(retries):
+        await limiter.acquire_async()
+        started = time.perf_counter()
+        try:
+            response = await client.get(url, headers=economic_headers())
+            http_transport.record(url, time.perf_counter() - started, error=response.status_code >= 500)
+            if response.status_code == 429:
+                limiter.on_throttle(response.headers.get("Retry-After"))
+                print(f"⚠️ Retry {attempt+1}: throttled, e-conomic rate now {limiter.rate:.2f} req/s")
+                continue
+            if response.status_code in (502, 503):
+                limiter.on_server_error()
+                wait = backoff_factor * (2 ** attempt)
+                print(f"⚠️ Retry {attempt+1} after {wait:.1f}s (Status: {response.status_code})")
+                await asyncio.sleep(wait)
+                continue
+            response.raise_for_status()
+            limiter.on_success()
+            return response
+        except httpx.HTTPError as e:
+            if is_client_error(e):
+                raise
+            http_transport.record(url, time.perf_counter() - started, error=True)
+            print(f"⚠️ Error on attempt {attempt+1}: {e}")
+            await asyncio.sleep(backoff_factor * (2 ** attempt))
+    raise Exception(f"❌ Failed to GET {url} after {retries} attempts.")
+
+async def iter_document_pages(client: httpx.AsyncClient, year: int, resume: bool = True):
+    """
+    Yield (document numbers, next cursor) per page of AttachedDocuments.
 
-    document_ids = []
+    The cursor is not saved here: the caller checkpoints it with save_cursor() once
+    every document of the page is tracked, so a crash never skips unprocessed documents.
+    """
     cursor = load_cursor() if resume else None
     seen_cursors = set()
-
-    while len(document_ids) < limit:
+    while True:
         if cursor:
             if cursor in seen_cursors:
                 print("⚠️ Cursor repeated — breaking to prevent infinite loop.")
-                break
+                return
             seen_cursors.add(cursor)
             url = f"{ECONOMIC_BASE_URL}/AttachedDocuments?filter=accountingYear$eq:{year}&cursor={cursor}"
         else:
             url = f"{ECONOMIC_BASE_URL}/AttachedDocuments?filter=accountingYear$eq:{year}"
 
-        response = safe_get(url, headers)
-        data = response.json()
-
-        for item in data.get("items", []):
-            document_ids.append(item["number"])
-            if len(document_ids) >= limit:
-                break
-
+        data = (await safe_get_async(client, url)).json()
         cursor = data.get("cursor")
-        if cursor:
-            save_cursor(cursor)
-        print(f"📥 Total so far: {len(document_ids)}. Next cursor: {cursor}")
-        time.sleep(0.5)
-
+        yield [item["number"] for item in data.get("items", [])], cursor
         if not cursor:
-            break
-
-    return document_ids
+            return
 
-def fetch_pdf_economic(document_id: int) -> bytes:
-    url = f"{ECONOMIC_BASE_URL}/AttachedDocuments/{document_id}/pdf"
-    headers = {
-        'X-AppSecretToken': ECONOMIC_APP_SECRET,
-        'X-AgreementGrantToken': ECONOMIC_GRANT_TOKEN,
-    }
-    response = safe_get(url, headers)
-    time.sleep(0.5)
+async def fetch_pdf_economic_async(client: httpx.AsyncClient, document_id: int) -> bytes:
+    response = await safe_get_async(client, f"{ECONOMIC_BASE_URL}/AttachedDocuments/{document_id}/pdf")
     return response.content
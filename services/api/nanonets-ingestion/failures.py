@@ -0,0 +1,43 @@
+"""
+Tell ingestion failures that retrying cannot fix from transient ones.
+
+Permanent: the PDF is gone or the file is rejected (404, 410, 413, 415, 422, 400).
+Transient: everything else, e.g. 429, 5xx, timeouts and connection errors.
+"""
+
+import httpx
+import requests
+
+PERMANENT_STATUS_CODES = {400, 404, 410, 413, 415, 422}
+
+
+def failure_status(exc: BaseException):
+    """HTTP status behind an exception (following its __cause__ / __context__ chain), or None."""
+    seen = set()
+    while exc is not None and id(exc) not in seen:
+        seen.add(id(exc))
+        response = None
+        if isinstance(exc, requests.exceptions.HTTPError):
+            response = exc.response
+        elif isinstance(exc, httpx.HTTPStatusError):
+            response = exc.response
+        if response is not None:
+            return response.status_code
+        exc = exc.__cause__ or exc.__context__
+    return None
+
+
+def is_permanent_failure(exc: BaseException) -> bool:
+    return failure_status(exc) in PERMANENT_STATUS_CODES
+
+
+def describe_failure(exc: BaseException) -> str:
+    status = failure_status(exc)
+    prefix = f"HTTP {status}: " if status else ""
+    return f"{prefix}{type(exc).__name__}: {exc}"
+
+
+def is_client_error(exc: BaseException) -> bool:
+    """4xx other than 429: the request itself is wrong, so the HTTP clients don't retry it."""
+    status = failure_status(exc)
+    return status is not None and 400 <= status < 500 and status != 429
@@ -0,0 +1,195 @@
+"""
+Pooled HTTP transport for the e-conomic, Nanonets and Supabase clients.
+
+One requests.Session per host keeps TCP/TLS connections alive between calls
+(pool sized with configure(), default HTTP_POOL_SIZE). Each host has its own
+timeouts and urllib3 retry policy for connection-level failures. HTTP status
+handling (429, 5xx) stays with the callers and the rate limiters. Responses are
+requested gzip-compressed.
+
+Every request records its latency in a per-host histogram. summary() reports
+requests, errors, p50/p95 latency and how many requests reused a connection.
+"""
+
+import os
+import threading
+import time
+from typing import Dict
+from urllib.parse import urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+DEFAULT_POOL_SIZE = int(os.getenv("HTTP_POOL_SIZE", "10"))
+
+# host suffix -> (connect timeout, read timeout, connect retries, read retries)
+# Nanonets uploads get no read retries: a read timeout there is treated as an accepted upload.
+HOST_SETTINGS = {
+    "nanonets.com": (5.0, 30.0, 3, 0),
+    "e-conomic.com": (5.0, 10.0, 3, 2),
+    "supabase.co": (5.0, 15.0, 3, 2),
+}
+GENERIC_SETTINGS = (5.0, 15.0, 2, 1)
+
+# "host:port=api host" pairs: requests to local stand-in servers (ingestion-bench) get the
+# timeouts, rate limits and stats of the API they imitate
+HOST_ALIASES = dict(alias.strip().lower().split("=", 1) for alias in os.getenv("HTTP_HOST_ALIASES", "").split(",") if "=" in alias)
+
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, float("inf"))
+
+
+class HostStats:
+    def __init__(self, host: str):
+        self.host = host
+        self.requests = 0
+        self.errors = 0
+        self.total_seconds = 0.0
+        self.buckets = [0] * len(LATENCY_BUCKETS)
+
+    def observe(self, seconds: float, error: bool = False):
+        self.requests += 1
+        self.errors += int(error)
+        self.total_seconds += seconds
+        for i, bound in enumerate(LATENCY_BUCKETS):
+            if seconds <= bound:
+                self.buckets[i] += 1
+                break
+
+    def quantile(self, q: float) -> float:
+        """Upper bound of the histogram bucket holding the q-quantile."""
+        target = q * self.requests
+        seen = 0
+        for bound, count in zip(LATENCY_BUCKETS, self.buckets):
+            seen += count
+            if count and seen >= target:
+                return bound
+        return 0.0
+
+
+_lock = threading.Lock()
+_sessions: Dict[str, requests.Session] = {}
+_stats: Dict[str, HostStats] = {}
+_pool_size = DEFAULT_POOL_SIZE
+
+
+def configure(pool_size: int):
+    """Size the per-host connection pools to the number of workers. Call before the first request."""
+    global _pool_size
+    with _lock:
+        _pool_size = max(pool_size, 1)
+
+
+def host_of(url: str) -> str:
+    parsed = urlparse(url)
+    return HOST_ALIASES.get(parsed.netloc.lower()) or (parsed.hostname or url).lower()
+
+
+def settings_for(host: str):
+    return next((s for suffix, s in HOST_SETTINGS.items() if host.endswith(suffix)), GENERIC_SETTINGS)
+
+
+def session_for(host: str) -> requests.Session:
+    with _lock:
+        session = _sessions.get(host)
+        if session is None:
+            _, _, connect_retries, read_retries = settings_for(host)
+            retry = Retry(
+                total=connect_retries + read_retries,
+                connect=connect_retries,
+                read=read_retries,
+                status=0,
+                other=0,
+                backoff_factor=0.3,
+                raise_on_status=False,
+            )
+            adapter = HTTPAdapter(pool_connections=4, pool_maxsize=_pool_size, max_retries=retry, pool_block=True)
+            session = requests.Session()
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            session.headers["Accept-Encoding"] = "gzip, deflate"
+            _sessions[host] = session
+        return session
+
+
+def record(url_or_host: str, seconds: float, error: bool = False):
+    """Add a latency sample; also used for requests made with other clients (e.g. httpx)."""
+    host = host_of(url_or_host) if "://" in url_or_host else url_or_host.lower()
+    with _lock:
+        stats = _stats.get(host)
+        if stats is None:
+            stats = _stats[host] = HostStats(host)
+        stats.observe(seconds, error)
+
+
+def request(method: str, url: str, **kwargs) -> requests.Response:
+    host = host_of(url)
+    if kwargs.get("timeout") is None:
+        connect_timeout, read_timeout, _, _ = settings_for(host)
+        kwargs["timeout"] = (connect_timeout, read_timeout)
+    session = session_for(host)
+    started = time.perf_counter()
+    try:
+        response = session.request(method, url, **kwargs)
+    except requests.exceptions.RequestException:
+        record(host, time.perf_counter() - started, error=True)
+        raise
+    record(host, time.perf_counter() - started, error=response.status_code >= 500)
+    return response
+
+
+def get(url: str, **kwargs) -> requests.Response:
+    return request("GET", url, **kwargs)
+
+
+def post(url: str, **kwargs) -> requests.Response:
+    return request("POST", url, **kwargs)
+
+
+def delete(url: str, **kwargs) -> requests.Response:
+    return request("DELETE", url, **kwargs)
+
+
+def _connection_counts(session: requests.Session):
+    """(requests sent, connections opened) over the session's urllib3 pools."""
+    sent = opened = 0
+    for adapter in set(session.adapters.values()):
+        pools = adapter.poolmanager.pools
+        for key in pools.keys():
+            pool = pools.get(key)
+            if pool is not None:
+                sent += pool.num_requests
+                opened += pool.num_connections
+    return sent, opened
+
+
+def all_stats() -> Dict[str, dict]:
+    with _lock:
+        hosts = dict(_stats)
+        sessions = dict(_sessions)
+    result = {}
+    for host, stats in hosts.items():
+        sent, opened = _connection_counts(sessions[host]) if host in sessions else (0, 0)
+        result[host] = {
+            "requests": stats.requests,
+            "errors": stats.errors,
+            "total_seconds": stats.total_seconds,
+            "avg_seconds": stats.total_seconds / stats.requests if stats.requests else 0.0,
+            "p50_seconds": stats.quantile(0.5),
+            "p95_seconds": stats.quantile(0.95),
+            "buckets": dict(zip(LATENCY_BUCKETS, stats.buckets)),
+            "connections_opened": opened,
+            "connections_reused": max(sent - opened, 0),
+        }
+    return result
+
+
+def summary() -> str:
+    lines = []
+    for host, s in all_stats().items():
+        line = (f"🌐 {host}: {s['requests']} requests, {s['errors']} errors, avg {s['avg_seconds'] * 1000:.0f} ms, "
+                f"p50 ≤{s['p50_seconds']:g}s, p95 ≤{s['p95_seconds']:g}s")
+        if s["connections_opened"]:
+            line += f", {s['connections_opened']} connections opened / {s['connections_reused']} reused"
+        lines.append(line)
+    return "\n".join(lines) or "🌐 No HTTP requests"
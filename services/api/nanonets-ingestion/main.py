@@ -1,85 +1,33 @@
-from economic_client import get_document_ids, fetch_pdf_economic
-from nanonets_client import send_pdf_to_nanonets
-from processed_tracker import (
-    has_been_processed,
-    is_pending,
-    save_pending_entry,
-    remove_pending_entry,
-    save_processed_entry,
-    get_agreement_identifier,
-    load_processed_entries,
-    load_pending_entries,
-)
-from formatter import beautify_nanonets_response
-from pathlib import Path
-from concurrent.futures import ThreadPoolExecutor, as_completed
-import time
-import json
+from economic_client import CURSOR_FILE
+from pipeline import IngestionPipeline, DEFAULT_DOWNLOAD_CONCURRENCY, DEFAULT_UPLOAD_CONCURRENCY
+from processed_tracker import get_agreement_identifier
+from telemetry import RunTelemetry
+import asyncio
+import http_transport
+import rate_limiter
 import sys
 import signal
 
 
-CURSOR_FILE = Path("cursor_state.json")
-FAILED_DIR = Path("failed_documents")
-FAILED_DIR.mkdir(exist_ok=True)
-
-def get_failed_file():
-    agreement = get_agreement_identifier()
-    return FAILED_DIR / f"{agreement}_failed.json"
-
-def load_failed_ids():
-    failed_file = get_failed_file()
-    if failed_file.exists():
-        return set(json.loads(failed_file.read_text()))
-    return set()
-
-def save_failed_id(doc_id):
-    failed_file = get_failed_file()
-    failed = load_failed_ids()
-    failed.add(doc_id)
-    failed_file.write_text(json.dumps(sorted(failed), indent=2))
-
-def process_document(doc_id, year, async_flag):
-    filename = f"{doc_id}.pdf"
-    save_pending_entry(year, doc_id, filename)
-
-    try:
-        pdf_data = fetch_pdf_economic(doc_id)
-        result = send_pdf_to_nanonets(pdf_data, filename=filename, async_mode=async_flag)
-
-        if result.get("message") in ("Success", "TimeoutAssumedSuccess"):
-            print(f"✅ Success for {doc_id} (including assumed)")
-            print(result)
-            print(beautify_nanonets_response(result))
-            if async_flag:
-                print("🔄 Async mode: result will be processed later.")
-            else:
-                print("📥 Synchronous mode: result is ready now.")
-            save_processed_entry(year, doc_id, filename)
-        else:
-            print(f"❌ Upload failed for {doc_id}")
-            save_failed_id(doc_id)
-
-    except Exception as e:
-        print(f"💥 Exception for {doc_id}: {e}")
-        save_failed_id(doc_id)
-    finally:
-        remove_pending_entry(year, doc_id)
-        time.sleep(0.3)
-
-
-stop_requested = False
+pipeline = None
 
 def handle_sigint(sig, frame):
-    global stop_requested
-    print("\n🛑 Stop requested by user. Finishing current document and exiting...")
-    stop_requested = True
+    print("\n🛑 Stop requested by user. Finishing documents in flight and exiting...")
+    if pipeline is not None:
+        pipeline.stop_requested = True
 
 signal.signal(signal.SIGINT, handle_sigint)
 
+def get_int_option(name, default):
+    for arg in sys.argv:
+        if arg.startswith(f"{name}="):
+            return int(arg.split("=", 1)[1])
+    return default
+
 if __name__ == "__main__":
     if len(sys.argv) < 3:
-        print("Usage: python main.py <ACCOUNTING_YEAR> <NUM_DOCUMENTS> [async: true|false] [--reset-cursor]")
+        print("Usage: python main.py <ACCOUNTING_YEAR> <NUM_DOCUMENTS> [async: true|false] [--reset-cursor] "
+              "[--download-concurrency=N] [--upload-concurrency=N]")
         sys.exit(1)
 
     year = int(sys.argv[1])
@@ -93,33 +41,19 @@ if __name__ == "__main__":
         CURSOR_FILE.unlink()
         print("🗑️  Cursor reset: starting from the beginning.")
 
-    resume_cursor = not reset_cursor
-    document_ids = get_document_ids(year, limit, resume=resume_cursor)
-
-    # Pre-load filters
-    processed_keys = set(e["key"] for e in load_processed_entries())
-    pending_keys = set(e["key"] for e in load_pending_entries())
-    agreement = get_agreement_identifier()
-
-    def is_skippable(doc_id):
-        key = f"{year}:{agreement}:{doc_id}"
-        return key in processed_keys or key in pending_keys
-
-    filtered_ids = [doc_id for doc_id in document_ids if not is_skippable(doc_id)]
-    print(f"🚀 Ready to process {len(filtered_ids)} documents (filtered from {len(document_ids)})")
-
-    with ThreadPoolExecutor(max_workers=4) as executor:
-        futures = []
-        for doc_id in filtered_ids:
-            if stop_requested:
-                print("⏹️ Aborting further processing due to user interrupt.")
-                break
-            futures.append(executor.submit(process_document, doc_id, year, async_flag))
-
-        try:
-            for _ in as_completed(futures):
-                if stop_requested:
-                    break
-        except KeyboardInterrupt:
-            print("⚠️ Interrupted — shutting down...")
-
+    pipeline = IngestionPipeline(
+        year,
+        limit,
+        async_flag=async_flag,
+        resume=not reset_cursor,
+        download_concurrency=get_int_option("--download-concurrency", DEFAULT_DOWNLOAD_CONCURRENCY),
+        upload_concurrency=get_int_option("--upload-concurrency", DEFAULT_UPLOAD_CONCURRENCY),
+    )
+    print(f"🚀 Processing up to {limit} documents from {year} "
+          f"({pipeline.download_concurrency} downloads / {pipeline.upload_concurrency} uploads in parallel)")
+    telemetry = RunTelemetry("ingestion")
+    asyncio.run(pipeline.run())
+    telemetry.set_tenant(get_agreement_identifier(), pipeline.stats.counters())
+    print(rate_limiter.summary())
+    print(http_transport.summary())
+    telemetry.write()
@@ -1,7 +1,13 @@
 import json
+import sys
 from pathlib import Path
 
+from processed_tracker import TrackerStore
+
 TRACKER_FILE = Path("processed_documents.json")
+PROCESSED_DIR = Path("processed")
+PENDING_DIR = Path("pending")
+FAILED_DIR = Path("failed_documents")
 
 def migrate_to_structured_format():
     if not TRACKER_FILE.exists():
@@ -33,5 +39,57 @@ def migrate_to_structured_format():
     TRACKER_FILE.write_text(json.dumps(migrated, indent=2))
     print(f"✅ Migrated {len(migrated)} entries to structured format.")
 
+def _load_list(file_path: Path):
+    raw_data = file_path.read_text().strip() if file_path.exists() else ""
+    return json.loads(raw_data) if raw_data else []
+
+def _entry_rows(entries, state):
+    """JSON tracker entries ({"key": "year:agreement:doc_id", "filename": ...}) as store rows."""
+    rows = []
+    for entry in entries:
+        key = entry["key"] if isinstance(entry, dict) else entry
+        year, rest = key.split(":", 1)
+        agreement, document_id = rest.rsplit(":", 1)
+        filename = entry.get("filename") if isinstance(entry, dict) else None
+        rows.append((key, agreement, int(year), document_id, filename or f"{document_id}.pdf", state))
+    return rows
+
+def import_json_trackers(failed_year: int = None):
+    """
+    Copy the JSON trackers into the SQLite store: pending/ first, then processed/
+    (and the legacy processed_documents.json), so processed wins over a stale pending entry.
+    Failed lists hold only document ids, so they are imported with failed_year if given.
+    """
+    store = TrackerStore()
+    rows = []
+    for file_path in sorted(PENDING_DIR.glob("*.json")):
+        rows += _entry_rows(_load_list(file_path), "pending")
+
+    processed_files = sorted(PROCESSED_DIR.glob("*.json"))
+    if TRACKER_FILE.exists():
+        processed_files.append(TRACKER_FILE)
+    processed_rows = []
+    for file_path in processed_files:
+        processed_rows += _entry_rows(_load_list(file_path), "processed")
+
+    failed_rows = []
+    failed_files = sorted(FAILED_DIR.glob("*_failed.json"))
+    if failed_files and failed_year is None:
+        print(f"⚠️ Skipping {len(failed_files)} failed-document lists: pass the accounting year they belong to")
+    elif failed_files:
+        processed_keys = {row[0] for row in processed_rows}
+        for file_path in failed_files:
+            agreement = file_path.name[: -len("_failed.json")]
+            for document_id in _load_list(file_path):
+                key = f"{failed_year}:{agreement}:{document_id}"
+                if key not in processed_keys:
+                    failed_rows.append((key, agreement, failed_year, str(document_id), f"{document_id}.pdf", "failed"))
+
+    store.bulk_upsert(rows + failed_rows + processed_rows)
+    print(f"✅ Imported {len(rows)} pending, {len(processed_rows)} processed and {len(failed_rows)} failed "
+          f"entries into {store.path} → {store.counts()}")
+
 if __name__ == "__main__":
+    # Usage: python migrate_tracker.py [FAILED_DOCUMENTS_YEAR]
     migrate_to_structured_format()
+    import_json_trackers(int(sys.argv[1]) if len(sys.argv) > 1 else None)
@@ -0,0 +1,142 @@
+"""
+Local spool of downloaded e-conomic PDFs, so retries and re-uploads read from disk.
+
+Files live at <PDF_SPOOL_DIR>/<agreement>/<document_id>.pdf. Each write goes to a
+temp file that is renamed into place, so a crash never leaves a truncated PDF.
+The spool is capped at PDF_SPOOL_MAX_MB; when a write pushes it over, the least
+recently used files (by mtime, refreshed on every read) are evicted first.
+The spool only saves downloads: fetch() logs disk errors and falls back to the download.
+"""
+
+import os
+import threading
+from pathlib import Path
+
+SPOOL_DIR = Path(os.getenv("PDF_SPOOL_DIR", "pdf_spool"))
+SPOOL_MAX_BYTES = int(float(os.getenv("PDF_SPOOL_MAX_MB", "2048")) * 1024 * 1024)
+
+
+class PdfSpool:
+    def __init__(self, root: Path = SPOOL_DIR, max_bytes: int = SPOOL_MAX_BYTES):
+        self.root = Path(root)
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0, "bytes_local": 0, "bytes_remote": 0, "evicted": 0}
+        try:
+            self.root.mkdir(parents=True, exist_ok=True)
+            self._size = sum(path.stat().st_size for path in self.root.glob("*/*.pdf"))
+        except OSError as e:
+            # Reads and writes will fail too; fetch() downloads instead
+            print(f"⚠️ PDF spool at {self.root} is unusable: {e}")
+            self._size = 0
+
+    def path(self, agreement: str, document_id) -> Path:
+        return self.root / agreement / f"{document_id}.pdf"
+
+    def get(self, agreement: str, document_id):
+        """Spooled PDF bytes, or None. A hit refreshes the file's LRU position."""
+        path = self.path(agreement, document_id)
+        try:
+            data = path.read_bytes()
+            os.utime(path)
+        except FileNotFoundError:
+            with self._lock:
+                self.stats["misses"] += 1
+            return None
+        with self._lock:
+            self.stats["hits"] += 1
+            self.stats["bytes_local"] += len(data)
+        return data
+
+    def put(self, agreement: str, document_id, data: bytes):
+        if len(data) > self.max_bytes:
+            return
+        path = self.path(agreement, document_id)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_name(f".{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+        try:
+            tmp.write_bytes(data)
+            with self._lock:
+                old_size = path.stat().st_size if path.exists() else 0
+                os.replace(tmp, path)
+                self._size += len(data) - old_size
+                if self._size > self.max_bytes:
+                    self._evict(keep=path)
+        except OSError:
+            # e.g. disk full: don't leave a partial temp file behind
+            tmp.unlink(missing_ok=True)
+            raise
+
+    def discard(self, agreement: str, document_id):
+        path = self.path(agreement, document_id)
+        with self._lock:
+            try:
+                size = path.stat().st_size
+                path.unlink()
+                self._size -= size
+            except FileNotFoundError:
+                pass
+
+    def _evict(self, keep: Path):
+        files = []
+        for path in self.root.glob("*/*.pdf"):
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue
+            files.append((stat.st_mtime, stat.st_size, path))
+        files.sort()
+        # Trim to 90% of the cap so that every write near the limit doesn't rescan the spool
+        target = self.max_bytes * 0.9
+        self._size = sum(size for _, size, _ in files)
+        for _, size, path in files:
+            if self._size <= target:
+                break
+            if path == keep:
+                continue
+            try:
+                path.unlink()
+            except FileNotFoundError:
+                continue
+            self._size -= size
+            self.stats["evicted"] += 1
+
+    def fetch(self, agreement: str, document_id, download) -> bytes:
+        """Spooled PDF, or download(document_id) and spool the result. Spool I/O errors are logged, not raised."""
+        try:
+            data = self.get(agreement, document_id)
+        except OSError as e:
+            print(f"⚠️ PDF spool read failed for {document_id}, downloading instead: {e}")
+            data = None
+        if data is None:
+            data = download(document_id)
+            try:
+                self.record_download(agreement, document_id, data)
+            except OSError as e:
+                print(f"⚠️ Could not spool {document_id}, continuing with the downloaded bytes: {e}")
+        return data
+
+    def record_download(self, agreement: str, document_id, data: bytes):
+        with self._lock:
+            self.stats["bytes_remote"] += len(data)
+        self.put(agreement, document_id, data)
+
+    def summary(self) -> str:
+        s = self.stats
+        lookups = s["hits"] + s["misses"]
+        hit_rate = 100.0 * s["hits"] / lookups if lookups else 0.0
+        return (f"💾 PDF spool: {s['hits']}/{lookups} hits ({hit_rate:.0f}%), "
+                f"{s['bytes_local'] / 1e6:.1f} MB from disk vs {s['bytes_remote'] / 1e6:.1f} MB downloaded, "
+                f"{s['evicted']} evicted, {self._size / 1e6:.1f} MB spooled")
+
+
+_spool = None
+_spool_lock = threading.Lock()
+
+
+def get_spool() -> PdfSpool:
+    global _spool
+    with _spool_lock:
+        if _spool is None:
+            _spool = PdfSpool()
+        return _spool
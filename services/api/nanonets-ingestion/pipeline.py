@@ -0,0 +1,285 @@
+"""
+asyncio ingestion pipeline: e-conomic listing → PDF download → Nanonets upload.
+
+Three stages connected by bounded queues:
+
+  lister ──(doc ids)──▶ N downloaders ──(pdf bytes)──▶ M uploaders
+
+Each API has its own concurrency limit, so downloads overlap uploads, and the
+bounded queues keep at most a few PDFs in memory. Pacing comes from the shared
+per-host limiters in rate_limiter.py, which slow down on 429/5xx (honouring
+Retry-After) instead of fixed sleeps between requests.
+
+The e-conomic cursor is checkpointed per page, and only once every document listed
+on that page (and on all earlier pages) has ended processed, failed or skipped, so
+stopping or crashing mid-run never moves the resume point past unfinished documents.
+"""
+
+import asyncio
+import hashlib
+import time
+from collections import OrderedDict
+
+import httpx
+
+import rate_limiter
+from economic_client import iter_document_pages, fetch_pdf_economic_async, save_cursor
+from failures import describe_failure, is_permanent_failure
+from nanonets_client import send_pdf_to_nanonets_async
+from pdf_spool import get_spool
+from processed_tracker import (
+    get_agreement_identifier,
+    load_processed_entries,
+    record_content_hash,
+    remove_pending_entry,
+    save_failed_entry,
+    save_pending_entry,
+    save_processed_entry,
+)
+
+DEFAULT_DOWNLOAD_CONCURRENCY = 4
+DEFAULT_UPLOAD_CONCURRENCY = 2
+REPORT_INTERVAL = 30.0
+
+_DONE = object()
+
+
+class PipelineStats:
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.listed = 0
+        self.skipped = 0
+        self.downloaded = 0
+        self.uploaded = 0
+        self.failed = 0
+        self.duplicates = 0
+        self.bytes_downloaded = 0
+        self.bytes_uploaded = 0
+        self.bytes_deduplicated = 0
+
+    def docs_per_minute(self) -> float:
+        elapsed = time.perf_counter() - self.started
+        return 60.0 * (self.uploaded + self.failed + self.duplicates) / elapsed if elapsed else 0.0
+
+    def counters(self) -> dict:
+        return {
+            "listed": self.listed,
+            "skipped": self.skipped,
+            "downloaded": self.downloaded,
+            "uploaded": self.uploaded,
+            "duplicates": self.duplicates,
+            "failed": self.failed,
+            "bytes_downloaded": self.bytes_downloaded,
+            "bytes_uploaded": self.bytes_uploaded,
+            "bytes_deduplicated": self.bytes_deduplicated,
+        }
+
+    def summary(self) -> str:
+        elapsed = time.perf_counter() - self.started
+        return (
+            f"{self.listed} listed, {self.skipped} skipped, {self.downloaded} downloaded "
+            f"({self.bytes_downloaded / 1e6:.1f} MB), {self.uploaded} uploaded, {self.failed} failed, "
+            f"{self.duplicates} duplicates not uploaded ({self.bytes_deduplicated / 1e6:.1f} MB) "
+            f"in {elapsed:.0f}s — {self.docs_per_minute():.1f} docs/min"
+        )
+
+
+class PageCheckpoints:
+    """
+    Saves the listing cursor after a page only when that page and every earlier page are done.
+
+    Documents are added to their page as they are queued and marked done once the tracker
+    holds a final state for them. A page counts as done when it is fully listed and has no
+    outstanding documents left.
+    """
+
+    def __init__(self, save=save_cursor):
+        self._save = save
+        self._pages = OrderedDict()  # page number -> [outstanding documents, next cursor, fully listed]
+        self.saved_cursor = None
+
+    def open_page(self, page_no: int, cursor):
+        self._pages[page_no] = [0, cursor, False]
+
+    def add(self, page_no: int):
+        self._pages[page_no][0] += 1
+
+    def close_page(self, page_no: int):
+        self._pages[page_no][2] = True
+        self._advance()
+
+    def done(self, page_no: int):
+        self._pages[page_no][0] -= 1
+        self._advance()
+
+    def _advance(self):
+        cursor = None
+        while self._pages:
+            outstanding, next_cursor, listed = next(iter(self._pages.values()))
+            if outstanding or not listed:
+                break
+            self._pages.popitem(last=False)
+            cursor = next_cursor or cursor
+        if cursor and cursor != self.saved_cursor:
+            self._save(cursor)
+            self.saved_cursor = cursor
+
+
+class IngestionPipeline:
+    def __init__(self, year: int, limit: int, async_flag: bool = True, resume: bool = True,
+                 download_concurrency: int = DEFAULT_DOWNLOAD_CONCURRENCY,
+                 upload_concurrency: int = DEFAULT_UPLOAD_CONCURRENCY):
+        self.year = year
+        self.limit = limit
+        self.async_flag = async_flag
+        self.resume = resume
+        self.download_concurrency = download_concurrency
+        self.upload_concurrency = upload_concurrency
+        self.stats = PipelineStats()
+        self.checkpoints = PageCheckpoints()
+        self.stop_requested = False
+
+    async def _list(self, client, download_queue):
+        agreement = get_agreement_identifier()
+        # Pending documents are not skipped: save_pending_entry() re-claims those left stale by a crashed run
+        skip_keys = {e["key"] for e in load_processed_entries()}
+        try:
+            page_no = 0
+            async for document_ids, cursor in iter_document_pages(client, self.year, resume=self.resume):
+                page_no += 1
+                self.checkpoints.open_page(page_no, cursor)
+                for doc_id in document_ids:
+                    # Leaving a page half-listed keeps its cursor from being saved
+                    if self.stats.listed >= self.limit or self.stop_requested:
+                        return
+                    self.stats.listed += 1
+                    if f"{self.year}:{agreement}:{doc_id}" in skip_keys:
+                        self.stats.skipped += 1
+                        continue
+                    self.checkpoints.add(page_no)
+                    await download_queue.put((page_no, doc_id))
+                self.checkpoints.close_page(page_no)
+                print(f"📥 Total so far: {self.stats.listed}. Next cursor: {cursor}")
+                if self.stats.listed >= self.limit:
+                    return
+        finally:
+            for _ in range(self.download_concurrency):
+                await download_queue.put(_DONE)
+
+    async def _download(self, client, download_queue, upload_queue):
+        agreement = get_agreement_identifier()
+        while True:
+            item = await download_queue.get()
+            if item is _DONE:
+                return
+            page_no, doc_id = item
+            filename = f"{doc_id}.pdf"
+            if self.stop_requested:
+                continue
+            if not save_pending_entry(self.year, doc_id, filename):
+                # Already pending in another run or processed meanwhile: tracked either way
+                self.checkpoints.done(page_no)
+                continue
+            # The spool is best-effort: a disk problem means downloading again, not losing the document
+            try:
+                pdf_data = get_spool().get(agreement, doc_id)
+            except Exception as e:
+                print(f"⚠️ PDF spool read failed for {doc_id}, downloading instead: {e}")
+                pdf_data = None
+            if pdf_data is None:
+                try:
+                    pdf_data = await fetch_pdf_economic_async(client, doc_id)
+                except Exception as e:
+                    print(f"💥 Download failed for {doc_id}: {e}")
+                    save_failed_entry(self.year, doc_id, filename, describe_failure(e), is_permanent_failure(e))
+                    self.stats.failed += 1
+                    self.checkpoints.done(page_no)
+                    continue
+                try:
+                    get_spool().record_download(agreement, doc_id, pdf_data)
+                except Exception as e:
+                    print(f"⚠️ Could not spool {doc_id}, continuing with the downloaded bytes: {e}")
+            self.stats.downloaded += 1
+            self.stats.bytes_downloaded += len(pdf_data)
+
+            # Same bytes already processed under another document number or year: alias, don't upload
+            sha256 = hashlib.sha256(pdf_data).hexdigest()
+            try:
+                canonical_key = record_content_hash(self.year, doc_id, filename, sha256, len(pdf_data))
+            except Exception as e:
+                print(f"💥 Could not record content hash for {doc_id}: {e}")
+                save_failed_entry(self.year, doc_id, filename, describe_failure(e), is_permanent_failure(e))
+                self.stats.failed += 1
+                self.checkpoints.done(page_no)
+                continue
+            if canonical_key:
+                print(f"♻️ {doc_id} is a duplicate of {canonical_key}, skipping upload")
+                self.stats.duplicates += 1
+                self.stats.bytes_deduplicated += len(pdf_data)
+                self.checkpoints.done(page_no)
+                continue
+            await upload_queue.put((page_no, doc_id, filename, pdf_data))
+
+    async def _upload(self, client, upload_queue):
+        while True:
+            item = await upload_queue.get()
+            if item is _DONE:
+                return
+            page_no, doc_id, filename, pdf_data = item
+            try:
+                result = await send_pdf_to_nanonets_async(client, pdf_data, filename=filename, async_mode=self.async_flag)
+                if result.get("message") in ("Success", "TimeoutAssumedSuccess"):
+                    print(f"✅ Success for {doc_id} (including assumed)")
+                    save_processed_entry(self.year, doc_id, filename)
+                    self.stats.uploaded += 1
+                    self.stats.bytes_uploaded += len(pdf_data)
+                else:
+                    print(f"❌ Upload failed for {doc_id}")
+                    save_failed_entry(self.year, doc_id, filename, f"Nanonets response: {result.get('message')}")
+                    self.stats.failed += 1
+            except Exception as e:
+                print(f"💥 Exception for {doc_id}: {e}")
+                save_failed_entry(self.year, doc_id, filename, describe_failure(e), is_permanent_failure(e))
+                self.stats.failed += 1
+            finally:
+                remove_pending_entry(self.year, doc_id)
+            self.checkpoints.done(page_no)
+
+    async def _report(self):
+        while True:
+            await asyncio.sleep(REPORT_INTERVAL)
+            print(f"📊 {self.stats.summary()}")
+            print(rate_limiter.summary())
+
+    async def run(self) -> PipelineStats:
+        download_queue = asyncio.Queue(maxsize=self.download_concurrency * 4)
+        # Small upload queue: at most a couple of downloaded PDFs wait per uploader
+        upload_queue = asyncio.Queue(maxsize=self.upload_concurrency * 2)
+
+        economic_limits = httpx.Limits(max_connections=self.download_concurrency + 1)
+        nanonets_limits = httpx.Limits(max_connections=self.upload_concurrency)
+        async with httpx.AsyncClient(limits=economic_limits, timeout=httpx.Timeout(10.0)) as economic, \
+                httpx.AsyncClient(limits=nanonets_limits, timeout=httpx.Timeout(30.0)) as nanonets:
+            reporter = asyncio.create_task(self._report())
+            downloaders = [
+                asyncio.create_task(self._download(economic, download_queue, upload_queue))
+                for _ in range(self.download_concurrency)
+            ]
+            uploaders = [
+                asyncio.create_task(self._upload(nanonets, upload_queue))
+                for _ in range(self.upload_concurrency)
+            ]
+            try:
+                await self._list(economic, download_queue)
+                await asyncio.gather(*downloaders)
+                for _ in uploaders:
+                    await upload_queue.put(_DONE)
+                await asyncio.gather(*uploaders)
+            finally:
+                reporter.cancel()
+                for task in downloaders + uploaders:
+                    task.cancel()
+
+        print(f"🏁 Pipeline done: {self.stats.summary()}")
+        print(get_spool().summary())
+        return self.stats
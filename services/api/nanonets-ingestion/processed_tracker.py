@@ -1,76 +1,356 @@
-import json
-import requests
+import os
+import sqlite3
+import threading
+from datetime import datetime, timedelta, timezone
+from functools import lru_cache
 from pathlib import Path
+
+import http_transport
 from config import ECONOMIC_APP_SECRET, ECONOMIC_GRANT_TOKEN
 
-PROCESSED_DIR = Path("processed")
-PROCESSED_DIR.mkdir(exist_ok=True)
+ECONOMIC_REST_URL = os.getenv("ECONOMIC_REST_URL", "https://restapi.e-conomic.com")
+TRACKER_DB = Path(os.getenv("TRACKER_DB", "tracker.db"))
+
+STATES = ("pending", "processed", "failed")
+
+# Failed documents: transient errors are retried after RETRY_BACKOFF_BASE * 2^(attempts - 1)
+# seconds (capped); permanent errors, or MAX_ATTEMPTS transient ones, park the document.
+MAX_ATTEMPTS = 8
+RETRY_BACKOFF_BASE = 60
+RETRY_BACKOFF_MAX = 6 * 3600
+
+# A pending claim not updated for this long is left over from a crashed or killed run and may be claimed again
+PENDING_STALE_SECONDS = int(os.getenv("PENDING_STALE_SECONDS", "3600"))
+
+# Columns added to documents after tracker.db was first released
+RETRY_COLUMNS = {
+    "last_error": "TEXT",
+    "parked": "INTEGER NOT NULL DEFAULT 0",
+    "next_attempt_at": "TEXT",
+}
 
-PENDING_DIR = Path("pending")
-PENDING_DIR.mkdir(exist_ok=True)
 
+@lru_cache(maxsize=None)
 def get_agreement_identifier() -> str:
-    url = "https://restapi.e-conomic.com/self"
+    """Company name + agreement number from e-conomic /self. Fetched once per process."""
+    url = f"{ECONOMIC_REST_URL}/self"
     headers = {
         'X-AppSecretToken': ECONOMIC_APP_SECRET,
         'X-AgreementGrantToken': ECONOMIC_GRANT_TOKEN
     }
-    response = requests.get(url, headers=headers, timeout=10)
+    response = http_transport.get(url, headers=headers, timeout=10)
     response.raise_for_status()
     data = response.json()
     name = data.get("company", {}).get("name", "").replace(" ", "_")
     number = data.get("agreementNumber")
     return f"{name}_{number}"
 
-def get_processed_file() -> Path:
-    org_id = get_agreement_identifier()
-    return PROCESSED_DIR / f"{org_id}.json"
 
-def get_pending_file() -> Path:
-    org_id = get_agreement_identifier()
-    return PENDING_DIR / f"{org_id}.json"
+def _now() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+
+class TrackerStore:
+    """
+    Document state per (accounting year, agreement, document id) in SQLite (WAL mode).
+
+    Every state change is a single upsert/delete on the primary key, so workers in
+    different threads never lose each other's updates. Each thread gets its own
+    connection; WAL lets readers run while one writer commits.
+    """
+
+    def __init__(self, path: Path = TRACKER_DB):
+        self.path = Path(path)
+        self._local = threading.local()
+        conn = self._connection()
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.executescript("""
+            CREATE TABLE IF NOT EXISTS documents (
+                key         TEXT PRIMARY KEY,
+                agreement   TEXT NOT NULL,
+                year        INTEGER NOT NULL,
+                document_id TEXT NOT NULL,
+                filename    TEXT,
+                state       TEXT NOT NULL CHECK (state IN ('pending', 'processed', 'failed')),
+                attempts    INTEGER NOT NULL DEFAULT 0,
+                last_error  TEXT,
+                parked      INTEGER NOT NULL DEFAULT 0,
+                next_attempt_at TEXT,
+                created_at  TEXT NOT NULL,
+                updated_at  TEXT NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_documents_agreement_state
+                ON documents (agreement, state, year);
+            -- SHA-256 of each uploaded PDF -> the document it was uploaded as
+            CREATE TABLE IF NOT EXISTS content_hashes (
+                agreement   TEXT NOT NULL,
+                sha256      TEXT NOT NULL,
+                key         TEXT NOT NULL,
+                size        INTEGER NOT NULL,
+                created_at  TEXT NOT NULL,
+                PRIMARY KEY (agreement, sha256)
+            );
+            -- Documents whose PDF was already uploaded under another document number or year
+            CREATE TABLE IF NOT EXISTS document_aliases (
+                key           TEXT PRIMARY KEY,
+                canonical_key TEXT NOT NULL,
+                sha256        TEXT NOT NULL,
+                size          INTEGER NOT NULL,
+                created_at    TEXT NOT NULL
+            );
+        """)
+        existing = {row[1] for row in conn.execute("PRAGMA table_info(documents)")}
+        for column, declaration in RETRY_COLUMNS.items():
+            if column not in existing:
+                try:
+                    conn.execute(f"ALTER TABLE documents ADD COLUMN {column} {declaration}")
+                except sqlite3.OperationalError:
+                    pass  # added by another process in the meantime
+
+    def _connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA busy_timeout=30000")
+            self._local.conn = conn
+        return conn
+
+    def _execute(self, sql: str, params=()) -> sqlite3.Cursor:
+        # Autocommit: each statement is its own atomic transaction
+        return self._connection().execute(sql, params)
+
+    def claim(self, agreement: str, year: int, document_id, filename: str, include_parked: bool = False,
+              stale_after: int = PENDING_STALE_SECONDS) -> bool:
+        """
+        Mark a new, failed or stale pending document pending. False if it is processed, parked,
+        or pending with a claim updated within the last stale_after seconds.
+        """
+        stale_before = (datetime.now(timezone.utc) - timedelta(seconds=stale_after)).isoformat()
+        cur = self._execute("""
+            INSERT INTO documents (key, agreement, year, document_id, filename, state, created_at, updated_at)
+            VALUES (?, ?, ?, ?, ?, 'pending', ?, ?)
+            ON CONFLICT (key) DO UPDATE SET state = 'pending', filename = excluded.filename, updated_at = excluded.updated_at
+            WHERE (documents.state = 'failed' AND (documents.parked = 0 OR ?))
+               OR (documents.state = 'pending' AND documents.updated_at < ?)
+        """, (build_key(year, document_id, agreement), agreement, year, str(document_id), filename, _now(), _now(),
+              int(include_parked), stale_before))
+        return cur.rowcount > 0
+
+    def set_state(self, agreement: str, year: int, document_id, filename: str, state: str):
+        """Upsert a document into `state`; failed transitions count an attempt."""
+        if state not in STATES:
+            raise ValueError(f"Unknown tracker state: {state}")
+        attempts = 1 if state == "failed" else 0
+        self._execute("""
+            INSERT INTO documents (key, agreement, year, document_id, filename, state, attempts, created_at, updated_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT (key) DO UPDATE SET
+                state = excluded.state,
+                filename = coalesce(excluded.filename, documents.filename),
+                attempts = documents.attempts + excluded.attempts,
+                updated_at = excluded.updated_at
+        """, (build_key(year, document_id, agreement), agreement, year, str(document_id), filename, state, attempts, _now(), _now()))
+
+    def mark_failed(self, agreement: str, year: int, document_id, filename: str, error: str = None,
+                    permanent: bool = False, max_attempts: int = MAX_ATTEMPTS):
+        """
+        Store a failed attempt with its error. Returns (attempts, parked).
+
+        Permanent errors and documents that ran out of attempts are parked (no automatic
+        retries); otherwise the next attempt is scheduled with exponential backoff.
+        """
+        key = build_key(year, document_id, agreement)
+        conn = self._connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            self.set_state(agreement, year, document_id, filename, "failed")
+            attempts = conn.execute("SELECT attempts FROM documents WHERE key = ?", (key,)).fetchone()[0]
+            parked = permanent or attempts >= max_attempts
+            next_attempt_at = None
+            if not parked:
+                delay = min(RETRY_BACKOFF_BASE * 2 ** (attempts - 1), RETRY_BACKOFF_MAX)
+                next_attempt_at = (datetime.now(timezone.utc) + timedelta(seconds=delay)).isoformat()
+            conn.execute(
+                "UPDATE documents SET last_error = ?, parked = ?, next_attempt_at = ? WHERE key = ?",
+                (error[:500] if error else None, int(parked), next_attempt_at, key),
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return attempts, parked
+
+    def retry_candidates(self, agreement: str, year: int = None, include_parked: bool = False):
+        """Failed documents due for a retry: (document_id, filename, attempts), fewest attempts first."""
+        query = """
+            SELECT document_id, filename, attempts FROM documents
+            WHERE agreement = ? AND state = 'failed'
+              AND (next_attempt_at IS NULL OR next_attempt_at <= ?)
+        """
+        params = [agreement, _now()]
+        if not include_parked:
+            query += " AND parked = 0"
+        if year is not None:
+            query += " AND year = ?"
+            params.append(year)
+        return self._execute(query + " ORDER BY attempts, updated_at", params).fetchall()
+
+    def next_attempt_at(self, agreement: str, year: int = None):
+        """Earliest scheduled retry among failed, unparked documents (ISO timestamp), or None."""
+        query = "SELECT min(next_attempt_at) FROM documents WHERE agreement = ? AND state = 'failed' AND parked = 0"
+        params = [agreement]
+        if year is not None:
+            query += " AND year = ?"
+            params.append(year)
+        return self._execute(query, params).fetchone()[0]
 
-def load_json(file_path: Path):
-    if file_path.exists() and file_path.read_text().strip():
-        return json.loads(file_path.read_text())
-    return []
+    def release(self, agreement: str, year: int, document_id):
+        """Drop a pending claim that ended neither processed nor failed."""
+        self._execute(
+            "DELETE FROM documents WHERE key = ? AND state = 'pending'",
+            (build_key(year, document_id, agreement),),
+        )
+
+    def state_of(self, agreement: str, year: int, document_id):
+        row = self._execute(
+            "SELECT state FROM documents WHERE key = ?", (build_key(year, document_id, agreement),)
+        ).fetchone()
+        return row[0] if row else None
+
+    def entries(self, agreement: str, state: str, year: int = None):
+        query = "SELECT key, filename, document_id FROM documents WHERE agreement = ? AND state = ?"
+        params = [agreement, state]
+        if year is not None:
+            query += " AND year = ?"
+            params.append(year)
+        return self._execute(query + " ORDER BY key", params).fetchall()
+
+    def bulk_upsert(self, rows):
+        """Import (key, agreement, year, document_id, filename, state) rows in one transaction. Later rows win."""
+        conn = self._connection()
+        now = _now()
+        with conn:
+            conn.execute("BEGIN")
+            conn.executemany("""
+                INSERT INTO documents (key, agreement, year, document_id, filename, state, created_at, updated_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT (key) DO UPDATE SET state = excluded.state, filename = excluded.filename, updated_at = excluded.updated_at
+            """, [(*row, now, now) for row in rows])
+
+    def record_content(self, agreement: str, year: int, document_id, filename: str, sha256: str, size: int):
+        """
+        Look up a downloaded PDF by content hash.
+
+        If the same bytes belong to another document that is processed or still pending (e.g.
+        being uploaded by this run), the document is stored as processed plus an alias of that
+        one, and the canonical key is returned. Otherwise this document becomes the hash's owner
+        (taking over from a failed or untracked one) and None is returned, meaning: upload it.
+        """
+        key = build_key(year, document_id, agreement)
+        conn = self._connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute("""
+                SELECT c.key, d.state
+                FROM content_hashes c
+                LEFT JOIN documents d ON d.key = c.key
+                WHERE c.agreement = ? AND c.sha256 = ?
+            """, (agreement, sha256)).fetchone()
+            if row and row[0] != key and row[1] in ("processed", "pending"):
+                conn.execute("""
+                    INSERT INTO document_aliases (key, canonical_key, sha256, size, created_at)
+                    VALUES (?, ?, ?, ?, ?)
+                    ON CONFLICT (key) DO UPDATE SET canonical_key = excluded.canonical_key, sha256 = excluded.sha256
+                """, (key, row[0], sha256, size, _now()))
+                conn.execute("""
+                    INSERT INTO documents (key, agreement, year, document_id, filename, state, created_at, updated_at)
+                    VALUES (?, ?, ?, ?, ?, 'processed', ?, ?)
+                    ON CONFLICT (key) DO UPDATE SET state = 'processed', updated_at = excluded.updated_at
+                """, (key, agreement, year, str(document_id), filename, _now(), _now()))
+                conn.execute("COMMIT")
+                return row[0]
+            conn.execute("""
+                INSERT INTO content_hashes (agreement, sha256, key, size, created_at)
+                VALUES (?, ?, ?, ?, ?)
+                ON CONFLICT (agreement, sha256) DO UPDATE SET key = excluded.key, created_at = excluded.created_at
+            """, (agreement, sha256, key, size, _now()))
+            conn.execute("COMMIT")
+            return None
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def alias_counts(self, agreement: str = None):
+        """(aliases, bytes not uploaded) recorded so far."""
+        query = "SELECT count(*), coalesce(sum(size), 0) FROM document_aliases"
+        params = []
+        if agreement:
+            query += " WHERE key IN (SELECT key FROM documents WHERE agreement = ?)"
+            params.append(agreement)
+        return tuple(self._execute(query, params).fetchone())
+
+    def counts(self, agreement: str = None):
+        query = "SELECT CASE WHEN state = 'failed' AND parked = 1 THEN 'parked' ELSE state END, count(*) FROM documents"
+        params = []
+        if agreement:
+            query += " WHERE agreement = ?"
+            params.append(agreement)
+        return dict(self._execute(query + " GROUP BY 1", params).fetchall())
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_store() -> TrackerStore:
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = TrackerStore()
+        return _store
 
-def save_json(data, file_path: Path):
-    file_path.write_text(json.dumps(sorted(data, key=lambda x: x["key"]), indent=2))
 
 def load_processed_entries():
-    return load_json(get_processed_file())
+    return [{"key": key, "filename": filename} for key, filename, _ in get_store().entries(get_agreement_identifier(), "processed")]
 
 def load_pending_entries():
-    return load_json(get_pending_file())
+    return [{"key": key, "filename": filename} for key, filename, _ in get_store().entries(get_agreement_identifier(), "pending")]
+
+def load_failed_ids(year: int = None):
+    return {int(doc_id) if doc_id.isdigit() else doc_id
+            for _, _, doc_id in get_store().entries(get_agreement_identifier(), "failed", year)}
 
 def save_processed_entry(year: int, document_id: int, filename: str):
-    key = build_key(year, document_id)
-    entries = load_processed_entries()
-    if not any(e["key"] == key for e in entries):
-        entries.append({"key": key, "filename": filename})
-        save_json(entries, get_processed_file())
-
-def save_pending_entry(year: int, document_id: int, filename: str):
-    key = build_key(year, document_id)
-    entries = load_pending_entries()
-    if not any(e["key"] == key for e in entries):
-        entries.append({"key": key, "filename": filename})
-        save_json(entries, get_pending_file())
+    get_store().set_state(get_agreement_identifier(), year, document_id, filename, "processed")
+
+def save_pending_entry(year: int, document_id: int, filename: str, include_parked: bool = False) -> bool:
+    return get_store().claim(get_agreement_identifier(), year, document_id, filename, include_parked)
+
+def save_failed_entry(year: int, document_id: int, filename: str, error: str = None, permanent: bool = False,
+                      max_attempts: int = MAX_ATTEMPTS):
+    return get_store().mark_failed(get_agreement_identifier(), year, document_id, filename, error, permanent, max_attempts)
+
+def load_retry_candidates(year: int = None, include_parked: bool = False):
+    return [(int(doc_id) if doc_id.isdigit() else doc_id, filename, attempts)
+            for doc_id, filename, attempts in get_store().retry_candidates(get_agreement_identifier(), year, include_parked)]
+
+def next_retry_at(year: int = None):
+    value = get_store().next_attempt_at(get_agreement_identifier(), year)
+    return datetime.fromisoformat(value) if value else None
+
+def record_content_hash(year: int, document_id: int, filename: str, sha256: str, size: int):
+    """Canonical key if this PDF was already processed as another document (now recorded as its alias), else None."""
+    return get_store().record_content(get_agreement_identifier(), year, document_id, filename, sha256, size)
 
 def remove_pending_entry(year: int, document_id: int):
-    key = build_key(year, document_id)
-    entries = load_pending_entries()
-    entries = [e for e in entries if e["key"] != key]
-    save_json(entries, get_pending_file())
+    get_store().release(get_agreement_identifier(), year, document_id)
 
 def has_been_processed(year: int, document_id: int) -> bool:
-    key = build_key(year, document_id)
-    return any(e["key"] == key for e in load_processed_entries())
+    return get_store().state_of(get_agreement_identifier(), year, document_id) == "processed"
 
 def is_pending(year: int, document_id: int) -> bool:
-    key = build_key(year, document_id)
-    return any(e["key"] == key for e in load_pending_entries())
+    return get_store().state_of(get_agreement_identifier(), year, document_id) == "pending"
 
-def build_key(year: int, document_id: int) -> str:
-    return f"{year}:{get_agreement_identifier()}:{document_id}"
+def build_key(year: int, document_id: int, agreement: str = None) -> str:
+    return f"{year}:{agreement or get_agreement_identifier()}:{document_id}"
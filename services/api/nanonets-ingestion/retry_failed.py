@@ -1,71 +1,159 @@
-import sys
+"""
+Retry documents that failed to ingest.
+
+  python retry_failed.py <ACCOUNTING_YEAR> [async: true|false] [--concurrency 8] [--max-attempts 8]
+                         [--include-parked] [--keep-going]
+
+Due documents are retried in parallel; both APIs stay paced by the shared rate
+limiters, and PDFs downloaded before come from the local spool. Each failure is
+classified: permanent errors (the PDF is gone, Nanonets rejects the file) park the
+document, transient ones (429, 5xx, timeouts) schedule its next attempt with
+exponential backoff. Documents that run out of attempts are parked as well.
+"""
+
+import argparse
+import hashlib
 import time
-import json
-from pathlib import Path
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime, timezone
+
+import http_transport
+import rate_limiter
 from economic_client import fetch_pdf_economic
+from failures import describe_failure, is_permanent_failure
 from nanonets_client import send_pdf_to_nanonets
+from pdf_spool import get_spool
 from processed_tracker import (
-    has_been_processed,
-    save_processed_entry,
+    MAX_ATTEMPTS,
     get_agreement_identifier,
+    get_store,
+    load_retry_candidates,
+    next_retry_at,
+    record_content_hash,
     remove_pending_entry,
+    save_failed_entry,
     save_pending_entry,
+    save_processed_entry,
 )
-from formatter import beautify_nanonets_response
+from telemetry import RunTelemetry
+
+DEFAULT_CONCURRENCY = 8
+
+
+def _fail(year, doc_id, filename, error, permanent, max_attempts) -> str:
+    attempts, parked = save_failed_entry(year, doc_id, filename, error, permanent, max_attempts)
+    if parked:
+        reason = "permanent error" if permanent else f"gave up after {attempts} attempts"
+        print(f"🅿️ Parked {doc_id} ({reason}): {error}")
+        return "parked"
+    print(f"❌ Still failed: {doc_id} (attempt {attempts}): {error}")
+    return "failed"
+
+
+def retry_document(year: int, doc_id, filename: str, async_flag: bool, max_attempts: int = MAX_ATTEMPTS,
+                   include_parked: bool = False) -> str:
+    """One retry attempt. Returns processed, duplicate, failed, parked or skipped."""
+    if not save_pending_entry(year, doc_id, filename, include_parked=include_parked):
+        print(f"⏭️ Skipping {doc_id}: picked up by another run")
+        return "skipped"
+
+    try:
+        pdf_data = get_spool().fetch(get_agreement_identifier(), doc_id, fetch_pdf_economic)
+        canonical_key = record_content_hash(year, doc_id, filename, hashlib.sha256(pdf_data).hexdigest(), len(pdf_data))
+        if canonical_key:
+            print(f"♻️ {doc_id} is a duplicate of {canonical_key}, skipping upload")
+            return "duplicate"
+
+        result = send_pdf_to_nanonets(pdf_data, filename=filename, async_mode=async_flag)
+        if result.get("message") in ("Success", "TimeoutAssumedSuccess"):
+            print(f"✅ Success for {doc_id} (reprocessed)")
+            save_processed_entry(year, doc_id, filename)
+            return "processed"
+        return _fail(year, doc_id, filename, f"Nanonets response: {result.get('message')}", False, max_attempts)
+    except Exception as e:
+        return _fail(year, doc_id, filename, describe_failure(e), is_permanent_failure(e), max_attempts)
+    finally:
+        # No-op once the document is processed or failed; drops the claim if anything else went wrong
+        remove_pending_entry(year, doc_id)
+
+
+def run_retries(year: int, async_flag: bool, concurrency: int = DEFAULT_CONCURRENCY,
+                max_attempts: int = MAX_ATTEMPTS, include_parked: bool = False, keep_going: bool = False) -> Counter:
+    # Resolve the agreement once before the workers start
+    get_agreement_identifier()
+    totals = Counter()
+    started = time.perf_counter()
+
+    while True:
+        candidates = load_retry_candidates(year, include_parked=include_parked)
+        if candidates:
+            print(f"🔁 Retrying {len(candidates)} failed documents with {concurrency} workers")
+            with ThreadPoolExecutor(max_workers=concurrency) as pool:
+                futures = [
+                    pool.submit(retry_document, year, doc_id, filename, async_flag, max_attempts, include_parked)
+                    for doc_id, filename, _ in candidates
+                ]
+                for future in as_completed(futures):
+                    totals[future.result()] += 1
+        # Parked documents only get the one extra pass that was asked for
+        include_parked = False
+
+        if not keep_going:
+            break
+        due = next_retry_at(year)
+        if due is None:
+            break
+        wait = (due - datetime.now(timezone.utc)).total_seconds()
+        if wait > 0:
+            print(f"⏳ Next retry due in {wait:.0f}s")
+            time.sleep(wait)
+
+    elapsed = time.perf_counter() - started
+    handled = sum(totals.values())
+    print(f"\n🔁 Retry complete in {elapsed:.0f}s ({60.0 * handled / elapsed if elapsed else 0:.1f} docs/min): "
+          + ", ".join(f"{count} {outcome}" for outcome, count in sorted(totals.items())))
+    return totals
 
-FAILED_DIR = Path("failed_documents")
 
-def get_failed_file():
-    agreement = get_agreement_identifier()
-    return FAILED_DIR / f"{agreement}_failed.json"
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("year", type=int, help="accounting year")
+    parser.add_argument("async_mode", nargs="?", choices=["true", "false"], default="true",
+                        help="Nanonets async processing (default true)")
+    parser.add_argument("--concurrency", type=int, default=DEFAULT_CONCURRENCY)
+    parser.add_argument("--max-attempts", type=int, default=MAX_ATTEMPTS,
+                        help="park a document after this many transient failures")
+    parser.add_argument("--include-parked", action="store_true", help="also retry parked documents once")
+    parser.add_argument("--keep-going", action="store_true",
+                        help="wait for backed-off documents to come due until none are left")
+    args = parser.parse_args()
+    http_transport.configure(args.concurrency)
 
-def load_failed_ids():
-    failed_file = get_failed_file()
-    if failed_file.exists():
-        return set(json.loads(failed_file.read_text()))
-    return set()
+    telemetry = RunTelemetry("retry")
+    totals = run_retries(
+        args.year,
+        args.async_mode == "true",
+        concurrency=args.concurrency,
+        max_attempts=args.max_attempts,
+        include_parked=args.include_parked,
+        keep_going=args.keep_going,
+    )
+    counts = get_store().counts(get_agreement_identifier())
+    print(f"📋 Tracker: {counts}")
+    print(get_spool().summary())
+    print(rate_limiter.summary())
+    print(http_transport.summary())
+    telemetry.set_tenant(get_agreement_identifier(), {
+        "listed": sum(totals.values()),
+        "skipped": totals["skipped"],
+        "uploaded": totals["processed"],
+        "duplicates": totals["duplicate"],
+        "failed": totals["failed"],
+        "parked": totals["parked"],
+    })
+    telemetry.write()
 
-def save_failed_ids(failed_ids):
-    failed_file = get_failed_file()
-    failed_file.write_text(json.dumps(sorted(failed_ids), indent=2))
 
 if __name__ == "__main__":
-    if len(sys.argv) < 2:
-        print("Usage: python retry_failed.py <ACCOUNTING_YEAR> [async: true|false]")
-        sys.exit(1)
-
-    year = int(sys.argv[1])
-    async_flag = True
-    if len(sys.argv) >= 3 and sys.argv[2].lower() in ("true", "false"):
-        async_flag = sys.argv[2].lower() == "true"
-
-    failed_ids = load_failed_ids()
-    still_failed = set()
-
-    for doc_id in failed_ids:
-        if has_been_processed(year, doc_id):
-            print(f"✅ Already processed: {doc_id}")
-            continue
-
-        filename = f"{doc_id}.pdf"
-        save_pending_entry(year, doc_id, filename)
-
-        try:
-            pdf_data = fetch_pdf_economic(doc_id)
-            result = send_pdf_to_nanonets(pdf_data, filename=filename, async_mode=async_flag)
-
-            if result.get("message") in ("Success", "TimeoutAssumedSuccess"):
-                print(f"✅ Success for {doc_id} (reprocessed)")
-                save_processed_entry(year, doc_id, filename)
-            else:
-                print(f"❌ Still failed: {doc_id}")
-                still_failed.add(doc_id)
-        except Exception as e:
-            print(f"💥 Exception for {doc_id}: {e}")
-            still_failed.add(doc_id)
-        finally:
-            remove_pending_entry(year, doc_id)
-            time.sleep(0.3)
-
-    save_failed_ids(still_failed)
-    print(f"\n🔁 Retry complete. Remaining failures: {len(still_failed)}")
+    main()
@@ -0,0 +1,150 @@
+"""
+Run telemetry for the ingesters: a JSON report per run and a Prometheus textfile.
+
+  <TELEMETRY_DIR>/<run>_<UTC timestamp>.json    full report (documents and bytes per tenant,
+                                                per-host latency histograms, 429/5xx counts,
+                                                time spent throttled, PDF spool hits)
+  <TELEMETRY_PROM_FILE>                         the same numbers as Prometheus metrics for the node_exporter
+                                                textfile collector (default <TELEMETRY_DIR>/<run>.prom)
+
+Both files are written to a temp file and renamed, so readers never see a partial file.
+"""
+
+import json
+import os
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+
+import http_transport
+import rate_limiter
+from pdf_spool import get_spool
+
+TELEMETRY_DIR = Path(os.getenv("TELEMETRY_DIR", "telemetry"))
+PROM_FILE = os.getenv("TELEMETRY_PROM_FILE")
+
+DOCUMENT_COUNTERS = ("listed", "skipped", "downloaded", "uploaded", "duplicates", "failed", "parked")
+BYTE_COUNTERS = ("bytes_downloaded", "bytes_uploaded", "bytes_deduplicated")
+
+
+class RunTelemetry:
+    def __init__(self, run: str):
+        self.run = run
+        self.started_at = datetime.now(timezone.utc)
+        self._started = time.perf_counter()
+        self.tenants = {}
+
+    def set_tenant(self, tenant: str, counters: dict):
+        """Document and byte counters of one tenant (agreement / organization) for this run."""
+        self.tenants[tenant] = {key: value for key, value in counters.items() if key in DOCUMENT_COUNTERS + BYTE_COUNTERS}
+
+    def report(self) -> dict:
+        duration = time.perf_counter() - self._started
+        totals = {}
+        for counters in self.tenants.values():
+            for key, value in counters.items():
+                totals[key] = totals.get(key, 0) + value
+        handled = sum(totals.get(key, 0) for key in ("uploaded", "duplicates", "failed", "parked"))
+        return {
+            "run": self.run,
+            "started_at": self.started_at.isoformat(),
+            "finished_at": datetime.now(timezone.utc).isoformat(),
+            "duration_seconds": round(duration, 3),
+            "docs_per_minute": round(60.0 * handled / duration, 2) if duration else 0.0,
+            "totals": totals,
+            "tenants": self.tenants,
+            "http": http_transport.all_stats(),
+            "rate_limits": rate_limiter.all_stats(),
+            "pdf_spool": dict(get_spool().stats),
+        }
+
+    def write(self, report: dict = None):
+        """Write the JSON report and Prometheus textfile; returns both paths."""
+        report = report or self.report()
+        TELEMETRY_DIR.mkdir(parents=True, exist_ok=True)
+        json_path = TELEMETRY_DIR / f"{self.run}_{self.started_at.strftime('%Y%m%dT%H%M%SZ')}.json"
+        _write_atomic(json_path, json.dumps(report, indent=2, default=str))
+        prom_path = Path(PROM_FILE) if PROM_FILE else TELEMETRY_DIR / f"{self.run}.prom"
+        _write_atomic(prom_path, prometheus_text(report))
+        print(f"📈 Telemetry: {json_path}, {prom_path}")
+        return json_path, prom_path
+
+
+def _write_atomic(path: Path, text: str):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+    tmp.write_text(text)
+    os.replace(tmp, path)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(**labels) -> str:
+    return "{" + ",".join(f'{key}="{_escape(value)}"' for key, value in labels.items()) + "}"
+
+
+def prometheus_text(report: dict) -> str:
+    run = report["run"]
+    lines = []
+
+    def metric(name, help_text, samples):
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} gauge")
+        for labels, value in samples:
+            lines.append(f"{name}{_labels(run=run, **labels)} {value}")
+
+    metric("ingestion_last_run_timestamp_seconds", "End of the last run (unix time).",
+           [({}, round(datetime.fromisoformat(report["finished_at"]).timestamp(), 3))])
+    metric("ingestion_run_duration_seconds", "Duration of the last run.", [({}, report["duration_seconds"])])
+    metric("ingestion_run_docs_per_minute", "Documents handled per minute in the last run.",
+           [({}, report["docs_per_minute"])])
+    metric("ingestion_documents", "Documents per tenant and stage in the last run.", [
+        ({"tenant": tenant, "stage": stage}, counters.get(stage, 0))
+        for tenant, counters in report["tenants"].items()
+        for stage in DOCUMENT_COUNTERS if stage in counters
+    ])
+    metric("ingestion_bytes", "Bytes per tenant in the last run.", [
+        ({"tenant": tenant, "kind": kind[len("bytes_"):]}, counters.get(kind, 0))
+        for tenant, counters in report["tenants"].items()
+        for kind in BYTE_COUNTERS if kind in counters
+    ])
+
+    http = report["http"]
+    metric("ingestion_http_requests", "HTTP requests per host.", [({"host": h}, s["requests"]) for h, s in http.items()])
+    metric("ingestion_http_errors", "HTTP requests per host that failed or returned 5xx.",
+           [({"host": h}, s["errors"]) for h, s in http.items()])
+    metric("ingestion_http_request_seconds_p50", "Median request latency per host (histogram bucket bound).",
+           [({"host": h}, s["p50_seconds"]) for h, s in http.items()])
+    metric("ingestion_http_request_seconds_p95", "95th percentile request latency per host (histogram bucket bound).",
+           [({"host": h}, s["p95_seconds"]) for h, s in http.items()])
+    lines.append("# HELP ingestion_http_request_seconds Request latency histogram per host.")
+    lines.append("# TYPE ingestion_http_request_seconds histogram")
+    for host, s in http.items():
+        cumulative = 0
+        for bound, count in s["buckets"].items():
+            cumulative += count
+            le = "+Inf" if bound == float("inf") else bound
+            lines.append(f"ingestion_http_request_seconds_bucket{_labels(run=run, host=host, le=le)} {cumulative}")
+        lines.append(f"ingestion_http_request_seconds_sum{_labels(run=run, host=host)} {round(s['total_seconds'], 3)}")
+        lines.append(f"ingestion_http_request_seconds_count{_labels(run=run, host=host)} {s['requests']}")
+    metric("ingestion_http_connections_reused", "Requests that reused a pooled connection.",
+           [({"host": h}, s["connections_reused"]) for h, s in http.items()])
+
+    limits = report["rate_limits"]
+    metric("ingestion_rate_limit_throttled", "429 responses per host.",
+           [({"host": h}, s["throttled"]) for h, s in limits.items()])
+    metric("ingestion_rate_limit_server_errors", "5xx responses per host.",
+           [({"host": h}, s["server_errors"]) for h, s in limits.items()])
+    metric("ingestion_rate_limit_throttled_seconds", "Wall-clock time the host was blocked by Retry-After / 429 penalties.",
+           [({"host": h}, round(s["throttled_seconds"], 3)) for h, s in limits.items()])
+    metric("ingestion_rate_limit_wait_seconds", "Caller time spent waiting for rate limit tokens.",
+           [({"host": h}, round(s["waited_seconds"], 3)) for h, s in limits.items()])
+    metric("ingestion_rate_limit_rate", "Request rate (req/s) the limiter ended the run at.",
+           [({"host": h}, s["rate"]) for h, s in limits.items()])
+
+    spool = report["pdf_spool"]
+    metric("ingestion_pdf_spool_hits", "PDFs read from the local spool.", [({}, spool.get("hits", 0))])
+    metric("ingestion_pdf_spool_misses", "PDFs not in the local spool.", [({}, spool.get("misses", 0))])
+    return "\n".join(lines) + "\n"
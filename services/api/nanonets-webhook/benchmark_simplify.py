@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+"""
+Compare the single-pass simplify_prediction against the previous implementation
+on synthetic invoices, including the JSON serialization done per webhook
+(previously twice: once to log the size, once for the insert).
+
+  python benchmark_simplify.py                      # 500-line invoices
+  python benchmark_simplify.py --lines 2000 --documents 20 --tables 3
+"""
+
+import argparse
+import json
+import random
+import time
+
+from load_test import synthetic_document
+from prediction import DocumentPayload, simplify_prediction
+
+
+def legacy_simplify_prediction(predictions):
+    """simplify_prediction as it was before the single-pass assembler (size print left out)."""
+    simplified = []
+    seen_labels = set()
+    table_rows = []
+    table_columns = set()
+
+    for field in predictions:
+        label = field.label.strip().lower()
+        if field.type == "table" and field.cells:
+            row_map = {}
+            for cell in field.cells:
+                row = cell.get("row")
+                col_label = cell.get("label", "").strip().lower()
+                text = cell.get("text", "")
+                if row is not None and col_label:
+                    row_map.setdefault(row, {})[col_label] = text
+                    table_columns.add(col_label)
+            for row_idx in sorted(row_map.keys()):
+                table_rows.append([
+                    row_map[row_idx].get(col, "") for col in sorted(table_columns)
+                ])
+        elif label not in seen_labels:
+            simplified.append({"label": label, "ocr_text": field.ocr_text or ""})
+            seen_labels.add(label)
+
+    if table_rows:
+        simplified.append({"label": "table", "type": "table", "columns": sorted(table_columns), "rows": table_rows})
+    return simplified
+
+
+def legacy_webhook(predictions) -> str:
+    simplified = legacy_simplify_prediction(predictions)
+    len(json.dumps(simplified))  # size log
+    return json.dumps(simplified)  # insert
+
+
+def webhook(predictions) -> str:
+    return json.dumps(simplify_prediction(predictions))
+
+
+def make_payloads(documents, lines, tables, seed=42):
+    rng = random.Random(seed)
+    payloads = []
+    for n in range(documents):
+        result = synthetic_document(f"bench-{n}.pdf", lines, rng)["result"]
+        table = result["prediction"].pop()
+        # Split the invoice lines over several table fields; later tables get an extra column
+        per_table = -(-lines // tables)
+        for t in range(tables):
+            cells = [dict(cell) for cell in table["cells"] if t * per_table < cell["row"] <= (t + 1) * per_table]
+            if t:
+                cells += [{"row": cell["row"], "label": f"note_{t}", "text": "x"} for cell in cells if cell["col"] == 1]
+            result["prediction"].append({"label": "table", "type": "table", "cells": cells})
+        payloads.append(DocumentPayload(**result))
+    return payloads
+
+
+def timed(fn, payloads, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        for payload in payloads:
+            fn(payload.prediction)
+        best = min(best, time.perf_counter() - started)
+    return best / len(payloads)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--documents", type=int, default=50)
+    parser.add_argument("--lines", type=int, default=500, help="invoice lines per document")
+    parser.add_argument("--tables", type=int, default=1, help="table fields the lines are split over")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    payloads = make_payloads(args.documents, args.lines, args.tables)
+    legacy = timed(legacy_webhook, payloads, args.repeat)
+    current = timed(webhook, payloads, args.repeat)
+    print(f"📊 {args.documents} documents × {args.lines} lines in {args.tables} table(s), best of {args.repeat}")
+    print(f"   before: {legacy * 1000:.2f} ms/document")
+    print(f"   after:  {current * 1000:.2f} ms/document ({legacy / current:.1f}x faster)")
+
+    same = all(legacy_webhook(p.prediction) == webhook(p.prediction) for p in payloads)
+    if args.tables == 1:
+        print(f"   {'✅' if same else '❌'} Output identical for single-table documents")
+    else:
+        print(f"   ℹ️ Multi-table output differs by design (each table keeps its own columns): {not same}")
+
+
+if __name__ == "__main__":
+    main()
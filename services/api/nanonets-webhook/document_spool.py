@@ -0,0 +1,185 @@
+"""
+Durable spool between the webhook and extracted_data.
+
+The webhook appends each validated document to a local SQLite file (WAL) and
+acknowledges once the row is committed, without touching Postgres. A background
+flusher moves spooled documents into extracted_data with one multi-row INSERT
+per batch: every FLUSH_BATCH_SIZE documents or FLUSH_INTERVAL_MS, whichever
+comes first. Spool rows are only deleted after the Postgres commit, and each row
+keeps the extracted_data id it was given on arrival, so a crash between the two
+commits re-sends the batch and ON CONFLICT (id) DO NOTHING skips what was stored.
+Documents left in the spool by a crash are flushed when the service starts.
+
+The spool is only used when WEBHOOK_SPOOL_DB is set, and it must point to storage
+that survives restarts and deploys (e.g. a Render persistent disk). Without it the
+webhook inserts each document with insert_documents() before acknowledging.
+"""
+
+import asyncio
+import os
+import sqlite3
+import threading
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+from uuid import uuid4
+
+SPOOL_DB = os.getenv("WEBHOOK_SPOOL_DB")
+FLUSH_BATCH_SIZE = int(os.getenv("FLUSH_BATCH_SIZE", "100"))
+FLUSH_INTERVAL_MS = int(os.getenv("FLUSH_INTERVAL_MS", "500"))
+RETRY_BACKOFF_MAX = 30.0
+
+INSERT_COLUMNS = (
+    "id, external_id, data, status, organization_id, business_unit_id, data_source_id, created_at, updated_at"
+)
+
+
+async def insert_documents(conn, documents, organization_id: str, data_source_id: str):
+    """
+    Insert (id, external_id, data JSON text, created_at) documents into extracted_data with
+    one multi-row INSERT. Ids that are already stored are skipped.
+    """
+    now = datetime.now(timezone.utc)
+    values, params = [], []
+    for document_id, external_id, data, created_at in documents:
+        values.append("(%s, %s, %s::jsonb, %s, %s, NULL, %s, %s, %s)")
+        params.extend([document_id, external_id, data, "pending", organization_id, data_source_id, created_at, now])
+    await conn.execute(
+        f"INSERT INTO extracted_data ({INSERT_COLUMNS}) VALUES {', '.join(values)} ON CONFLICT (id) DO NOTHING",
+        params,
+    )
+
+
+class DocumentSpool:
+    def __init__(self, path):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        # One connection shared by the event loop's worker threads, serialized by the lock
+        self._conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=FULL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS spooled_documents (
+                seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                id TEXT NOT NULL,
+                external_id TEXT NOT NULL,
+                data TEXT NOT NULL,
+                received_at TEXT NOT NULL
+            )
+        """)
+        self._lock = threading.Lock()
+
+    def append(self, external_id: str, data: str) -> str:
+        """Spool one document (data is its JSON text). Returns its extracted_data id once durable."""
+        document_id = str(uuid4())
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO spooled_documents (id, external_id, data, received_at) VALUES (?, ?, ?, ?)",
+                (document_id, external_id, data, datetime.now(timezone.utc).isoformat()),
+            )
+        return document_id
+
+    def peek(self, limit: int):
+        with self._lock:
+            return self._conn.execute(
+                "SELECT seq, id, external_id, data, received_at FROM spooled_documents ORDER BY seq LIMIT ?", (limit,)
+            ).fetchall()
+
+    def remove_through(self, seq: int):
+        """Drop every document up to seq, i.e. the batch peek() returned (new documents get higher seqs)."""
+        with self._lock:
+            self._conn.execute("DELETE FROM spooled_documents WHERE seq <= ?", (seq,))
+
+    def backlog(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM spooled_documents").fetchone()[0]
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class BatchFlusher:
+    """Background task that drains the spool into extracted_data in multi-row batches."""
+
+    def __init__(self, spool: DocumentSpool, pool, organization_id: str, resolve_data_source,
+                 batch_size: int = FLUSH_BATCH_SIZE, interval_ms: int = FLUSH_INTERVAL_MS):
+        self.spool = spool
+        self.pool = pool
+        self.organization_id = organization_id
+        self.resolve_data_source = resolve_data_source
+        self.batch_size = batch_size
+        self.interval = interval_ms / 1000
+        self.pending = 0
+        self.stats = {"flushed": 0, "batches": 0, "errors": 0, "last_flush_ms": 0.0}
+        self._wakeup = asyncio.Event()
+        self._stopping = False
+        self._task = None
+
+    def start(self):
+        self.pending = self.spool.backlog()
+        if self.pending:
+            print(f"♻️ Recovering {self.pending} spooled documents from an earlier run")
+        self._task = asyncio.create_task(self._run())
+
+    def notify(self):
+        """A document was spooled: flush early once a full batch is waiting."""
+        self.pending += 1
+        if self.pending >= self.batch_size:
+            self._wakeup.set()
+
+    async def stop(self):
+        """Flush what is left, then stop."""
+        self._stopping = True
+        self._wakeup.set()
+        if self._task:
+            await self._task
+
+    async def _run(self):
+        backoff = 1.0
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            try:
+                # Keep flushing while full batches are waiting, so a burst drains without waiting for the timer
+                while await self.flush_once() == self.batch_size:
+                    pass
+                backoff = 1.0
+            except Exception as e:
+                # Documents stay in the spool; try again after a backoff
+                self.stats["errors"] += 1
+                print(f"🔥 Flush to extracted_data failed ({self.pending} spooled), retrying in {backoff:.0f}s: {e}")
+                if self._stopping:
+                    return
+                await asyncio.sleep(backoff)
+                backoff = min(backoff * 2, RETRY_BACKOFF_MAX)
+                continue
+            if self._stopping:
+                return
+
+    async def flush_once(self) -> int:
+        rows = await asyncio.to_thread(self.spool.peek, self.batch_size)
+        if not rows:
+            self.pending = 0
+            return 0
+        started = time.perf_counter()
+        async with self.pool.connection() as conn:
+            data_source_id = await self.resolve_data_source(conn)
+            if not data_source_id:
+                raise RuntimeError("Could not find data_source for this model")
+            documents = [
+                (document_id, external_id, data, datetime.fromisoformat(received_at))
+                for _, document_id, external_id, data, received_at in rows
+            ]
+            await insert_documents(conn, documents, self.organization_id, data_source_id)
+        # Only after the commit: a crash before this line re-sends the batch, which the ON CONFLICT absorbs
+        await asyncio.to_thread(self.spool.remove_through, rows[-1][0])
+        self.pending = max(self.pending - len(rows), 0)
+        self.stats["flushed"] += len(rows)
+        self.stats["batches"] += 1
+        self.stats["last_flush_ms"] = round((time.perf_counter() - started) * 1000, 1)
+        print(f"✅ Flushed {len(rows)} documents to extracted_data in {self.stats['last_flush_ms']:.0f} ms")
+        return len(rows)
@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+"""
+Burst load test for the webhook: fires Nanonets-style document webhooks concurrently
+and reports request latency percentiles and throughput.
+
+  python load_test.py http://localhost:10000 --requests 500 --concurrency 50
+  python load_test.py https://your-service-url.onrender.com --requests 200 --concurrency 20 --lines 100
+
+Each request is one synthetic invoice (--lines table rows). Documents are stored in
+extracted_data like real ones (status 'pending', so the ETL would pick them up), with
+external_id 'loadtest-<run>-<n>.pdf'. At the end the run deletes its documents through
+DATABASE_URL, waiting for the webhook's spool to flush the acknowledged ones.
+Targets other than localhost are refused unless --allow-prod is given, and then
+DATABASE_URL is required so the cleanup can run.
+"""
+
+import argparse
+import os
+import random
+import statistics
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlparse
+from uuid import uuid4
+
+import psycopg
+import requests
+from dotenv import load_dotenv
+
+COLUMNS = ["description", "quantity", "unit_price", "amount", "product_code"]
+LOCAL_HOSTS = {"localhost", "127.0.0.1", "::1"}
+
+
+def synthetic_document(filename: str, lines: int, rng: random.Random) -> dict:
+    prediction = [
+        {"label": "invoice_number", "ocr_text": str(rng.randint(10000, 99999)), "type": "field", "score": 0.99},
+        {"label": "seller_name", "ocr_text": "Load Test Leverandør ApS", "type": "field", "score": 0.98},
+        {"label": "invoice_date", "ocr_text": "2025-01-15", "type": "field", "score": 0.97},
+    ]
+    cells = []
+    for row in range(1, lines + 1):
+        values = [f"Vare {row}", str(rng.randint(1, 20)), f"{rng.uniform(5, 500):.2f}", f"{rng.uniform(5, 5000):.2f}",
+                  f"P{rng.randint(1000, 9999)}"]
+        cells.extend({"row": row, "col": col, "label": label, "text": text}
+                     for col, (label, text) in enumerate(zip(COLUMNS, values), start=1))
+    prediction.append({"label": "table", "type": "table", "cells": cells})
+    return {"result": {"input": filename, "prediction": prediction}}
+
+
+def percentile(sorted_values, q: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = min(int(round(q * (len(sorted_values) - 1))), len(sorted_values) - 1)
+    return sorted_values[index]
+
+
+def cleanup(database_url: str, run_id: str, acknowledged: int, timeout: float) -> int:
+    """Delete the run's documents, polling until every acknowledged one was flushed and deleted (or timeout)."""
+    deleted = 0
+    deadline = time.monotonic() + timeout
+    with psycopg.connect(database_url, autocommit=True) as conn:
+        while True:
+            cur = conn.execute("DELETE FROM extracted_data WHERE external_id LIKE %s", (f"loadtest-{run_id}-%",))
+            deleted += cur.rowcount
+            if deleted >= acknowledged or time.monotonic() >= deadline:
+                return deleted
+            time.sleep(1.0)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("base_url", help="webhook service URL, e.g. http://localhost:10000")
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--lines", type=int, default=30, help="invoice lines per document")
+    parser.add_argument("--timeout", type=float, default=60.0)
+    parser.add_argument("--allow-prod", action="store_true", help="allow a target other than localhost")
+    parser.add_argument("--cleanup-timeout", type=float, default=30.0,
+                        help="seconds to wait for spooled documents to reach extracted_data before giving up")
+    args = parser.parse_args()
+
+    load_dotenv()
+    database_url = os.getenv("DATABASE_URL")
+    if urlparse(args.base_url).hostname not in LOCAL_HOSTS:
+        if not args.allow_prod:
+            parser.error(f"{args.base_url} is not local: the documents would reach the ETL. Pass --allow-prod to run anyway")
+        if not database_url:
+            parser.error("--allow-prod needs DATABASE_URL so the run can delete its documents")
+
+    run_id = uuid4().hex[:8]
+    rng = random.Random(run_id)
+    bodies = [synthetic_document(f"loadtest-{run_id}-{n}.pdf", args.lines, rng) for n in range(args.requests)]
+    url = args.base_url.rstrip("/") + "/webhook"
+
+    local = threading.local()
+    latencies, statuses, lock = [], {}, threading.Lock()
+
+    def send(body):
+        session = getattr(local, "session", None)
+        if session is None:
+            session = local.session = requests.Session()
+        started = time.perf_counter()
+        try:
+            status = session.post(url, json=body, timeout=args.timeout).status_code
+        except requests.exceptions.RequestException as e:
+            status = type(e).__name__
+        elapsed = time.perf_counter() - started
+        with lock:
+            latencies.append(elapsed)
+            statuses[status] = statuses.get(status, 0) + 1
+
+    print(f"🚀 Sending {args.requests} webhooks ({args.lines} lines each) to {url} with {args.concurrency} in parallel")
+    started = time.perf_counter()
+    try:
+        with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+            list(pool.map(send, bodies))
+        elapsed = time.perf_counter() - started
+
+        latencies.sort()
+        print(f"\n📊 {len(latencies)} requests in {elapsed:.1f}s ({len(latencies) / elapsed:.1f} req/s)")
+        print(f"   Status: {', '.join(f'{status}: {count}' for status, count in sorted(statuses.items(), key=str))}")
+        print(f"   Latency ms: mean {statistics.mean(latencies) * 1000:.0f}, p50 {percentile(latencies, 0.5) * 1000:.0f}, "
+              f"p95 {percentile(latencies, 0.95) * 1000:.0f}, p99 {percentile(latencies, 0.99) * 1000:.0f}, "
+              f"max {latencies[-1] * 1000:.0f}")
+    finally:
+        # Also runs on Ctrl+C, so an interrupted burst leaves nothing for the ETL
+        statement = f"DELETE FROM extracted_data WHERE external_id LIKE 'loadtest-{run_id}-%';"
+        acknowledged = sum(count for status, count in statuses.items() if isinstance(status, int) and status < 300)
+        if database_url:
+            deleted = cleanup(database_url, run_id, acknowledged, args.cleanup_timeout)
+            print(f"\n🧹 Deleted {deleted} load test documents ({acknowledged} acknowledged)")
+            if deleted < acknowledged:
+                print(f"⚠️ Some documents were not flushed in time, delete them later: {statement}")
+        else:
+            print(f"\n🧹 DATABASE_URL not set, delete the documents yourself: {statement}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+"""
+Nanonets prediction models and the simplified form stored in extracted_data.data.
+
+simplify_prediction() keeps the first value of each flat field and turns every table
+field into its own {"type": "table", "columns": [...], "rows": [[...], ...]} item.
+Each table is assembled in one pass over its cells: cells are grouped by row, the
+column order is fixed once per table (sorted labels), and rows are emitted against
+that order, so cells of one table never shift the rows of another.
+"""
+
+from typing import Any, Dict, List, Optional
+
+from pydantic import BaseModel
+
+
+class PredictionField(BaseModel):
+    label: str
+    ocr_text: Optional[str] = None
+    type: Optional[str] = None
+    score: Optional[float] = None
+    cells: Optional[List[Dict[str, Any]]] = None
+
+
+class DocumentPayload(BaseModel):
+    input: str
+    prediction: List[PredictionField]
+
+
+def assemble_table(cells: List[Dict[str, Any]]) -> Optional[dict]:
+    rows = {}
+    columns = set()
+    for cell in cells:
+        row = cell.get("row")
+        column = (cell.get("label") or "").strip().lower()
+        if row is None or not column:
+            continue
+        rows.setdefault(row, {})[column] = cell.get("text", "")
+        columns.add(column)
+    if not rows:
+        return None
+    ordered = sorted(columns)
+    return {
+        "label": "table",
+        "type": "table",
+        "columns": ordered,
+        "rows": [[values.get(column, "") for column in ordered] for _, values in sorted(rows.items())],
+    }
+
+
+def simplify_prediction(predictions: List[PredictionField]) -> List[dict]:
+    simplified = []
+    tables = []
+    seen_labels = set()
+
+    for field in predictions:
+        if field.type == "table" and field.cells:
+            table = assemble_table(field.cells)
+            if table:
+                tables.append(table)
+            continue
+
+        # Flat fields: the first value of a label wins
+        label = field.label.strip().lower()
+        if label not in seen_labels:
+            simplified.append({"label": label, "ocr_text": field.ocr_text or ""})
+            seen_labels.add(label)
+
+    # Tables go after the flat fields, in document order
+    simplified.extend(tables)
+    return simplified
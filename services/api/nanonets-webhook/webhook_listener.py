@@ -1,17 +1,76 @@
+from contextlib import asynccontextmanager
 from fastapi import FastAPI, Request, HTTPException
-from pydantic import BaseModel
-from typing import Optional, List, Dict, Any
+from typing import Optional
 import os
 import json
-import psycopg2
+import asyncio
+import psycopg
+from psycopg_pool import AsyncConnectionPool
 from dotenv import load_dotenv
-from uuid import uuid4
-from datetime import datetime
 import traceback
+from datetime import datetime, timezone
+from uuid import uuid4
+from document_spool import SPOOL_DB, BatchFlusher, DocumentSpool, insert_documents
+from prediction import DocumentPayload, simplify_prediction
 
 # Load environment variables
 load_dotenv()
-app = FastAPI()
+
+# --- Constants ---
+MODEL_ID = os.getenv("NANONETS_MODEL_ID")
+DEFAULT_ORG_ID = os.getenv("DEFAULT_ORG_ID")
+
+# --- DB connection pool ---
+# Each connection is checked before it is handed out, and the pool reconnects in the
+# background when the database drops connections.
+DB_POOL_MIN_SIZE = int(os.getenv("DB_POOL_MIN_SIZE", "1"))
+DB_POOL_MAX_SIZE = int(os.getenv("DB_POOL_MAX_SIZE", "10"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "10"))
+
+pool = AsyncConnectionPool(
+    os.getenv("DATABASE_URL"),
+    min_size=DB_POOL_MIN_SIZE,
+    max_size=DB_POOL_MAX_SIZE,
+    timeout=DB_POOL_TIMEOUT,
+    max_idle=300,
+    check=AsyncConnectionPool.check_connection,
+    open=False,
+)
+
+# --- Document spool ---
+# With WEBHOOK_SPOOL_DB set (on a persistent disk), webhooks are acknowledged once the document
+# is in the local spool and the flusher writes them to extracted_data in batches (see
+# document_spool.py). Without it, each webhook inserts its document before acknowledging.
+spool = DocumentSpool(SPOOL_DB) if SPOOL_DB else None
+flusher = None
+
+# data_source of MODEL_ID, cached once found
+data_source_id: Optional[str] = None
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    global flusher
+    # Opened without waiting: the service starts even if the database is briefly unreachable
+    await pool.open()
+    try:
+        async with pool.connection() as conn:
+            if not await resolve_data_source(conn):
+                print(f"⚠️ No data_source found for model {MODEL_ID}: webhooks are rejected until it exists")
+    except Exception as e:
+        print(f"⚠️ Could not look up the data_source at startup, will retry per request: {e}")
+    if spool:
+        flusher = BatchFlusher(spool, pool, DEFAULT_ORG_ID, resolve_data_source)
+        flusher.start()
+    else:
+        print("ℹ️ WEBHOOK_SPOOL_DB not set: documents are inserted into extracted_data before acknowledging")
+    yield
+    if flusher:
+        await flusher.stop()
+    await pool.close()
+    if spool:
+        spool.close()
+
+app = FastAPI(lifespan=lifespan)
 
 @app.get("/")
 async def root():
@@ -27,82 +86,33 @@ async def health_check():
 @app.get("/healthz/detailed")
 async def detailed_health_check():
     """Detailed health check with database connectivity test"""
+    stats = pool.get_stats()
+    pool_stats = {key: stats.get(key, 0) for key in ("pool_size", "pool_available", "requests_waiting", "connections_lost")}
+    if spool:
+        spool_stats = {"enabled": True, "backlog": await asyncio.to_thread(spool.backlog), **flusher.stats}
+    else:
+        spool_stats = {"enabled": False}
     try:
         # Test database connection
-        cur.execute("SELECT 1")
-        return {"status": "healthy", "database": "connected"}
+        async with pool.connection(timeout=5) as conn:
+            await conn.execute("SELECT 1")
+        return {"status": "healthy", "database": "connected", "pool": pool_stats, "spool": spool_stats}
     except Exception as e:
-        return {"status": "unhealthy", "database": "disconnected", "error": str(e)}
-
-# --- DB connection ---
-conn = psycopg2.connect(os.getenv("DATABASE_URL"))
-cur = conn.cursor()
-
-# --- Constants ---
-MODEL_ID = os.getenv("NANONETS_MODEL_ID")
-DEFAULT_ORG_ID = os.getenv("DEFAULT_ORG_ID")
-
-# --- Models ---
-class PredictionField(BaseModel):
-    label: str
-    ocr_text: Optional[str] = None
-    type: Optional[str] = None
-    score: Optional[float] = None
-    cells: Optional[List[Dict[str, Any]]] = None
-
-class DocumentPayload(BaseModel):
-    input: str
-    prediction: List[PredictionField]
+        return {"status": "unhealthy", "database": "disconnected", "error": str(e), "pool": pool_stats,
+                "spool": spool_stats}
 
 # --- Helpers ---
-def get_data_source_id_from_model_id(model_id: str) -> Optional[str]:
-    cur.execute("SELECT id FROM data_sources WHERE config->>'nanonets_model_id' = %s", (model_id,))
-    row = cur.fetchone()
+async def get_data_source_id_from_model_id(conn: psycopg.AsyncConnection, model_id: str) -> Optional[str]:
+    cur = await conn.execute("SELECT id FROM data_sources WHERE config->>'nanonets_model_id' = %s", (model_id,))
+    row = await cur.fetchone()
     return row[0] if row else None
 
-def simplify_prediction(predictions: List[PredictionField]) -> List[dict]:
-    simplified = []
-    seen_labels = set()
-    table_rows = []
-    table_columns = set()
-
-    for field in predictions:
-        label = field.label.strip().lower()
-
-        # TABLE HANDLING
-        if field.type == "table" and field.cells:
-            row_map = {}
-            for cell in field.cells:
-                row = cell.get("row")
-                col_label = cell.get("label", "").strip().lower()
-                text = cell.get("text", "")
-                if row is not None and col_label:
-                    row_map.setdefault(row, {})[col_label] = text
-                    table_columns.add(col_label)
-            for row_idx in sorted(row_map.keys()):
-                table_rows.append([
-                    row_map[row_idx].get(col, "") for col in sorted(table_columns)
-                ])
-
-        # FLAT FIELD HANDLING (de-duplication)
-        elif label not in seen_labels:
-            simplified.append({
-                "label": label,
-                "ocr_text": field.ocr_text or ""
-            })
-            seen_labels.add(label)
-
-    # Add final table if rows were collected
-    if table_rows:
-        simplified.append({
-            "label": "table",
-            "type": "table",
-            "columns": sorted(table_columns),
-            "rows": table_rows
-        })
-
-    print("📦 Simplified payload size:", len(json.dumps(simplified)), "bytes")
-    return simplified
+async def resolve_data_source(conn: psycopg.AsyncConnection) -> Optional[str]:
+    """The data_source of MODEL_ID; looked up again on each call until it is found."""
+    global data_source_id
+    if data_source_id is None:
+        data_source_id = await get_data_source_id_from_model_id(conn, MODEL_ID)
+    return data_source_id
 
 # --- Webhook Endpoint ---
 @app.post("/webhook")
@@ -120,33 +130,37 @@ async def nanonets_webhook(request: Request):
             print("❌ Payload parsing error:", str(e))
             raise HTTPException(status_code=400, detail=f"Malformed Nanonets webhook: {e}")
 
-        data_source_id = get_data_source_id_from_model_id(MODEL_ID)
+        if data_source_id is None:
+            async with pool.connection() as conn:
+                await resolve_data_source(conn)
         if not data_source_id:
             raise HTTPException(status_code=400, detail="Could not find data_source for this model")
 
-        cleaned_data = simplify_prediction(payload.prediction)
-
-        cur.execute("""
-            INSERT INTO extracted_data (
-                id, external_id, data, status,
-                organization_id, business_unit_id, data_source_id,
-                created_at, updated_at
-            ) VALUES (%s, %s, %s, %s, %s, NULL, %s, %s, %s)
-        """, (
-            str(uuid4()),
-            payload.input,
-            json.dumps(cleaned_data),
-            "pending",
-            DEFAULT_ORG_ID,
-            data_source_id,
-            datetime.utcnow(),
-            datetime.utcnow()
-        ))
-        conn.commit()
-
-        print(f"✅ Document {payload.input} stored in extracted_data.")
+        # Serialized once: the same JSON text is logged, spooled and inserted
+        cleaned_data = json.dumps(simplify_prediction(payload.prediction))
+        print("📦 Simplified payload size:", len(cleaned_data), "bytes")
+
+        if spool is None:
+            # No durable spool configured: insert and commit before acknowledging
+            async with pool.connection() as conn:
+                await insert_documents(
+                    conn, [(str(uuid4()), payload.input, cleaned_data, datetime.now(timezone.utc))],
+                    DEFAULT_ORG_ID, data_source_id,
+                )
+            print(f"✅ Document {payload.input} stored in extracted_data.")
+            return {"success": True, "message": f"✅ Document {payload.input} saved."}
+
+        # Acknowledge once the document is durable in the local spool; the flusher inserts it
+        # into extracted_data with the next batch
+        await asyncio.to_thread(spool.append, payload.input, cleaned_data)
+        flusher.notify()
+
+        print(f"📥 Document {payload.input} queued for extracted_data.")
         return {"success": True, "message": f"✅ Document {payload.input} saved."}
 
+    except HTTPException:
+        raise
+
     except Exception as e:
         print("🔥 Unexpected webhook error:", str(e))
         traceback.print_exc()  # <-- This prints the full traceback to the console/logs
@@ -159,8 +173,3 @@ async def nanonets_webhook(request: Request):
             print("⚠️ Could not log request body:", log_exc)
 
         raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
-
-    except psycopg2.Error as db_err:
-        print("🔥 Database error:", db_err)
-        traceback.print_exc()
-        raise HTTPException(status_code=500, detail=f"Database error: {db_err.pgerror}")
@@ -0,0 +1,61 @@
+-- Trigram index for the nearest-name step of category resolution
+-- Used by find_nearest_mapping_by_name() in etl/transform_pipeline/mappings/category_resolver.py
+-- (step 6 of resolve_product_category, run by transform_and_insert.py for every unmatched invoice line)
+-- Safe to run multiple times in any environment
+
+-- 1) Extensions
+-- pg_trgm provides the %, <-> operators and gist_trgm_ops
+-- btree_gist lets organization_id (uuid) live in the same GiST index
+create extension if not exists pg_trgm;
+create extension if not exists btree_gist;
+
+-- 2) WHERE organization_id = $1 AND is_active AND lower(variant_product_name) % $2
+--    ORDER BY lower(variant_product_name) <-> $2 LIMIT 1
+-- The expression must be exactly lower(variant_product_name) to match the resolver's query
+create index concurrently if not exists idx_product_category_mappings_name_trgm
+  on public.product_category_mappings using gist (organization_id, lower(variant_product_name) gist_trgm_ops)
+  where is_active = true;
+
+-- 3) Refresh planner statistics for the new expression
+analyze public.product_category_mappings;
+
+-- 4) Plan verification
+-- Run in psql after creating the index. Replace the org id and name with real values.
+--
+-- explain (analyze, buffers, costs off)
+-- select pcm.category_id, pcm.mapping_id, pc.category_name,
+--        1 - (lower(pcm.variant_product_name) <-> lower('Appelsn laks 10kg #30080')) as similarity
+-- from product_category_mappings pcm
+-- join product_categories pc on pcm.category_id = pc.category_id
+-- where pcm.organization_id = '00000000-0000-0000-0000-000000000001'
+--   and pcm.is_active = true
+--   and lower(pcm.variant_product_name) % lower('Appelsn laks 10kg #30080')
+-- order by lower(pcm.variant_product_name) <-> lower('Appelsn laks 10kg #30080')
+-- limit 1;
+--
+-- Output on PostgreSQL 18 with 50,000 mappings (10,000 for this organization):
+--                                                                                   QUERY PLAN
+--   ---------------------------------------------------------------------------------------------------------------------------------------------------------------------------
+--    Limit (actual time=6.180..6.182 rows=1.00 loops=1)
+--      Buffers: shared hit=361
+--      ->  Nested Loop (actual time=6.178..6.180 rows=1.00 loops=1)
+--            Join Filter: (pc.category_id = pcm.category_id)
+--            Buffers: shared hit=361
+--            ->  Index Scan using idx_product_category_mappings_name_trgm on product_category_mappings pcm (actual time=6.117..6.117 rows=1.00 loops=1)
+--                  Index Cond: ((organization_id = '00000000-0000-0000-0000-000000000001'::uuid) AND (lower((variant_product_name)::text) % 'appelsn laks 10kg #30080'::text))
+--                  Order By: (lower((variant_product_name)::text) <-> 'appelsn laks 10kg #30080'::text)
+--                  Index Searches: 1
+--                  Buffers: shared hit=360
+--            ->  Materialize (actual time=0.029..0.030 rows=1.00 loops=1)
+--                  Storage: Memory  Maximum Storage: 17kB
+--                  Buffers: shared hit=1
+--                  ->  Seq Scan on product_categories pc (actual time=0.013..0.013 rows=1.00 loops=1)
+--                        Buffers: shared hit=1
+--    Planning:
+--      Buffers: shared hit=285
+--    Planning Time: 1.185 ms
+--    Execution Time: 6.251 ms
+--
+-- Without the index the same query took 103.7 ms (Bitmap Index Scan on the unique key,
+-- then trigram distance over all 10,001 mappings of the org). A "Seq Scan" or "Bitmap Heap
+-- Scan" on product_category_mappings means the index is not used.
@@ -0,0 +1,16 @@
+-- Keyset index for the chunked category backfill
+-- etl/transform_pipeline/backfill_categories.py walks an organization's uncategorized
+-- invoice_lines ordered by id, a few thousand rows per transaction. This partial index
+-- serves each chunk as a short range scan and stays small as lines get categorized.
+-- Run outside a transaction block (CONCURRENTLY). Safe to run multiple times.
+
+create index concurrently if not exists idx_invoice_lines_org_uncategorized_id
+  on public.invoice_lines (organization_id, id)
+  where category_id is null;
+
+analyze public.invoice_lines;
+
+-- Verify a chunk query uses it (expect an Index Scan on idx_invoice_lines_org_uncategorized_id):
+-- explain select id from public.invoice_lines
+--   where organization_id = '<org_id>' and category_id is null and id > '<last_id>'
+--   order by id limit 2000;
@@ -0,0 +1,9 @@
+-- Watermark index for the incremental Parquet export
+-- etl/transform_pipeline/export_invoice_lines_parquet.py finds the months of an organization
+-- with lines changed after its last (updated_at, id) watermark, and the newest watermark.
+-- Run outside a transaction block (CONCURRENTLY). Safe to run multiple times.
+
+create index concurrently if not exists idx_invoice_lines_org_updated_at_id
+  on public.invoice_lines (organization_id, updated_at, id);
+
+analyze public.invoice_lines;
@@ -0,0 +1,80 @@
+-- Conflict targets for the set-based mapping CSV importer
+-- (etl/transform_pipeline/mapping_importer.py), which writes all rows of a file with one
+-- INSERT ... ON CONFLICT on the mapping's variant key.
+-- Existing duplicate variants are collapsed first. Per variant the mapping that another table
+-- references through a foreign key is kept, otherwise the oldest one (the one the ETL
+-- resolvers already pick). Every removed row is copied to public.mapping_duplicates_archive
+-- and the counts are reported with RAISE NOTICE.
+-- Requires PostgreSQL 15+ (NULLS NOT DISTINCT). Safe to run multiple times.
+
+-- 1) Archive for the collapsed rows
+create table if not exists public.mapping_duplicates_archive (
+  source_table text not null,
+  mapping_id uuid not null,
+  kept_mapping_id uuid not null,
+  row_data jsonb not null,
+  archived_at timestamptz not null default now()
+);
+
+-- 2) Collapse duplicates, archiving the losers
+create or replace function pg_temp.collapse_mapping_duplicates(tbl regclass, id_col text, variant_cols text[])
+returns void language plpgsql as $$
+declare
+  referenced text := 'false';
+  fk record;
+  removed bigint;
+begin
+  -- Rows referenced by a single-column foreign key rank first
+  for fk in
+    select c.conrelid::regclass as ref_table, a.attname as ref_col, t.attname as target_col
+    from pg_constraint c
+    join pg_attribute a on a.attrelid = c.conrelid and a.attnum = c.conkey[1]
+    join pg_attribute t on t.attrelid = c.confrelid and t.attnum = c.confkey[1]
+    where c.contype = 'f' and c.confrelid = tbl and cardinality(c.conkey) = 1
+  loop
+    referenced := referenced || format(' or exists (select 1 from %s r where r.%I = m.%I)',
+                                       fk.ref_table, fk.ref_col, fk.target_col);
+  end loop;
+
+  execute format($q$
+    with ranked as (
+      select m.ctid as row_ctid,
+             first_value(m.%1$I) over w as kept_id,
+             row_number() over w as rn
+      from %2$s m
+      window w as (partition by %3$s order by (%4$s) desc, m.created_at, m.%1$I)
+    ),
+    archived as (
+      insert into public.mapping_duplicates_archive (source_table, mapping_id, kept_mapping_id, row_data)
+      select %5$L, m.%1$I, r.kept_id, to_jsonb(m)
+      from %2$s m
+      join ranked r on r.row_ctid = m.ctid
+      where r.rn > 1
+    )
+    delete from %2$s m
+    using ranked r
+    where m.ctid = r.row_ctid and r.rn > 1
+  $q$, id_col, tbl, (select string_agg(format('m.%I', col), ', ') from unnest(variant_cols) col),
+       referenced, tbl::text);
+  get diagnostics removed = row_count;
+
+  raise notice '%: % duplicate variant row(s) moved to mapping_duplicates_archive', tbl, removed;
+end;
+$$;
+
+select pg_temp.collapse_mapping_duplicates('public.supplier_mappings', 'mapping_id',
+                                           array['organization_id', 'variant_name', 'variant_address']);
+select pg_temp.collapse_mapping_duplicates('public.location_mappings', 'mapping_id',
+                                           array['organization_id', 'variant_receiver_name', 'variant_address']);
+select pg_temp.collapse_mapping_duplicates('public.product_mappings', 'id',
+                                           array['organization_id', 'variant_product_name', 'variant_product_code', 'variant_supplier_name']);
+
+-- 3) Unique variant keys (NULL address/code/supplier counts as one variant)
+create unique index if not exists ux_supplier_mappings_variant
+  on public.supplier_mappings (organization_id, variant_name, variant_address) nulls not distinct;
+
+create unique index if not exists ux_location_mappings_variant
+  on public.location_mappings (organization_id, variant_receiver_name, variant_address) nulls not distinct;
+
+create unique index if not exists ux_product_mappings_variant
+  on public.product_mappings (organization_id, variant_product_name, variant_product_code, variant_supplier_name) nulls not distinct;
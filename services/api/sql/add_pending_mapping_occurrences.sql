@@ -0,0 +1,90 @@
+-- Occurrence counts and first/last-seen timestamps for pending mappings
+-- The ETL buffers unresolved variants per run and upserts them once per table
+-- (PendingMappingBuffer in etl/transform_pipeline/mappings/pending_buffer.py),
+-- adding the run's occurrences to the existing row. The review UI sorts by occurrences.
+-- Requires PostgreSQL 15+ (NULLS NOT DISTINCT). Safe to run multiple times.
+
+-- 1) Columns
+alter table public.pending_supplier_mappings
+  add column if not exists occurrences integer not null default 1,
+  add column if not exists first_seen_at timestamptz default now(),
+  add column if not exists last_seen_at timestamptz default now();
+
+alter table public.pending_location_mappings
+  add column if not exists occurrences integer not null default 1,
+  add column if not exists first_seen_at timestamptz default now(),
+  add column if not exists last_seen_at timestamptz default now();
+
+alter table public.pending_category_mappings
+  add column if not exists occurrences integer not null default 1,
+  add column if not exists first_seen_at timestamptz default now(),
+  add column if not exists last_seen_at timestamptz default now();
+
+update public.pending_supplier_mappings set first_seen_at = created_at, last_seen_at = created_at where first_seen_at is null or first_seen_at > created_at;
+update public.pending_location_mappings set first_seen_at = created_at, last_seen_at = created_at where first_seen_at is null or first_seen_at > created_at;
+update public.pending_category_mappings set first_seen_at = created_at, last_seen_at = created_at where first_seen_at is null or first_seen_at > created_at;
+
+-- 2) Collapse existing duplicates so the unique indexes below can be built.
+-- Keeps the reviewed row if there is one (approved/rejected before pending), otherwise the oldest,
+-- and folds the duplicates' count into it.
+with ranked as (
+  select id,
+         row_number() over w as rn,
+         count(*) over (partition by organization_id, variant_supplier_name, variant_address) as dup_count
+  from public.pending_supplier_mappings
+  window w as (partition by organization_id, variant_supplier_name, variant_address
+               order by (status = 'pending'), created_at, id)
+), kept as (
+  update public.pending_supplier_mappings p set occurrences = r.dup_count
+  from ranked r where p.id = r.id and r.rn = 1 and r.dup_count > 1
+  returning p.id
+)
+delete from public.pending_supplier_mappings p using ranked r where p.id = r.id and r.rn > 1;
+
+with ranked as (
+  select id,
+         row_number() over w as rn,
+         count(*) over (partition by organization_id, variant_receiver_name, variant_address) as dup_count
+  from public.pending_location_mappings
+  window w as (partition by organization_id, variant_receiver_name, variant_address
+               order by (status = 'pending'), created_at, id)
+), kept as (
+  update public.pending_location_mappings p set occurrences = r.dup_count
+  from ranked r where p.id = r.id and r.rn = 1 and r.dup_count > 1
+  returning p.id
+)
+delete from public.pending_location_mappings p using ranked r where p.id = r.id and r.rn > 1;
+
+with ranked as (
+  select id,
+         row_number() over w as rn,
+         count(*) over (partition by organization_id, variant_product_name, variant_product_code, variant_supplier_name) as dup_count
+  from public.pending_category_mappings
+  window w as (partition by organization_id, variant_product_name, variant_product_code, variant_supplier_name
+               order by (status = 'pending'), created_at, id)
+), kept as (
+  update public.pending_category_mappings p set occurrences = r.dup_count
+  from ranked r where p.id = r.id and r.rn = 1 and r.dup_count > 1
+  returning p.id
+)
+delete from public.pending_category_mappings p using ranked r where p.id = r.id and r.rn > 1;
+
+-- 3) Conflict targets for the ETL upserts (NULL address/code/supplier counts as one variant)
+create unique index if not exists ux_pending_supplier_mappings_variant
+  on public.pending_supplier_mappings (organization_id, variant_supplier_name, variant_address) nulls not distinct;
+
+create unique index if not exists ux_pending_location_mappings_variant
+  on public.pending_location_mappings (organization_id, variant_receiver_name, variant_address) nulls not distinct;
+
+create unique index if not exists ux_pending_category_mappings_variant
+  on public.pending_category_mappings (organization_id, variant_product_name, variant_product_code, variant_supplier_name) nulls not distinct;
+
+-- 4) Review lists sorted by impact
+create index if not exists idx_pending_supplier_mappings_org_status_occurrences
+  on public.pending_supplier_mappings (organization_id, status, occurrences desc);
+
+create index if not exists idx_pending_location_mappings_org_status_occurrences
+  on public.pending_location_mappings (organization_id, status, occurrences desc);
+
+create index if not exists idx_pending_category_mappings_org_status_occurrences
+  on public.pending_category_mappings (organization_id, status, occurrences desc);
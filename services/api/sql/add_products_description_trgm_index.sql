@@ -0,0 +1,69 @@
+-- Trigram indexes for nearest-neighbour product description matching
+-- Used by ProductMatcherOptimized(fuzzy_mode="knn") in etl/transform_pipeline/mappings/product_matcher.py
+-- Only needed where that matcher is used; transform_and_insert.py does not use it
+-- Safe to run multiple times in any environment
+
+-- 1) Extensions
+-- pg_trgm provides the %, <-> operators and gist_trgm_ops
+-- btree_gist lets organization_id / supplier_id (uuid) live in the same GiST index
+create extension if not exists pg_trgm;
+create extension if not exists btree_gist;
+
+-- 2) Org-wide lookup: WHERE organization_id = $1 AND active AND lower(description) % $2
+--    ORDER BY lower(description) <-> $2 LIMIT 1
+-- The expression must be exactly lower(description) to match the matcher's queries
+create index concurrently if not exists idx_products_org_description_trgm
+  on public.products using gist (organization_id, lower(description) gist_trgm_ops)
+  where active = true;
+
+-- 3) Same-supplier lookup (first pass of the matcher)
+create index concurrently if not exists idx_products_org_supplier_description_trgm
+  on public.products using gist (organization_id, supplier_id, lower(description) gist_trgm_ops)
+  where active = true;
+
+analyze public.products;
+
+-- 4) Plan verification
+-- Run in psql after creating the indexes. Replace the org/supplier ids with real values.
+--
+-- begin;
+-- select set_config('pg_trgm.similarity_threshold', '0.82', true);
+-- explain (analyze, buffers, costs off)
+-- with inputs(idx, search_name) as (values (0, 'appelsin laks 0kg #42680'), (1, 'appelsn laks 10kg #30080'))
+-- select i.idx, nn.product_id, nn.sim
+-- from inputs i
+-- cross join lateral (
+--   select p.product_id, similarity(lower(p.description), i.search_name) as sim
+--   from products p
+--   where p.organization_id = '00000000-0000-0000-0000-000000000001'
+--     and p.active = true
+--     and lower(p.description) % i.search_name
+--   order by lower(p.description) <-> i.search_name
+--   limit 1
+-- ) nn;
+-- rollback;
+--
+-- Output on PostgreSQL 18 with 50,000 products (10,000 for this organization), with the
+-- inputs ('appelsin laks 0kg #42680') and ('appelsn laks 10kg #30080'), one index probe per input row:
+--                                                                    QUERY PLAN
+--   --------------------------------------------------------------------------------------------------------------------------------------------
+--    Nested Loop (actual time=1.562..7.362 rows=1.00 loops=1)
+--      Buffers: shared hit=498
+--      ->  Values Scan on "*VALUES*" (actual time=0.002..0.005 rows=2.00 loops=1)
+--      ->  Limit (actual time=3.674..3.674 rows=0.50 loops=2)
+--            Buffers: shared hit=498
+--            ->  Index Scan using idx_products_org_supplier_description_trgm on products p (actual time=3.669..3.669 rows=0.50 loops=2)
+--                  Index Cond: ((organization_id = '00000000-0000-0000-0000-000000000001'::uuid) AND (lower(description) % "*VALUES*".column2))
+--                  Order By: (lower(description) <-> "*VALUES*".column2)
+--                  Index Searches: 2
+--                  Buffers: shared hit=498
+--    Planning:
+--      Buffers: shared hit=227
+--    Planning Time: 1.069 ms
+--    Execution Time: 7.457 ms
+--
+-- The planner may pick either trigram index for the org-wide pass, since both lead with organization_id.
+-- For the same-supplier pass add "and p.supplier_id = '...'::uuid" and expect
+-- idx_products_org_supplier_description_trgm with supplier_id in the Index Cond.
+-- A "Seq Scan on products" or "Filter: (similarity(...) >= ...)" means the query
+-- is not using the operators above and will degrade to inputs x catalogue size.
@@ -0,0 +1,11 @@
+-- CVR/VAT number per supplier mapping, used by the ETL exact-id fast path
+-- (SupplierIndex in etl/transform_pipeline/mappings/supplier_matcher.py)
+-- Values are stored normalized to digits only: 'DK 10665841' -> '10665841'
+-- Safe to run multiple times in any environment
+
+alter table public.supplier_mappings
+  add column if not exists tax_id text;
+
+create index concurrently if not exists idx_supplier_mappings_org_tax_id
+  on public.supplier_mappings (organization_id, tax_id)
+  where tax_id is not null;